@@ -3,6 +3,14 @@ from abc import abstractmethod as _abstract, ABCMeta as _ABCMeta
 from pyphysio.Signal import Signal, EvenlySignal
 from pyphysio.Utility import PhUI as _PhUI
 import numpy as _np
+import hashlib as _hashlib
+import sys as _sys
+import threading as _threading
+import os as _os
+import json as _json
+import tempfile as _tempfile
+from collections import OrderedDict as _OrderedDict
+import pyphysio.Signal as _signals
 __author__ = 'AleB'
 
 
@@ -14,6 +22,14 @@ class Algorithm(object):
 
     _log = None
 
+    # Whether the algorithm processes all the channels of a multichannel signal (N_SAMPLES x N_CH) at once,
+    # operating along axis 0. If False run() calls the algorithm once per channel.
+    _channel_vectorized = False
+
+    # Number of threads used by run() to process the channels of a multichannel signal, for algorithms that are not
+    # channel-vectorized
+    _n_threads = 1
+
     def __init__(self, **kwargs):
         """
         Incorporates the parameters and saves them in the instance.
@@ -36,6 +52,26 @@ class Algorithm(object):
         """
         return self.run(data, self._params)
 
+    def get_intermediates(self):
+        """
+        Placeholder for the subclasses: returns the (parametrized) algorithms whose results are used by this algorithm
+        and can be shared with other algorithms computed on the same data (see run_shared and fmap).
+        @return: List of Algorithm instances
+        """
+        return []
+
+    def run_shared(self, data):
+        """
+        Executes the algorithm like __call__ but, if the cache is enabled on the data (see Cache.cache_check, e.g. on
+        the segments of a fmap), gets the result from the cache (or computes and caches it).
+        @param data: The data.
+        @type data: TimeSeries
+        @return: The result.
+        """
+        if hasattr(data, "_cache_key") and not data.is_multi():
+            return self.run(data, self._params, use_cache=True)
+        return self.run(data, self._params)
+
     def __repr__(self):
         return self.__class__.__name__ + str(self._params) if 'name' not in self._params else self._params['name']
 
@@ -79,15 +115,21 @@ class Algorithm(object):
             # noinspection PyTypeChecker
             return Cache.run_cached(data, cls, kwargs)
         else:            
-            if not data.is_multi():
+            if not data.is_multi() or cls._channel_vectorized:
                 return cls.algorithm(data, kwargs)
             else:
                 data_values = data.get_values()
-                values_out = []
-                for i_ch in range(data.get_nchannels()):
+
+                def run_channel(i_ch):
                     channel_ph = EvenlySignal(data_values[:,i_ch], data.get_sampling_freq(), data.get_start_time())
-                    output_ph = cls.algorithm(channel_ph, kwargs)
-                    values_out.append(output_ph)
+                    return cls.algorithm(channel_ph, kwargs)
+
+                if cls._n_threads > 1:
+                    from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+                    with _ThreadPoolExecutor(max_workers=cls._n_threads) as executor:
+                        values_out = list(executor.map(run_channel, range(data.get_nchannels())))
+                else:
+                    values_out = [run_channel(i_ch) for i_ch in range(data.get_nchannels())]
         
                 # if output are signals, compose a multimodal instance
                 if isinstance(values_out[0], EvenlySignal):
@@ -122,13 +164,25 @@ class Algorithm(object):
     def cache_key(cls, params):
         """
         This method computes an hash to use as a part of the key in the cache starting from the parameters used by the
-        feature.
+        feature. The hash depends on the content of the parameters (e.g. of the arrays), not on their order.
         @return: The hash of the parameters used by the feature.
         :param params:
         """
-        p = params.copy()
-        p.update({'': str(cls)})
-        return str(p).replace('\'', '')
+        h = _hashlib.sha1()
+        _hash_update(h, cls.__module__ + '.' + cls.__name__)
+        _hash_update(h, params)
+        return h.hexdigest()
+
+    @classmethod
+    def set_n_threads(cls, n_threads=1):
+        """
+        Sets the number of threads used to process the channels of multichannel signals (when the algorithm is not
+        channel-vectorized). Set on Algorithm to change the default of all the algorithms.
+        @param n_threads: Number of threads, 1 to process the channels serially
+        @type n_threads: int
+        """
+        assert n_threads >= 1, "The number of threads should be >= 1"
+        cls._n_threads = int(n_threads)
 
     @classmethod
     def log(cls, message):
@@ -167,32 +221,269 @@ class Algorithm(object):
         map(lambda f_m: f_m[0](f_m[1]), log)
 
 
+def _hash_update(h, value):
+    # stable content hashing: dicts by sorted keys, arrays by dtype, shape and data, algorithms by class and params
+    if isinstance(value, dict):
+        h.update(b'{')
+        for k in sorted(value, key=str):
+            _hash_update(h, k)
+            _hash_update(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'(' if isinstance(value, tuple) else b'[')
+        for v in value:
+            _hash_update(h, v)
+        h.update(b')')
+    elif isinstance(value, _np.ndarray):
+        h.update(('%s%s%s' % (value.__class__.__name__, value.dtype.str, value.shape)).encode())
+        if value.dtype.hasobject:
+            _hash_update(h, value.tolist())
+        else:
+            h.update(_np.ascontiguousarray(value).view(_np.uint8))
+        if isinstance(value, Signal):
+            _hash_update(h, value.ph)
+    elif isinstance(value, Algorithm):
+        h.update(value.cache_key(value.get()).encode())
+    else:
+        h.update(('%s:%r;' % (value.__class__.__name__, value)).encode())
+
+
+def _sizeof(value):
+    if isinstance(value, _np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return _sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    return _sys.getsizeof(value)
+
+
+def _encode(value, arrays):
+    # JSON description of the value, the arrays are added to the dict arrays
+    if isinstance(value, Signal):
+        return {'signal': value.__class__.__name__, 'values': _encode(value.get_values(), arrays),
+                'ph': _encode(value.ph, arrays)}
+    if isinstance(value, (_np.ndarray, _np.generic)):
+        if value.dtype.hasobject:
+            raise TypeError("Object arrays are not supported")
+        name = 'a%d' % len(arrays)
+        arrays[name] = _np.asarray(value)
+        return {'array': name, 'scalar': isinstance(value, _np.generic)}
+    if isinstance(value, (list, tuple)):
+        return {'list' if isinstance(value, list) else 'tuple': [_encode(v, arrays) for v in value]}
+    if isinstance(value, dict):
+        return {'dict': [[_encode(k, arrays), _encode(v, arrays)] for k, v in value.items()]}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {'value': value}
+    raise TypeError("Type %s is not supported" % value.__class__.__name__)
+
+
+def _decode(desc, arrays):
+    if 'signal' in desc:
+        signal = _decode(desc['values'], arrays).view(getattr(_signals, desc['signal']))
+        signal._pyphysio = _decode(desc['ph'], arrays)
+        return signal
+    if 'array' in desc:
+        value = arrays[desc['array']]
+        return value[()] if desc['scalar'] else value
+    if 'list' in desc:
+        return [_decode(v, arrays) for v in desc['list']]
+    if 'tuple' in desc:
+        return tuple(_decode(v, arrays) for v in desc['tuple'])
+    if 'dict' in desc:
+        return dict((_decode(k, arrays), _decode(v, arrays)) for k, v in desc['dict'])
+    return desc['value']
+
+
 # noinspection PyProtectedMember
 class Cache(object):
-    """ Class that gives cache support."""
+    """
+    Class that gives cache support.
+    The results are kept in a memory bounded LRU store shared by all the signals, with key the content of the signal
+    (values and metadata) and the parameters of the algorithm.
+    Note: changes of the values of a signal in place are not detected, call cache_clear after them.
+    """
+
+    # Maximum size in bytes of the cached results (see set_max_size)
+    _max_size = 256 * 2 ** 20
+
+    _store = _OrderedDict()
+    _size = 0
+    _hits = 0
+    _misses = 0
+    _lock = _threading.RLock()
+
+    # Optional persistent store (see set_disk_cache)
+    _disk_folder = None
+    _disk_max_size = 2 * 2 ** 30
+    _disk_size = 0
+    _disk_hits = 0
+    # Version of the format of the files, in their key with the version of the library
+    _DISK_FORMAT = 1
 
     def __init__(self):
         pass
 
+    @staticmethod
+    def signal_key(obj):
+        """
+        Computes the hash of the content of the signal: values and metadata.
+        :param obj: The signal
+        :return: The hash (hex string)
+        """
+        h = _hashlib.sha1()
+        _hash_update(h, obj)
+        return h.hexdigest()
+
+    @staticmethod
+    def set_max_size(max_size):
+        """
+        Sets the memory budget of the cache, evicting the least recently used results if needed.
+        :param max_size: Maximum size in bytes of the cached results
+        """
+        assert max_size >= 0, "The maximum size of the cache should be >= 0"
+        with Cache._lock:
+            Cache._max_size = max_size
+            Cache._evict()
+
+    @staticmethod
+    def set_disk_cache(folder=None, max_size=2 * 2 ** 30):
+        """
+        Enables the persistent cache: the results are also saved (as .npz files) in the folder, so that they are
+        available to the next sessions. The least recently used files are removed to keep the folder within max_size.
+        Only results composed of signals, arrays, numbers, strings, lists, tuples and dicts are saved.
+        :param folder: The folder of the persistent cache, None to disable it
+        :param max_size: Maximum size in bytes of the files in the folder
+        """
+        assert max_size >= 0, "The maximum size of the disk cache should be >= 0"
+        if folder is not None and not _os.path.isdir(folder):
+            _os.makedirs(folder)
+        with Cache._lock:
+            Cache._disk_folder = folder
+            Cache._disk_max_size = max_size
+            if folder is not None:
+                Cache._disk_size = Cache._disk_evict(folder, max_size)
+
+    @staticmethod
+    def get_stats():
+        """
+        Returns the statistics of the cache.
+        :return: dict with hits, disk_hits, misses, n_entries, size and max_size (bytes)
+        """
+        with Cache._lock:
+            return {'hits': Cache._hits, 'disk_hits': Cache._disk_hits, 'misses': Cache._misses,
+                    'n_entries': len(Cache._store), 'size': Cache._size, 'max_size': Cache._max_size}
+
+    @staticmethod
+    def reset():
+        """
+        Removes all the cached results and resets the statistics.
+        """
+        with Cache._lock:
+            Cache._store.clear()
+            Cache._size = 0
+            Cache._hits = 0
+            Cache._disk_hits = 0
+            Cache._misses = 0
+
+    @staticmethod
+    def _evict():
+        while Cache._size > Cache._max_size and len(Cache._store) > 0:
+            key, (val, log, size) = Cache._store.popitem(last=False)
+            Cache._size -= size
+
+    @staticmethod
+    def _disk_path(folder, key):
+        # the results of other versions of the library (or of the format) are not used
+        from . import __version__
+        salt = '%s.%d' % (__version__, Cache._DISK_FORMAT)
+        return _os.path.join(folder, _hashlib.sha1(('%s.%s.%s' % ((salt,) + tuple(key))).encode()).hexdigest() + '.npz')
+
+    @staticmethod
+    def _disk_load(folder, key):
+        path = Cache._disk_path(folder, key)
+        try:
+            with _np.load(path, allow_pickle=False) as npz:
+                arrays = dict((k, npz[k]) for k in npz.files)
+            _os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        header = _json.loads(str(arrays.pop('__header__')))
+        log = [(getattr(_PhUI, f), message) for f, message in header['log']]
+        return _decode(header['value'], arrays), log
+
+    @staticmethod
+    def _disk_save(folder, key, val, log):
+        arrays = {}
+        try:
+            header = {'value': _encode(val, arrays), 'log': [(f.__name__, message) for f, message in log]}
+        except TypeError:
+            return
+        arrays['__header__'] = _np.array(_json.dumps(header))
+        # write and rename, concurrent readers never see partial files
+        path = Cache._disk_path(folder, key)
+        fd, path_tmp = _tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with _os.fdopen(fd, 'wb') as f:
+                _np.savez(f, **arrays)
+            size = _os.path.getsize(path_tmp)
+            size_old = _os.path.getsize(path) if _os.path.exists(path) else 0
+            _os.replace(path_tmp, path)
+        except (IOError, OSError):
+            if _os.path.exists(path_tmp):
+                _os.remove(path_tmp)
+            return
+        # the size of the folder is tracked, it is scanned only when over the budget
+        with Cache._lock:
+            Cache._disk_size += size - size_old
+            if Cache._disk_size > Cache._disk_max_size:
+                Cache._disk_size = Cache._disk_evict(folder, Cache._disk_max_size)
+
+    @staticmethod
+    def _disk_evict(folder, max_size):
+        # removes the least recently used files to keep the folder within max_size, returns the size of the folder
+        files = []
+        for name in _os.listdir(folder):
+            if name.endswith('.npz'):
+                path = _os.path.join(folder, name)
+                try:
+                    st = _os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        size = sum(f[1] for f in files)
+        for mtime, file_size, path in sorted(files):
+            if size <= max_size:
+                break
+            try:
+                _os.remove(path)
+            except OSError:
+                pass
+            size -= file_size
+        return size
+
     # Field-checked methods
 
     @staticmethod
     def cache_clear(obj):
         """
-        Clears the cache and frees memory (GC?)
+        Removes the cached results of the signal and updates its key
         :param obj:
         """
-        obj._cache = {}
+        key = Cache.signal_key(obj)
+        with Cache._lock:
+            for k in [k for k in Cache._store if k[0] == key]:
+                Cache._size -= Cache._store.pop(k)[2]
+        obj._cache_key = key
         obj._mutated = False
 
     @staticmethod
     def cache_check(obj):
         """
-        Checks the presence of the cache structure.
+        Checks the presence of the key of the signal, (re)computing it if missing or if the signal was mutated.
         :param obj:
         """
-        if not hasattr(obj, "_cache") or hasattr(obj, "_mutated") and obj._mutated:
-            Cache.cache_clear(obj)
+        if not hasattr(obj, "_cache_key") or hasattr(obj, "_mutated") and obj._mutated:
+            obj._cache_key = Cache.signal_key(obj)
+            obj._mutated = False
 
     # Field-unchecked methods
 
@@ -204,27 +495,55 @@ class Cache(object):
         :param obj:
         :param params:
         """
-        key = algorithm.cache_key(params)
-        if key in obj._cache:
-            del obj._cache[key]
+        key = (obj._cache_key, algorithm.cache_key(params))
+        with Cache._lock:
+            if key in Cache._store:
+                Cache._size -= Cache._store.pop(key)[2]
 
     @staticmethod
     def run_cached(obj, algorithm, params):
         """
-        Gets data from the cache if valid
+        Gets data from the cache if valid, otherwise computes and caches it
         :param params:
         :param obj:
         :type algorithm: Algorithm
-        :return: The data or None
+        :return: The data
         """
-        key = algorithm.cache_key(params)
+        key = (obj._cache_key, algorithm.cache_key(params))
 
-        if key not in obj._cache:
+        with Cache._lock:
+            entry = Cache._store.get(key)
+            if entry is not None:
+                Cache._store.move_to_end(key)
+                Cache._hits += 1
+
+        if entry is not None:
+            val, log, size = entry
+            algorithm.emulate_log(log)
+            return val
+
+        disk_folder = Cache._disk_folder
+        loaded = Cache._disk_load(disk_folder, key) if disk_folder is not None else None
+        if loaded is not None:
+            val, log = loaded
+            algorithm.emulate_log(log)
+        else:
             algorithm.set_logger()
             val = algorithm.algorithm(obj, params)
             log = algorithm.unset_logger()
-            obj._cache[key] = (val, log)
-        else:
-            val, log = obj._cache[key]
-            algorithm.emulate_log(log)
+            if disk_folder is not None:
+                Cache._disk_save(disk_folder, key, val, log)
+
+        size = _sizeof(val)
+        with Cache._lock:
+            if loaded is not None:
+                Cache._disk_hits += 1
+            else:
+                Cache._misses += 1
+            if size <= Cache._max_size:
+                if key in Cache._store:
+                    Cache._size -= Cache._store.pop(key)[2]
+                Cache._store[key] = (val, log, size)
+                Cache._size += size
+                Cache._evict()
         return val
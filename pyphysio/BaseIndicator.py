@@ -1,6 +1,8 @@
 # coding=utf-8
 from pyphysio.BaseAlgorithm import Algorithm
-from abc import ABCMeta as _ABCMeta
+from abc import abstractmethod as _abstract, ABCMeta as _ABCMeta
+from collections import deque as _deque
+import numpy as _np
 __author__ = 'AleB'
 
 
@@ -9,4 +11,110 @@ class Indicator(Algorithm):
     Algorithms that take as input a signal and return a scalar value.
     """
     __metaclass__ = _ABCMeta
-    pass
+
+    def accumulator(self, signal=None):
+        """
+        Returns an Accumulator computing the indicator on a sliding window of samples, None if the indicator is not
+        available as an Accumulator.
+        :param signal: The signal of the samples, for the indicators depending on its properties (e.g. the sampling
+         frequency)
+        """
+        return None
+
+
+class Accumulator(object):
+    """
+    Running version of an Indicator on a sliding window of samples, for live monitoring and for overlapping segments.
+    Get one from Indicator.accumulator.
+
+    push appends a sample to the window, pop removes the oldest one and value returns the indicator computed on the
+    samples in the window. The subclasses keep their statistics updated in _add and _remove (called for each sample)
+    and in _add_pair and _remove_pair (called for each pair of consecutive samples), so that each operation is O(1).
+    """
+    __metaclass__ = _ABCMeta
+
+    def __init__(self):
+        self._window = _deque()
+        self._reset()
+
+    def reset(self):
+        """
+        Empties the window.
+        """
+        self._window.clear()
+        self._reset()
+
+    def push(self, x):
+        """
+        Appends a sample to the window.
+        """
+        x = float(x)
+        if len(self._window) > 0:
+            self._add_pair(self._window[-1], x)
+        self._window.append(x)
+        self._add(x)
+
+    def pop(self):
+        """
+        Removes the oldest sample from the window.
+        :return: The sample removed
+        """
+        x = self._window.popleft()
+        self._remove(x)
+        if len(self._window) > 0:
+            self._remove_pair(x, self._window[0])
+        return x
+
+    def __len__(self):
+        return len(self._window)
+
+    @_abstract
+    def value(self):
+        """
+        Placeholder for the subclasses
+        :returns: The value of the indicator on the samples in the window
+        @raise NotImplementedError: Ever
+        """
+        raise NotImplementedError()
+
+    def windows(self, values, starts, stops):
+        """
+        Computes the indicator on values[start:stop] for each pair of starts and stops. Moving from a window to the
+        next one only the samples entering and leaving the window are pushed and popped, so overlapping windows
+        (sorted by start) are not computed from scratch. The reducible indicators (e.g. Mean, Max) override it to
+        compute all the windows at once with cumulative sums or running extremes.
+        :param values: 1-D array
+        :return: Array with the value of each window
+        """
+        out = _np.empty(len(starts))
+        self.reset()
+        lo = hi = 0
+        for i, (start, stop) in enumerate(zip(starts, stops)):
+            stop = max(start, stop)
+            if start < lo or stop < hi or start >= hi:
+                # not overlapping the previous window
+                self.reset()
+                lo = hi = start
+            while hi < stop:
+                self.push(values[hi])
+                hi += 1
+            while lo < start:
+                self.pop()
+                lo += 1
+            out[i] = self.value()
+        return out
+
+    def _reset(self):
+        pass
+
+    def _add(self, x):
+        pass
+
+    def _remove(self, x):
+        pass
+
+    def _add_pair(self, x, y):
+        pass
+
+    def _remove_pair(self, x, y):
+        pass
@@ -40,6 +40,262 @@ def from_pickle(path):
     return from_pickleable(p)
 
 
+_MMAP_MAGIC = b'PYPHYSIO'
+_MMAP_ALIGN = 64
+
+
+def from_mmap(path, mode='r'):
+    """
+    Opens a Signal saved with Signal.to_mmap. The values (and the x_values) are memory-mapped, not read in memory.
+    :param path: File system path to the file.
+    :param mode: Mode of the numpy.memmap: 'r' (read-only), 'c' (copy-on-write) or 'r+' (read-write)
+    :return: A Signal.
+    """
+    from json import loads
+    with open(path, 'rb') as f:
+        assert f.read(len(_MMAP_MAGIC)) == _MMAP_MAGIC, "The file is not a pyphysio signal"
+        header_len = int(_np.frombuffer(f.read(4), dtype='<u4')[0])
+        header = loads(f.read(header_len).decode('utf-8'))
+
+    arrays = {}
+    for name, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if _np.prod(shape) == 0:
+            arrays[name] = _np.zeros(shape, dtype=info['dtype'])
+        else:
+            arrays[name] = _np.memmap(path, dtype=info['dtype'], mode=mode, offset=info['offset'], shape=shape)
+
+    cls = {c.__name__: c for c in [EvenlySignal, UnevenlySignal, MultiEvenly]}[header['class']]
+    obj = arrays.pop('values').view(cls)
+    obj._pyphysio = header['ph']
+    obj._pyphysio.update(arrays)
+    obj._mutated = False
+    return obj
+
+
+def _csv_first_data(f):
+    # Reads the first data line skipping the blank lines: returns the line and the number of blank lines
+    n_blank = 0
+    data = f.readline()
+    while data != '' and data.strip() == '':
+        n_blank += 1
+        data = f.readline()
+    return data, n_blank
+
+
+def _csv_open(path, delimiter, sampling_freq, start_time, skip_header, usecols):
+    # Opens the file and reads the header: returns the file, the layout of the columns and the first data line
+    f = open(path, 'r')
+    first = f.readline()
+    second = f.readline()
+    n_header = 2
+    if second.startswith('Fsamp:'):
+        # written by to_csv: signal type, sampling frequency, comment, column names
+        line = f.readline()
+        n_header += 1
+        while line != '' and not line.startswith('idx' + delimiter + 'time'):
+            line = f.readline()
+            n_header += 1
+        assert line != '', "Column names not found in the header"
+        names = line.strip().split(delimiter)
+        data, n_blank = _csv_first_data(f)
+        n_header += n_blank
+        n_cols = len(data.split(delimiter))
+        if any(name.startswith('ch') for name in names):
+            cls, x_col, time_col, value_cols = MultiEvenly, None, 1, list(range(2, n_cols))
+        elif n_cols == 2:
+            cls, x_col, time_col, value_cols = EvenlySignal, None, 0, [1]
+        else:
+            cls, x_col, time_col, value_cols = UnevenlySignal, 0, 1, [2]
+        if usecols is not None:
+            value_cols = [value_cols[i] for i in _np.atleast_1d(usecols)]
+            if cls != UnevenlySignal:
+                cls = EvenlySignal if len(value_cols) == 1 else MultiEvenly
+        signal_type = first.rstrip('\n').rstrip(' ')
+        fsamp = float(second.split(':')[1]) if sampling_freq is None else sampling_freq
+        if start_time is None and data.strip() != '':
+            values = data.split(delimiter)
+            start_time = float(values[time_col])
+            if x_col is not None:
+                start_time -= float(values[x_col]) / fsamp
+    else:
+        assert sampling_freq is not None, "The sampling frequency is needed for files not written by to_csv"
+        f.seek(0)
+        for i in range(skip_header):
+            f.readline()
+        data, n_blank = _csv_first_data(f)
+        n_header = skip_header + n_blank
+        n_cols = len(data.split(delimiter))
+        value_cols = list(range(n_cols)) if usecols is None else list(_np.atleast_1d(usecols))
+        cls = EvenlySignal if len(value_cols) == 1 else MultiEvenly
+        x_col = None
+        signal_type = ''
+        fsamp = sampling_freq
+
+    layout = {'cls': cls, 'x_col': x_col, 'value_cols': value_cols, 'n_header': n_header,
+              'sampling_freq': fsamp, 'start_time': start_time if start_time is not None else 0,
+              'signal_type': signal_type}
+    return f, layout, data
+
+
+def _csv_chunks(f, layout, first, chunk_size, delimiter, dtype):
+    # Yields (x_values, values) for each chunk of rows, x_values is None for evenly signals
+    from itertools import islice
+    try:
+        i_line = layout['n_header']
+        raw = [first] + list(islice(f, chunk_size - 1))
+        while len(raw) > 0:
+            # the blank lines are skipped
+            lines = [line for line in raw if line.strip() != '']
+            if len(lines) > 0:
+                try:
+                    values, x = _csv_parse(lines, layout, delimiter, dtype)
+                except ValueError:
+                    # find the line to report
+                    for i, line in enumerate(raw):
+                        try:
+                            if line.strip() != '':
+                                _csv_parse([line], layout, delimiter, dtype)
+                        except ValueError as e:
+                            raise ValueError("Line %d of the file: %s (%s)" % (i_line + i + 1, line.rstrip(), e))
+                    raise
+                yield x, values if layout['cls'] == MultiEvenly else values[:, 0]
+            i_line += len(raw)
+            raw = list(islice(f, chunk_size))
+    finally:
+        f.close()
+
+
+def _csv_parse(lines, layout, delimiter, dtype):
+    # values (and x_values, None for evenly signals) of the data lines
+    if layout['x_col'] is None:
+        return _np.loadtxt(lines, delimiter=delimiter, usecols=layout['value_cols'], dtype=dtype, ndmin=2), None
+    data = _np.loadtxt(lines, delimiter=delimiter, usecols=[layout['x_col']] + layout['value_cols'], ndmin=2)
+    return data[:, 1:].astype(dtype), data[:, 0].astype(int)
+
+
+def _csv_signal(layout, values, x=None, i_start=0):
+    fsamp = layout['sampling_freq']
+    if layout['cls'] == UnevenlySignal:
+        return UnevenlySignal(values, fsamp, layout['start_time'], layout['signal_type'], x_values=x,
+                              x_type='indices')
+    return layout['cls'](values, fsamp, layout['start_time'] + i_start / fsamp, layout['signal_type'])
+
+
+def iter_csv(path, chunk_size=100000, usecols=None, dtype=float, sampling_freq=None, start_time=None, skip_header=0,
+             delimiter=','):
+    """
+    Reads a delimited text file in chunks, yielding a Signal for each chunk of rows, with its start_time.
+    The files written by to_csv are recognized by their header (signal type, sampling frequency and columns) and give
+    EvenlySignal, UnevenlySignal or MultiEvenly chunks. The other files are read as columns of values sampled at
+    sampling_freq (MultiEvenly if more than one column is read).
+    :param path: File system path to the file.
+    :param chunk_size: Number of rows of each chunk
+    :param usecols: Columns of values (channels for the files written by to_csv) to read, None for all
+    :param dtype: Type of the values (e.g. numpy.float32)
+    :param sampling_freq: Sampling frequency, needed for the files not written by to_csv
+    :param start_time: Start time of the signal, by default the one in the file (or 0)
+    :param skip_header: Number of lines to skip at the beginning of the files not written by to_csv
+    :param delimiter: Delimiter of the columns
+    """
+    f, layout, first = _csv_open(path, delimiter, sampling_freq, start_time, skip_header, usecols)
+    i_start = 0
+    for x, values in _csv_chunks(f, layout, first, chunk_size, delimiter, dtype):
+        yield _csv_signal(layout, values, x, i_start)
+        i_start += len(values)
+
+
+def from_csv(path, mmap_path=None, chunk_size=100000, usecols=None, dtype=float, sampling_freq=None,
+             start_time=None, skip_header=0, delimiter=','):
+    """
+    Loads a Signal from a delimited text file, parsing it in chunks (see iter_csv for the parameters).
+    :param mmap_path: If given the Signal is written to this file (see Signal.to_mmap) while parsing and returned
+     memory-mapped, to load files larger than the memory.
+    :return: A Signal.
+    """
+    f, layout, first = _csv_open(path, delimiter, sampling_freq, start_time, skip_header, usecols)
+
+    # count the rows (not blank), to allocate the arrays
+    n_rows = 0
+    last_line = ''
+    with open(path, 'r') as fc:
+        for i, line in enumerate(fc):
+            if i >= layout['n_header'] and line.strip() != '':
+                n_rows += 1
+                last_line = line
+
+    is_multi = layout['cls'] == MultiEvenly
+    shape = (n_rows, len(layout['value_cols'])) if is_multi else (n_rows,)
+    if mmap_path is not None:
+        ph = {Signal._MT_SAMPLING_FREQ: layout['sampling_freq'], Signal._MT_START_TIME: layout['start_time'],
+              Signal._MT_NATURE: layout['signal_type']}
+        arrays = [('values', dtype, shape)]
+        if layout['cls'] == UnevenlySignal:
+            idx_last = int(float(last_line.split(delimiter)[layout['x_col']])) if n_rows > 0 else -1
+            ph[UnevenlySignal._MT_DURATION] = (idx_last + 1.) / layout['sampling_freq']
+            arrays.append((UnevenlySignal._MT_X_INDICES, int, (n_rows,)))
+        buffers = _mmap_create(mmap_path, layout['cls'].__name__, ph, arrays)
+        values = buffers.get('values', _np.zeros(shape, dtype=dtype))
+        x_values = buffers.get(UnevenlySignal._MT_X_INDICES, _np.zeros(n_rows, dtype=int))
+    else:
+        values = _np.empty(shape, dtype=dtype)
+        x_values = _np.empty(n_rows, dtype=int)
+
+    i_start = 0
+    for x, chunk in _csv_chunks(f, layout, first, chunk_size, delimiter, dtype):
+        if i_start + len(chunk) > n_rows:
+            raise ValueError("%s: more rows than the %d counted (file modified while reading?)" % (path, n_rows))
+        values[i_start:i_start + len(chunk)] = chunk
+        if x is not None:
+            x_values[i_start:i_start + len(chunk)] = x
+        i_start += len(chunk)
+    if i_start != n_rows:
+        raise ValueError("%s: %d rows read instead of %d (file modified while reading?)" % (path, i_start, n_rows))
+
+    if mmap_path is not None:
+        for buffer in buffers.values():
+            buffer.flush()
+        return from_mmap(mmap_path)
+    return _csv_signal(layout, values, x_values)
+
+
+def _mmap_create(path, class_name, ph, arrays):
+    """
+    Creates a file in the format of Signal.to_mmap, with the arrays not initialized.
+    :param arrays: List of (name, dtype, shape) of the arrays to store (the values and the arrays of the metadata)
+    :return: dict of the writable memory maps of the arrays
+    """
+    from json import dumps
+    ph = dict((k, v.item() if isinstance(v, _np.generic) else v) for k, v in ph.items())
+    info = {}
+    for name, dtype, shape in arrays:
+        dtype = _np.dtype(dtype)
+        assert not dtype.hasobject, "Cannot save arrays of objects"
+        info[name] = {'dtype': dtype.newbyteorder('<').str, 'shape': [int(x) for x in shape]}
+
+    def header_bytes():
+        return dumps({'class': class_name, 'ph': ph, 'arrays': info}).encode('utf-8')
+
+    # the offsets are in the header: compute them with a header long enough to contain them
+    for name in info:
+        info[name]['offset'] = 10 ** 15
+    offset = -(-(len(_MMAP_MAGIC) + 4 + len(header_bytes())) // _MMAP_ALIGN) * _MMAP_ALIGN
+    for name in info:
+        info[name]['offset'] = offset
+        n_bytes = int(_np.prod(info[name]['shape'])) * _np.dtype(info[name]['dtype']).itemsize
+        offset += -(-n_bytes // _MMAP_ALIGN) * _MMAP_ALIGN
+    header = header_bytes()
+
+    with open(path, 'wb') as f:
+        f.write(_MMAP_MAGIC)
+        f.write(_np.array(len(header), dtype='<u4').tobytes())
+        f.write(header)
+        f.truncate(offset)
+
+    return dict((name, _np.memmap(path, dtype=x['dtype'], mode='r+', offset=x['offset'], shape=tuple(x['shape'])))
+                for name, x in info.items() if _np.prod(x['shape']) > 0)
+
+
 class Signal(_np.ndarray):
     _MT_NATURE = "signal_type"
     _MT_START_TIME = "start_time"
@@ -167,6 +423,10 @@ class Signal(_np.ndarray):
     def segment_time(self, t_start, t_stop=None):
         pass
 
+    @_abstract
+    def get_iidx_interval(self, t_start, t_stop=None):
+        pass
+
     def plot(self, style="", vlines_height=1000):
         _xlabel("time")
         _ylabel(self.get_signal_type())
@@ -195,6 +455,27 @@ class Signal(_np.ndarray):
         dump(self.pickleable, f, protocol=2)
         f.close()
 
+    def to_mmap(self, path):
+        """
+        Saves this Signal into a file that can be memory-mapped by from_mmap: a JSON header with the metadata followed
+        by the raw little-endian buffers of the values (and of the x_values).
+        :param path: File system path to the file to write (create/overwrite).
+        """
+        arrays = {'values': self.get_values()}
+        ph = {}
+        for k, v in self.ph.items():
+            if isinstance(v, _np.ndarray):
+                arrays[k] = v
+            else:
+                ph[k] = v
+
+        buffers = _mmap_create(path, self.__class__.__name__, ph,
+                               [(name, values.dtype, values.shape) for name, values in arrays.items()])
+        for name, values in arrays.items():
+            if values.size > 0:
+                buffers[name][...] = values
+                buffers[name].flush()
+
 #    def impute_nans(self):
 #        self = ImputeNAN()(self)
         
@@ -345,6 +626,18 @@ class EvenlySignal(Signal):
 
         return self.segment_idx(self.get_idx(t_start), self.get_idx(t_stop))
 
+    def get_iidx_interval(self, t_start, t_stop=None):
+        """
+        Returns the inner indexes (start, stop) of the samples of segment_time(t_start, t_stop), also for arrays of
+        t_start and t_stop
+        """
+        n = len(self)
+        start = _np.clip(((_np.asarray(t_start) - self.get_start_time()) * self.get_sampling_freq()).astype(int), 0, n)
+        if t_stop is None:
+            return start, _np.full_like(start, n)
+        stop = _np.clip(((_np.asarray(t_stop) - self.get_start_time()) * self.get_sampling_freq()).astype(int), 0, n)
+        return start, _np.maximum(start, stop)
+
     def to_csv(self, filename, comment=''):
         values = self.get_values()
         times = self.get_times()
@@ -543,6 +836,20 @@ class UnevenlySignal(Signal):
         return self.segment_idx(self.get_idx(t_start) if t_start is not None else None,
                                 self.get_idx(t_stop) if t_stop is not None else None)
 
+    def get_iidx_interval(self, t_start, t_stop=None):
+        """
+        Returns the inner indexes (start, stop) of the samples of segment_time(t_start, t_stop)
+        """
+        idx_start = self.get_idx(t_start) if t_start is not None else 0
+        idx_stop = self.get_idx(t_stop) if t_stop is not None else self.get_indices()[-1]
+
+        iib = self.get_iidx_from_idx(idx_start)
+        iie = self.get_iidx_from_idx(idx_stop)
+        if iib is None and iie is None:
+            return 0, 0
+        start, stop, _ = slice(iib if iib is not None else 0, iie if iie is not None else -1).indices(len(self))
+        return start, max(start, stop)
+
     def segment_idx(self, idx_start, idx_stop=None):
         """
         Segment the signal given the indexes
@@ -638,12 +945,6 @@ class MultiEvenly(EvenlySignal):
         return(x_new)
     
     
-    def set_start_time(self, value):
-        setattr(self, "_mutated", True)
-        self.ph[self._MT_START_TIME] = value  
-        stim = self.get_stim()
-        stim.set_start_time(value)
-        
     def get_channel(self, i_ch):
         ch_values = self.get_values()[:,i_ch]
         return(EvenlySignal(ch_values, self.get_sampling_freq(), self.get_start_time(), self.get_signal_type()))
@@ -684,27 +985,6 @@ class MultiEvenly(EvenlySignal):
         return(signal_out)
         
 
-    # TRYME
-    def segment_iidx(self, iidx_start, iidx_stop=None):
-
-        signal_values = self.get_values()
-
-        if iidx_start is None:
-            iidx_start = 0
-        if iidx_stop is None:
-            iidx_stop = len(self)
-
-        values = signal_values[int(iidx_start):int(iidx_stop),:]
-
-        out_signal = self.clone_properties(values)
-        out_stim = self.get_stim().clone()
-        out_stim = out_stim.segment_iidx(iidx_start, iidx_stop)
-        out_signal.set_stim(out_stim)
-        
-        out_signal.set_start_time(self.get_time(iidx_start))
-        return out_signal
-    
-    
     def plot(self, style=""):
         _grid()
         n_ch = self.get_nchannels()
@@ -723,7 +1003,7 @@ class MultiEvenly(EvenlySignal):
         _tight_layout()
         _subplots_adjust(top=0.9, bottom=0.01, left=0.05, right=0.95, hspace=0.3, wspace=0.25)
 
-    def to_csv(self, filename, comment='', fmt = '%.6f'): 
+    def to_csv(self, filename, comment='', fmt='%.18e'):
         values = self.get_values()
         times = self.get_times()
         header = self.get_signal_type() + ' \n' + 'Fsamp: ' + str(self.get_sampling_freq()) + '\n' + comment + '\nidx,time'+''.join([f',ch{x}' for x in range(self.get_nchannels())])
@@ -81,6 +81,290 @@ def interpolate_ibi(rr, interp_freq):
     return rr_interp, bt_interp
 
 
+def sliding_windows(x, win_len, win_step=1):
+    """
+    Returns a read-only strided view (n_windows x win_len) of the windows of x starting at 0, win_step, 2*win_step...
+    No data is copied.
+    :param x: 1-D array
+    :param win_len: number of samples in each window
+    :param win_step: number of samples between the starts of two consecutive windows
+    """
+    from numpy.lib.stride_tricks import sliding_window_view
+    return sliding_window_view(np.asarray(x), int(win_len))[::int(win_step)]
+
+
+def stack_windows(x, starts, win_len):
+    """
+    Returns the windows of win_len samples of x starting at the given indices, as a 2-D array (n_windows x win_len).
+    :param x: 1-D array
+    :param starts: indices of the first sample of each window
+    :param win_len: number of samples in each window
+    """
+    return sliding_windows(x, win_len)[np.asarray(starts, dtype=int)]
+
+
+def _running_extreme(x, win_len, func):
+    # van Herk / Gil-Werman: split x in blocks of win_len samples, each window is covered by the suffix of one
+    # block and the prefix of the next one. O(n) whatever the window length.
+    x = np.asarray(x, dtype=float)
+    win_len = int(win_len)
+    n = len(x)
+    n_blocks = -(-n // win_len)
+    x_pad = np.full(n_blocks * win_len, np.nan)
+    x_pad[:n] = x
+    blocks = x_pad.reshape(n_blocks, win_len)
+    prefix = func.accumulate(blocks, axis=1).ravel()
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    n_windows = n - win_len + 1
+    return func(suffix[:n_windows], prefix[win_len - 1:win_len - 1 + n_windows])
+
+
+def running_max(x, win_len):
+    """
+    Returns the maximum of each window of win_len samples of x (one value for each start 0...len(x) - win_len),
+    with the same NaN propagation of numpy.max.
+    """
+    return _running_extreme(x, win_len, np.maximum)
+
+
+def running_min(x, win_len):
+    """
+    Returns the minimum of each window of win_len samples of x (one value for each start 0...len(x) - win_len),
+    with the same NaN propagation of numpy.min.
+    """
+    return _running_extreme(x, win_len, np.minimum)
+
+
+def running_mean(x, win_len):
+    """
+    Moving average using cumulative sums, equivalent to numpy.convolve(x, numpy.ones(win_len)/win_len, 'same').
+    Falls back to numpy.convolve if x contains NaNs or win_len is not in [1, len(x)].
+    """
+    x = np.asarray(x, dtype=float)
+    win_len = int(win_len)
+    n = len(x)
+    if win_len < 1 or win_len > n or np.isnan(x).any():
+        return np.convolve(x, np.ones(win_len) / win_len, mode='same')
+    cum = np.r_[0, np.cumsum(x)]
+    idx_hi = np.arange(n) + (win_len - 1) // 2 + 1
+    idx_lo = np.clip(idx_hi - win_len, 0, n)
+    idx_hi = np.clip(idx_hi, 0, n)
+    return (cum[idx_hi] - cum[idx_lo]) / win_len
+
+
+def windows_nanmean(x, starts, stops):
+    """
+    Computes numpy.nanmean(x[start:stop]) for each pair of starts and stops using cumulative sums.
+    """
+    x = np.asarray(x, dtype=float)
+    valid = ~np.isnan(x)
+    cum = np.r_[0, np.cumsum(np.where(valid, x, 0))]
+    cnt = np.r_[0, np.cumsum(valid)]
+    starts = np.asarray(starts, dtype=int)
+    stops = np.asarray(stops, dtype=int)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (cum[stops] - cum[starts]) / (cnt[stops] - cnt[starts])
+
+
+def windows_nanmoments(x, starts, stops):
+    """
+    Computes the number of valid samples, the mean and the variance (ddof=0) of x[start:stop] ignoring the NaNs for
+    each pair of starts and stops using cumulative sums and squares. x is centered on its mean before the sums to
+    limit the rounding errors.
+    :return: Tuple (count, mean, var), mean and var are NaN where count is 0
+    """
+    x = np.asarray(x, dtype=float)
+    valid = ~np.isnan(x)
+    shift = np.mean(x[valid]) if valid.any() else 0.
+    d = np.where(valid, x - shift, 0)
+    cum = np.r_[0, np.cumsum(d)]
+    cum2 = np.r_[0, np.cumsum(d * d)]
+    cnt = np.r_[0, np.cumsum(valid)]
+    starts = np.asarray(starts, dtype=int)
+    stops = np.asarray(stops, dtype=int)
+    count = cnt[stops] - cnt[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (cum[stops] - cum[starts]) / count
+        var = np.maximum((cum2[stops] - cum2[starts]) / count - mean * mean, 0)
+    return count, mean + shift, var
+
+
+def _windows_extreme(x, starts, stops, func, fill):
+    # one running extreme for each window length, the NaNs are replaced by fill (the identity of func)
+    x = np.asarray(x, dtype=float)
+    x = np.where(np.isnan(x), fill, x)
+    starts = np.asarray(starts, dtype=int)
+    lens = np.asarray(stops, dtype=int) - starts
+    out = np.full(len(starts), np.nan)
+    for win_len in np.unique(lens[lens > 0]):
+        i_win = np.flatnonzero(lens == win_len)
+        out[i_win] = _running_extreme(x, win_len, func)[starts[i_win]]
+    out[out == fill] = np.nan
+    return out
+
+
+def windows_nanmax(x, starts, stops):
+    """
+    Computes numpy.nanmax(x[start:stop]) for each pair of starts and stops (NaN for empty or all-NaN windows), with
+    a running maximum for each distinct window length.
+    """
+    return _windows_extreme(x, starts, stops, np.maximum, -np.inf)
+
+
+def windows_nanmin(x, starts, stops):
+    """
+    Computes numpy.nanmin(x[start:stop]) for each pair of starts and stops (NaN for empty or all-NaN windows), with
+    a running minimum for each distinct window length.
+    """
+    return _windows_extreme(x, starts, stops, np.minimum, np.inf)
+
+
+class RunningMoments(object):
+    """
+    Count, mean and variance of a set of values updated in O(1) as the values are added and removed (Welford).
+    NaNs are counted apart (n_nan) and do not affect the moments.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.n_nan = 0
+        self._mean = 0.
+        self._m2 = 0.
+
+    def add(self, x):
+        if np.isnan(x):
+            self.n_nan += 1
+            return
+        self.n += 1
+        delta = x - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (x - self._mean)
+
+    def remove(self, x):
+        if np.isnan(x):
+            self.n_nan -= 1
+            return
+        self.n -= 1
+        if self.n == 0:
+            self._mean = self._m2 = 0.
+            return
+        delta = x - self._mean
+        self._mean -= delta / self.n
+        self._m2 = max(self._m2 - delta * (x - self._mean), 0.)
+
+    def mean(self):
+        return self._mean if self.n > 0 else np.nan
+
+    def var(self):
+        """
+        Population variance (ddof=0) as numpy.var
+        """
+        return self._m2 / self.n if self.n > 0 else np.nan
+
+
+# Cost of a real FFT of length N in units of the cost of one multiply-add of the direct convolution, times N*log2(N)
+_FFT_COST = 10.
+
+
+def _oa_nfft(m):
+    # FFT length of the overlap-add blocks: power of 2 >= 4 * kernel length
+    return int(2 ** np.ceil(np.log2(max(4 * m, 256))))
+
+
+def _is_memmap(x):
+    while isinstance(x, np.ndarray):
+        if isinstance(x, np.memmap):
+            return True
+        x = x.base
+    return False
+
+
+def convolution_method(n, m, has_nan=False, is_memmap=False):
+    """
+    Chooses the fastest method to convolve n samples with a kernel of m samples, with a cost model of the direct,
+    FFT and overlap-add convolutions. Signals with NaNs use the direct convolution, where the NaNs affect only the
+    neighbouring samples, memory-mapped signals avoid the FFT of the whole signal.
+    :return: 'direct', 'fft' or 'oa'
+    """
+    if has_nan or m <= 1:
+        return 'direct'
+    n_full = n + m - 1
+    nfft = _oa_nfft(m)
+    costs = {'direct': n * m,
+             'fft': _FFT_COST * n_full * np.log2(n_full),
+             'oa': _FFT_COST * np.ceil(n_full / (nfft - m + 1)) * nfft * np.log2(nfft)}
+    if is_memmap:
+        del costs['fft']
+    return min(costs, key=costs.get)
+
+
+def convolve(x, kernel, mode='same', method='auto', pad=0, kernel_fft=None):
+    """
+    Convolves x (1-D or N_SAMPLES x N_CH) with the 1-D kernel along axis 0.
+    The result is the one of scipy.signal.convolve, with the method chosen by convolution_method if 'auto'. The
+    overlap-add method processes x in blocks, so that memory-mapped signals are not loaded at once.
+    :param mode: 'full', 'same' or 'valid', see numpy.convolve
+    :param method: 'auto', 'direct', 'fft' or 'oa' (overlap-add)
+    :param pad: With mode 'same' x is extended by repeating pad times its first and last samples before the
+     convolution; the extension is then removed from the result
+    :param kernel_fft: Function returning numpy.fft.rfft(kernel, nfft) given nfft, to reuse precomputed FFTs
+    :return: The convolution
+    """
+    from scipy.signal import convolve as _convolve
+    assert pad == 0 or mode == 'same', "pad is available with mode 'same' only"
+    kernel = np.asarray(kernel)
+    n = len(x) + 2 * pad
+    m = len(kernel)
+    assert n >= m or mode != 'valid', "The kernel should not be longer than the signal"
+
+    # window [lo, hi) of the full convolution of the padded x to return
+    lo, hi = {'full': (0, n + m - 1), 'same': ((m - 1) // 2, (m - 1) // 2 + n), 'valid': (m - 1, n)}[mode]
+    lo, hi = lo + pad, hi - pad
+
+    if method == 'auto':
+        method = convolution_method(n, m, np.isnan(np.sum(x)), _is_memmap(x))
+
+    if method == 'oa':
+        return _convolve_oa(x, kernel, lo, hi, pad, kernel_fft)
+
+    values = np.asarray(x)
+    if pad > 0:
+        values = np.concatenate([np.repeat(values[:1], pad, axis=0), values, np.repeat(values[-1:], pad, axis=0)])
+    if values.ndim == 1 and method == 'direct' and n >= m:
+        out = np.convolve(values, kernel, mode=mode)
+    elif values.ndim == 2 and method == 'direct' and n >= m:
+        # numpy.convolve on each channel is much faster than the N-D direct convolution of scipy
+        out = np.stack([np.convolve(values[:, i], kernel, mode=mode) for i in range(values.shape[1])], axis=1)
+    else:
+        out = _convolve(values, kernel.reshape((-1,) + (1,) * (values.ndim - 1)), mode=mode, method=method)
+    return out[pad:len(out) - pad] if pad > 0 else out
+
+
+def _convolve_oa(x, kernel, lo, hi, pad, kernel_fft=None):
+    n = len(x)
+    m = len(kernel)
+    nfft = _oa_nfft(m)
+    block_len = nfft - m + 1
+    h = kernel_fft(nfft) if kernel_fft is not None else np.fft.rfft(kernel, nfft)
+    h = h.reshape((-1,) + (1,) * (np.ndim(x) - 1))
+
+    out = np.zeros((hi - lo,) + np.shape(x)[1:])
+    # the block [s, s + block_len) of the padded x contributes to [s, s + block_len + m - 1) of the convolution
+    start = max(0, lo - m + 1) // block_len * block_len
+    for s in range(start, min(hi, n + 2 * pad), block_len):
+        e = min(s + block_len, n + 2 * pad)
+        if s >= pad and e <= n + pad:
+            block = np.asarray(x[s - pad:e - pad], dtype=float)
+        else:
+            block = np.asarray(x[np.clip(np.arange(s, e) - pad, 0, n - 1)], dtype=float)
+        y = np.fft.irfft(np.fft.rfft(block, nfft, axis=0) * h, nfft, axis=0)
+        a = max(s, lo)
+        b = min(s + len(block) + m - 1, hi)
+        if a < b:
+            out[a - lo:b - lo] += y[a - s:b - s]
+    return out
+
+
 def template_interpolation(x, t, step, template=None):
     if template is None:
         template = np.square(np.cos(np.arange(0, 0.505, 0.005) * np.pi))
@@ -1,6 +1,8 @@
 # coding=utf-8
 from __future__ import division
 
+__version__ = '2.4.2'
+
 from numpy import array as _array
 from .tools.Tools import *
 import numpy as _np
@@ -11,7 +13,8 @@ from .indicators import NonLinearDomain
 from .indicators import PeaksDescription
 from .indicators import TimeDomain
 from .BaseSegmentation import Segment
-from .Signal import EvenlySignal, UnevenlySignal, MultiEvenly, from_pickle, from_pickleable
+from .Signal import EvenlySignal, UnevenlySignal, MultiEvenly, from_pickle, from_pickleable, from_mmap, from_csv, \
+    iter_csv
 from .interactive import Annotate
 # BE CAREFUL with NAMES!!!
 from .estimators.Estimators import *
@@ -196,7 +199,7 @@ def preset_activity(prefix='activity', method='welch'):
 
     return t
  
-def fmap(segments, algorithms, alt_signal=None):
+def fmap(segments, algorithms, alt_signal=None, n_jobs=1, executor=None):
     # TODO : rename extract_indicators
     """
     Generates a list composed of a list of results for each segment.
@@ -205,35 +208,57 @@ def fmap(segments, algorithms, alt_signal=None):
     :param segments: An iterable of segments (e.g. an initialized SegmentGenerator)
     :param algorithms: A list of algorithms
     :param alt_signal: The signal that will be used instead of the one referenced in the segments
+    :param n_jobs: Number of processes used to compute the segments in parallel (-1 for one per CPU). The signal is
+     saved once to a temporary file and memory-mapped by the processes. The algorithms must be picklable (e.g. not
+     created with algo).
+    :param executor: A concurrent.futures.Executor (e.g. a ProcessPoolExecutor or a ThreadPoolExecutor) to use
+     instead of creating a process pool
 
     :return: values, col_names A tuple: matrix (segment x algorithms) containing a value for each
      algorithm, the list of the algorithm names.
     """
-    from numpy import asarray as _asarray
-    
+    from .execution import compute_segment as _compute_segment, map_segments as _map_segments, \
+        plan_intermediates as _plan_intermediates, accumulate_segments as _accumulate_segments
+
     seg_for = segments(alt_signal) if isinstance(segments, SegmentsGenerator) else segments
-    
-    values = []
-    for seg in seg_for:
-        segment_data = _np.array([seg.get_begin_time(), seg.get_end_time(), seg.get_label()]).reshape(3,1)
-        vals_segment = []
-        for alg in algorithms:
-            vals_alg = _np.array(alg(seg(alt_signal)))
-
-            if not alt_signal.is_multi():
-#                vals_alg = _np.expand_dims([vals_alg], 1)
-                vals_alg = _np.array([vals_alg])
-            vals_segment.append(vals_alg)
-            
-        vals_segment = _np.array(vals_segment)
-        seg_data_array = _np.repeat(segment_data, alt_signal.get_nchannels(), axis = 1)
-        vals_segment = _np.concatenate([seg_data_array, vals_segment], axis = 0)
-        values.append(vals_segment)
+
+    signal = alt_signal if alt_signal is not None else getattr(seg_for, '_signal', None)
+    accumulators = None
+    if n_jobs == 1 and executor is None and isinstance(seg_for, FixedSegments) and signal is not None and \
+            signal.ndim == 1 and seg_for.get('width') is not None and seg_for.get('width') > seg_for.get('step'):
+        accumulators = [alg.accumulator(signal) if hasattr(alg, 'accumulator') else None for alg in algorithms]
+
+    if accumulators is not None and all(acc is not None for acc in accumulators):
+        # overlapping segments: the indicators are updated with the samples entering and leaving each segment, or
+        # computed on all the segments at once from cumulative sums (see Accumulator.windows)
+        if seg_for.get('labels') is None:
+            begins, ends = seg_for.get_segments_times()
+            labels = [None] * len(begins)
+        else:
+            segments_times = [(seg.get_begin_time(), seg.get_end_time(), seg.get_label()) for seg in seg_for]
+            begins, ends, labels = [[x[i] for x in segments_times] for i in range(3)]
+        values = _accumulate_segments(signal, begins, ends, labels, accumulators)
+    elif n_jobs == 1 and executor is None:
+        # intermediates shared by the algorithms (e.g. the PSD of PowerInBand) are computed once per segment
+        intermediates = _plan_intermediates(algorithms)
+        values = []
+        for seg in seg_for:
+            values.append(_compute_segment(seg(alt_signal), seg.get_begin_time(), seg.get_end_time(),
+                                           seg.get_label(), algorithms, intermediates))
+    else:
+        seg_for = list(seg_for)
+        signal = alt_signal
+        if signal is None and len(seg_for) > 0:
+            signal = seg_for[0]._signal
+            assert all(seg._signal is signal for seg in seg_for), \
+                "To run in parallel all the segments should refer to the same signal (or use alt_signal)"
+        segments_times = [(seg.get_begin_time(), seg.get_end_time(), seg.get_label()) for seg in seg_for]
+        values = _map_segments(signal, segments_times, algorithms, n_jobs=n_jobs, executor=executor)
     
     values = _np.array(values)
     
     #for compatibility
-    if not alt_signal.is_multi():
+    if values.ndim == 3 and values.shape[2] == 1:
         values = values[:,:,0]
         
     col_names = ["begin", "end", "label"] + [x.__repr__() for x in algorithms]
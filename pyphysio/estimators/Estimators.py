@@ -2,11 +2,12 @@
 from __future__ import division
 import numpy as _np
 from ..BaseEstimator import Estimator as _Estimator
-from ..Signal import UnevenlySignal as _UnevenlySignal, EvenlySignal as _EvenlySignal
+from ..Signal import UnevenlySignal as _UnevenlySignal, EvenlySignal as _EvenlySignal, MultiEvenly as _MultiEvenly
 from ..filters.Filters import IIRFilter as _IIRFilter, DeConvolutionalFilter as _DeConvolutionalFilter, \
     ConvolutionalFilter as _ConvolutionalFilter
-from ..tools.Tools import SignalRange as _SignalRange, PeakDetection as _PeakDetection, Minima as _Minima, \
+from ..tools.Tools import SignalRange as _SignalRange, PeakDetection as _PeakDetection, \
     PeakSelection as _PeakSelection, Diff as _Diff
+from ..Utility import windows_nanmean as _windows_nanmean, sliding_windows as _sliding_windows
 
 __author__ = 'AleB'
 
@@ -46,6 +47,59 @@ class BeatFromBP(_Estimator):
         assert 0 < win_post <= 1, "Window post peak value should be in (0 and 1]"
         _Estimator.__init__(self, bpm_max=bpm_max, win_pre=win_pre, win_post=win_post)
 
+    @staticmethod
+    def _refine_peaks(dxdt, maxp, win_pre, win_post, win_len, win_step, chunk=4096):
+        # For each candidate beat: the maximum of the derivative in [idx_beat - win_pre, idx_beat + win_post), then
+        # the first minimum of the absolute derivative after it, as found by Minima(method='windowing') on windows of
+        # win_len samples every win_step samples. The beats are processed in chunks, gathering the windows of all the
+        # beats of a chunk in a matrix. Returns the peaks, -1 where not found.
+        n = len(dxdt)
+        abs_dxdt = _np.abs(dxdt)
+        start = _np.maximum((maxp - win_pre).astype(int), 0)
+        stop = (maxp + win_post).astype(int)
+        stop[stop > n] = n - 1  # as slicing up to -1
+        peaks = _np.full(len(maxp), -1)
+
+        for i_chunk in range(0, len(maxp), chunk):
+            i_beats = _np.arange(i_chunk, min(i_chunk + chunk, len(maxp)))
+            i_beats = i_beats[stop[i_beats] > start[i_beats]]
+            if len(i_beats) == 0:
+                continue
+            st, sp = start[i_beats], stop[i_beats]
+
+            # maximum of the derivative
+            idx = st[:, None] + _np.arange(_np.max(sp - st))
+            obs = _np.where(idx < sp[:, None], dxdt[_np.minimum(idx, n - 1)], -_np.inf)
+            first = st + _np.argmax(obs, axis=1)
+            lens = sp - first
+            peak = _np.full(len(i_beats), -1)
+
+            # portions not longer than a window: a single window
+            short = _np.flatnonzero(lens <= win_len)
+            if len(short) > 0:
+                idx = first[short, None] + _np.arange(_np.max(lens[short]))
+                obs = _np.where(idx < sp[short, None], abs_dxdt[_np.minimum(idx, n - 1)], _np.inf)
+                i_min = _np.argmin(obs, axis=1)
+                ok = (i_min != 0) & (i_min != lens[short] - 1)
+                peak[short[ok]] = i_min[ok]
+
+            # longer portions: the first window with the minimum not at its boundaries
+            active = _np.flatnonzero(lens > win_len)
+            if len(active) > 0:
+                windows = _sliding_windows(abs_dxdt, win_len)
+                n_windows = (lens - win_len) // win_step + 1
+                k = 0
+                while len(active) > 0:
+                    i_min = _np.argmin(windows[first[active] + k * win_step], axis=1)
+                    ok = (i_min != 0) & (i_min != win_len - 1)
+                    peak[active[ok]] = k * win_step + i_min[ok]
+                    k += 1
+                    active = active[~ok & (n_windows[active] > k)]
+
+            found = peak >= 0
+            peaks[i_beats[found]] = first[found] + peak[found] + 1
+        return peaks
+
     @classmethod
     def algorithm(cls, signal, params):
         fsamp = signal.get_sampling_freq()
@@ -77,31 +131,14 @@ class BeatFromBP(_Estimator):
         # compute the signal derivative
         dxdt = _Diff()(signal)
 
-        true_peaks = []
-        # for each candidate peak find the correct peak
-        for idx_beat in maxp:
-            start_ = int(idx_beat - win_pre)
-            if start_ < 0:
-                start_ = 0
-
-            stop_ = int(idx_beat + win_post)
-            if stop_ > len(dxdt):
-                stop_ = -1
+        true_peaks = cls._refine_peaks(_np.asarray(dxdt), _np.asarray(maxp), win_pre, win_post,
+                                       int(0.1 * fsamp), int(0.025 * fsamp))
 
-            # select portion of derivative where to search
-            obs = dxdt[start_:stop_]
-            peak_obs = _np.argmax(obs)
-            true_obs = dxdt[start_ + peak_obs: stop_]
-
-            # find the 'first minimum' (zero) the derivative (peak)
-            idx_mins, mins = _Minima(win_len=0.1, win_step=0.025, method='windowing')(abs(true_obs))
-
-            if len(idx_mins) >= 1:
-                peak = idx_mins[0]
-                true_peaks.append(start_ + peak_obs + peak + 1)
-            else:
-                cls.warn('Peak not found; idx_beat: ' + str(idx_beat))
-                pass
+        not_found = maxp[true_peaks < 0]
+        if len(not_found) > 0:
+            cls.warn('Peak not found for %d of %d candidate beats; idx_beat: %s' %
+                     (len(not_found), len(maxp), str(not_found)))
+        true_peaks = true_peaks[true_peaks >= 0]
 
         # STAGE 3 - FINALIZE computing IBI
         ibi_values = _np.diff(true_peaks) / fsamp
@@ -252,6 +289,119 @@ class DriverEstim(_Estimator):
         driver = _EvenlySignal(driver, sampling_freq=fsamp, start_time=signal.get_start_time(),signal_type="dEDA")
         return driver
 
+    @classmethod
+    def batch(cls, signal, par_bat):
+        """
+        Estimates the drivers for many pairs of Bateman parameters at once. The FFT of the signal is computed once (as
+        a real FFT of a fast length, common to all the pairs); the spectra of the Bateman functions and of the
+        padding are computed in closed form and the deconvolutions are a single broadcasted division.
+
+        Parameters
+        ----------
+        signal : EvenlySignal
+            The EDA signal
+        par_bat : array
+            (T1, T2) pairs of the Bateman parameters (N_PAIRS x 2)
+
+        Returns
+        -------
+        drivers : MultiEvenly
+            The EDA driver function for each pair (N_SAMPLES x N_PAIRS)
+        """
+        fsamp = signal.get_sampling_freq()
+        drivers = cls._deconvolve(signal.get_values(), fsamp, par_bat)
+        drivers = _MultiEvenly(drivers.T, sampling_freq=fsamp, start_time=signal.get_start_time(),
+                               signal_type="dEDA")
+        # gaussian smoothing
+        return _ConvolutionalFilter(irftype='gauss', win_len=_np.max([0.2, 1 / fsamp]) * 8, normalize=True)(drivers)
+
+    @staticmethod
+    def _deconvolve(values, fsamp, par_bat, chunk_size=2 ** 21):
+        # The deconvolution of DriverEstim.algorithm (the signal padded with the scaled halves of the Bateman function
+        # and divided in the frequency domain by the normalized Bateman function) for each pair, before the smoothing.
+        # The Bateman function b[t] = r2^t - r1^t, with r = exp(-1 / (T * fsamp)), is a difference of geometric
+        # sequences: the spectra of b and of the padding are computed as sums of geometric series. The padded signal
+        # is rotated to start with the signal, which rotates the output in the same way.
+        from scipy.fft import next_fast_len as _next_fast_len
+
+        values = _np.asarray(values, dtype=float)
+        par_bat = _np.atleast_2d(_np.asarray(par_bat, dtype=float))
+        n = len(values)
+        lens = _np.ceil(par_bat[:, 1] * fsamp * 10).astype(int)
+        drivers = _np.empty((len(par_bat), n - 1))
+
+        # the length of the FFT depends only on the pair, so that its driver does not depend on the other pairs
+        n_ffts = _np.array([_next_fast_len(n + l_bat + 1, real=True) for l_bat in lens])
+        for n_fft in _np.unique(n_ffts):
+            i_pars = _np.flatnonzero(n_ffts == n_fft)
+            drivers[i_pars] = DriverEstim._deconvolve_fft(values, fsamp, par_bat[i_pars], lens[i_pars], n_fft,
+                                                          chunk_size)
+        return drivers
+
+    @staticmethod
+    def _deconvolve_fft(values, fsamp, par_bat, lens, n_fft, chunk_size):
+        n = len(values)
+        k = _np.arange(n_fft // 2 + 1)
+        w = _np.exp(-2j * _np.pi * k / n_fft)
+
+        def w_pow(m):
+            # w^m for the integer m of each pair (column)
+            return _np.exp(-2j * _np.pi * ((k * m[:, None]) % n_fft) / n_fft)
+
+        fft_signal = _np.fft.rfft(values, n_fft)
+        w_n = w_pow(_np.array([n]))
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            inv_0 = 1 / (1 - w)
+        drivers = _np.empty((len(par_bat), n - 1))
+        chunk = max(1, chunk_size // len(k))
+        for i_chunk in range(0, len(par_bat), chunk):
+            pars = par_bat[i_chunk:i_chunk + chunk]
+            r1 = _np.exp(-1 / (pars[:, 0] * fsamp))[:, None]
+            r2 = _np.exp(-1 / (pars[:, 1] * fsamp))[:, None]
+            len_bat = lens[i_chunk:i_chunk + chunk]
+
+            i_max = _np.empty(len(pars), dtype=int)
+            b_sum, b_max, min_pre, min_post = [_np.empty(len(pars)) for i in range(4)]
+            for i, (t1, t2) in enumerate(pars):
+                t = _np.arange(len_bat[i])
+                bateman = _np.exp(-t / (t2 * fsamp)) - _np.exp(-t / (t1 * fsamp))
+                i_max[i] = _np.argmax(bateman)
+                b_sum[i] = _np.sum(bateman)
+                b_max[i] = bateman[i_max[i]]
+                min_pre[i] = _np.min(bateman[:i_max[i] + 1])
+                min_post[i] = _np.min(bateman[i_max[i]:])
+
+            # sums of (r w)^j for j in [0, m): (1 - r^m w^m) / (1 - r w)
+            inv_1 = 1 / (1 - r1 * w)
+            inv_2 = 1 / (1 - r2 * w)
+            w_max = w_pow(i_max + 1)
+            w_len = w_pow(len_bat)
+            w_post = w_len * w_max.conj() * w
+
+            def bateman_part(start, length, w_length, b_min):
+                # spectrum of b[start: start + length] - b_min
+                start, length, b_min = start[:, None], length[:, None], b_min[:, None]
+                out = (r2 ** start * (1 - r2 ** length * w_length) * inv_2 -
+                       r1 ** start * (1 - r1 ** length * w_length) * inv_1)
+                if _np.any(b_min != 0):
+                    with _np.errstate(invalid='ignore'):
+                        ones = _np.where(k == 0, length, (1 - w_length) * inv_0)
+                    out -= b_min * ones
+                return out
+
+            zeros = _np.zeros(len(pars), dtype=int)
+            fft_bateman = bateman_part(zeros, len_bat, w_len, zeros) / b_sum[:, None]
+
+            # padding: the scaled first half before the signal (wrapped at the end), the second half after it
+            pre = bateman_part(zeros, i_max + 1, w_max, min_pre) * w_max.conj()
+            pre *= (values[0] / (b_max - min_pre))[:, None]
+            post = bateman_part(i_max, len_bat - i_max, w_post, min_post) * w_n
+            post *= (values[-1] / (b_max - min_post))[:, None]
+
+            out = _np.fft.irfft((fft_signal + pre + post) / fft_bateman, n_fft, axis=1)
+            drivers[i_chunk:i_chunk + chunk] = _np.abs(out[:, :n - 1])
+        return drivers
+
     @staticmethod
     def _gen_bateman(fsamp, par_bat):
         """
@@ -341,17 +491,18 @@ class PhasicEstim(_Estimator):
         # identify start and stop of the peak
         idx_pre, idx_post = _PeakSelection(indices=idx_max, win_pre=win_pre, win_post=win_post)(signal)
 
-        # Linear interpolation to substitute the peaks
+        # Linear interpolation to substitute the peaks, all the portions [idx_pre, idx_post) concatenated
         driver_no_peak = _np.copy(signal)
-        for I in range(len(idx_pre)):
-            i_st = idx_pre[I]
-            i_sp = idx_post[I]
-
-            if not _np.isnan(i_st) and not _np.isnan(i_sp):
-                idx_base = _np.arange(i_sp - i_st)
-                coeff = (signal[i_sp] - signal[i_st]) / len(idx_base)
-                driver_base = idx_base * coeff + signal[i_st]
-                driver_no_peak[i_st:i_sp] = driver_base
+        values = signal.get_values()
+        lens = _np.maximum(idx_post - idx_pre, 0)
+        i_peak = _np.repeat(_np.arange(len(lens)), lens)
+        idx_base = _np.arange(len(i_peak)) - _np.repeat(_np.cumsum(lens) - lens, lens)
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            coeff = (values[idx_post] - values[idx_pre]) / lens
+        idx = idx_pre[i_peak] + idx_base
+        # where the portions overlap the last peak prevails
+        idx_last = len(idx) - 1 - _np.unique(idx[::-1], return_index=True)[1]
+        driver_no_peak[idx[idx_last]] = idx_base[idx_last] * coeff[i_peak[idx_last]] + values[idx_pre[i_peak[idx_last]]]
 
         # generate the grid for the interpolation
         idx_grid = _np.arange(0, len(driver_no_peak) - 1, grid_size * fsamp)
@@ -407,10 +558,8 @@ class Energy(_Estimator):
         windows = _np.arange(0, len(signal) - idx_len + 1, idx_step)
 
         energy = _np.empty(len(windows) + 2)
-        for i in range(1, len(windows) + 1):
-            start = windows[i - 1]
-            portion_curr = signal.segment_idx(start, start + idx_len)
-            energy[i] = _np.nanmean(_np.power(portion_curr, 2))
+        energy[1:-1] = _windows_nanmean(_np.power(signal.get_values(), 2),
+                                        windows.astype(int), (windows + idx_len).astype(int))
         energy[0] = energy[1]
         energy[-1] = energy[-2]
 
@@ -0,0 +1,201 @@
+# coding=utf-8
+from __future__ import division
+
+import os as _os
+import numpy as _np
+from .Signal import from_mmap as _from_mmap, EvenlySignal as _EvenlySignal
+from .BaseAlgorithm import Cache as _Cache
+
+__author__ = 'AleB'
+
+# Number of segments of each batch submitted to an executor by map_segments
+SEGMENTS_PER_BATCH = 16
+
+# Signals opened by the workers, by path of the values file
+_opened_signals = {}
+
+
+class SharedSignal(object):
+    """
+    Picklable reference to a Signal saved once in a folder (see Signal.to_mmap), to be opened (memory-mapped) by the
+    workers of a process pool instead of pickling the signal for each task.
+    """
+
+    def __init__(self, signal, folder):
+        self._path = _os.path.join(folder, "signal.mmap")
+        signal.to_mmap(self._path)
+
+    def open(self):
+        """
+        Returns the Signal, backed by a copy-on-write memory map of the file.
+        """
+        if self._path not in _opened_signals:
+            signal = _from_mmap(self._path, mode='c')
+            _opened_signals.clear()
+            _opened_signals[self._path] = signal
+        return _opened_signals[self._path]
+
+
+def plan_intermediates(algorithms):
+    """
+    Inspects the algorithms and finds the intermediate algorithms (see Algorithm.get_intermediates) used by more
+    than one of them, e.g. the PSD of PowerInBand or the PeakDetection of the Peaks indicators.
+    The intermediates of the intermediates are visited too, so that the result is sorted with each intermediate after
+    the ones it depends on.
+    :param algorithms: List of algorithms
+    :return: List of the shared intermediate algorithms, to be computed once per segment
+    """
+    nodes = {}
+    order = []
+
+    def visit(alg):
+        for node in alg.get_intermediates():
+            key = node.cache_key(node.get())
+            if key not in nodes:
+                visit(node)
+                nodes[key] = [node, 0]
+                order.append(key)
+            nodes[key][1] += 1
+
+    for alg in algorithms:
+        visit(alg)
+    return [nodes[key][0] for key in order if nodes[key][1] > 1]
+
+
+def compute_segment(signal_segment, begin, end, label, algorithms, intermediates=()):
+    """
+    Computes the algorithms on a segment.
+    :param intermediates: Shared intermediate algorithms (see plan_intermediates), computed once on the segment and
+     used by all the algorithms
+    :return: Matrix ((3 + n_algorithms) x n_channels): begin, end, label and the value of each algorithm
+    """
+    n_channels = signal_segment.get_nchannels()
+    if len(intermediates) > 0 and n_channels == 1:
+        # the results are kept in the cache, keyed by the content of the segment
+        _Cache.cache_check(signal_segment)
+        for node in intermediates:
+            node.run_shared(signal_segment)
+    segment_data = _np.array([begin, end, label]).reshape(3, 1)
+    vals_segment = []
+    for alg in algorithms:
+        vals_alg = _np.array(alg(signal_segment))
+
+        if n_channels == 1:
+            vals_alg = _np.array([vals_alg])
+        vals_segment.append(vals_alg)
+
+    vals_segment = _np.array(vals_segment)
+    seg_data_array = _np.repeat(segment_data, n_channels, axis=1)
+    return _np.concatenate([seg_data_array, vals_segment], axis=0)
+
+
+def accumulate_segments(signal, begins, ends, labels, accumulators):
+    """
+    Computes indicators on each segment of a single channel signal with their Accumulators (see
+    Indicator.accumulator): all the segments are computed in one pass (see Accumulator.windows), so that overlapping
+    segments are not computed from scratch.
+    The values are the ones of compute_segment up to the rounding errors.
+    :param begins: Begin times of the segments
+    :param ends: End times of the segments
+    :param labels: Labels of the segments
+    :param accumulators: List of the Accumulators of the indicators
+    :return: Matrix (n_segments x (3 + n_accumulators) x 1): the matrices computed by compute_segment, one for each
+     segment
+    """
+    if isinstance(signal, _EvenlySignal):
+        starts, stops = signal.get_iidx_interval(_np.asarray(begins, dtype=float), _np.asarray(ends, dtype=float))
+    else:
+        starts, stops = _np.array([signal.get_iidx_interval(b, e) for b, e in zip(begins, ends)],
+                                  dtype=int).reshape(-1, 2).T
+    values = signal.get_values()
+    vals = _np.array([acc.windows(values, starts, stops) for acc in accumulators])
+    segment_data = _np.array(list(zip(begins, ends, labels))).reshape(-1, 3)
+    return _np.concatenate([segment_data, vals.T.reshape(-1, len(accumulators))], axis=1)[:, :, None]
+
+
+def open_signal(signal):
+    """
+    Returns the Signal referenced by signal if it is a SharedSignal, else signal itself.
+    """
+    return signal.open() if isinstance(signal, SharedSignal) else signal
+
+
+def compute_segments(signal, segments_times, algorithms):
+    """
+    Computes the algorithms on each (begin, end, label) segment of the signal.
+    :param signal: A Signal or a SharedSignal
+    """
+    signal = open_signal(signal)
+    intermediates = plan_intermediates(algorithms)
+    return [compute_segment(signal.segment_time(b, e), b, e, label, algorithms, intermediates)
+            for b, e, label in segments_times]
+
+
+def map_batches(func, signal, batches, args=(), n_jobs=1, executor=None):
+    """
+    Calls func(signal, batch, *args) for each batch in parallel, keeping the order of the batches. With a process
+    pool the signal is saved once and shared with the workers as a SharedSignal: func should get it with open_signal.
+
+    :param func: Picklable function
+    :param signal: The signal to share
+    :param batches: List of the batches of the work
+    :param args: Other (picklable) arguments of func
+    :param n_jobs: Number of processes of the pool to create if executor is None (-1 for one per CPU)
+    :param executor: A concurrent.futures.Executor to use instead of creating a process pool
+    :return: The list of the results of func, one for each batch
+    """
+    from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor, \
+        ThreadPoolExecutor as _ThreadPoolExecutor
+    from tempfile import mkdtemp as _mkdtemp
+    from shutil import rmtree as _rmtree
+
+    if n_jobs == -1:
+        n_jobs = _os.cpu_count()
+
+    folder = None
+    own_executor = executor is None
+    try:
+        if own_executor:
+            executor = _ProcessPoolExecutor(max_workers=n_jobs)
+
+        if isinstance(executor, _ThreadPoolExecutor):
+            # threads share the memory
+            shared = signal
+        else:
+            folder = _mkdtemp(prefix="pyphysio_")
+            shared = SharedSignal(signal, folder)
+
+        n = len(batches)
+        results = list(executor.map(func, [shared] * n, batches, *[[arg] * n for arg in args]))
+    finally:
+        if own_executor and executor is not None:
+            executor.shutdown()
+        if folder is not None:
+            _rmtree(folder, ignore_errors=True)
+    return results
+
+
+def map_segments(signal, segments_times, algorithms, n_jobs=1, executor=None, n_batches=None):
+    """
+    Computes the algorithms on the segments in parallel, keeping the order of the segments.
+
+    :param signal: The signal to segment
+    :param segments_times: List of (begin, end, label) of the segments
+    :param algorithms: List of (picklable) algorithms
+    :param n_jobs: Number of processes of the pool to create if executor is None (-1 for one per CPU)
+    :param executor: A concurrent.futures.Executor to use instead of creating a process pool
+    :param n_batches: Number of batches of contiguous segments to submit. By default 4 per process of the pool, or
+     batches of SEGMENTS_PER_BATCH segments with an executor
+    :return: The list of the matrices computed by compute_segment, one for each segment
+    """
+    if n_jobs == -1:
+        n_jobs = _os.cpu_count()
+    if n_batches is None:
+        # a few batches for each worker to balance the load
+        n_batches = 4 * n_jobs if executor is None else -(-len(segments_times) // SEGMENTS_PER_BATCH)
+
+    n_batches = max(1, min(len(segments_times), n_batches))
+    batches = [[segments_times[i] for i in idx] for idx in _np.array_split(_np.arange(len(segments_times)), n_batches)]
+
+    results = map_batches(compute_segments, signal, batches, (algorithms,), n_jobs, executor)
+    return [v for batch in results for v in batch]
@@ -1,15 +1,15 @@
 # coding=utf-8
 from __future__ import division
 import numpy as _np
-import scipy.stats as _stats
 from scipy.signal import gaussian as _gaussian, filtfilt as _filtfilt, filter_design as _filter_design, \
-    deconvolve as _deconvolve, firwin as _firwin, convolve as _convolve
+    deconvolve as _deconvolve, firwin as _firwin, sosfilt as _sosfilt, sosfilt_zi as _sosfilt_zi
 from matplotlib.pyplot import plot as _plot
 from ..BaseFilter import Filter as _Filter
 from ..Signal import EvenlySignal as _EvenlySignal, UnevenlySignal as _UnevenlySignal
-from ..Utility import abstractmethod as _abstract
+from ..Utility import abstractmethod as _abstract, convolve as _fast_convolve
 from ..tools.Tools import SignalRange
-from collections import Sequence
+from collections import OrderedDict as _OrderedDict
+import threading as _threading
 __author__ = 'AleB'
 
 
@@ -46,6 +46,8 @@ class Normalize(_Filter):
             assert norm_range != 0, "norm_range must not be zero"
         _Filter.__init__(self, norm_method=norm_method, norm_bias=norm_bias, norm_range=norm_range)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, signal, params):
         from ..indicators.TimeDomain import Mean as _Mean, StDev as _StDev
@@ -56,14 +58,155 @@ class Normalize(_Filter):
         elif method == "standard":
             return (signal - _Mean()(signal)) / _StDev()(signal)
         elif method == "min":
-            return signal - _np.min(signal)
+            return signal - _np.min(signal, axis=0)
         elif method == "maxmin":
-            return (signal - _np.min(signal)) / (_np.max(signal) - _np.min(signal))
+            return (signal - _np.min(signal, axis=0)) / (_np.max(signal, axis=0) - _np.min(signal, axis=0))
         elif method == "custom":
             return (signal - params['norm_bias']) / params['norm_range']
 
 
 
+def _check_solution(cls, signal, sig_filtered):
+    """
+    Returns the original signal (or the original channels) where the filter gives no solution (NaNs).
+    """
+    no_solution = _np.isnan(sig_filtered[0])
+    if _np.all(no_solution):
+        cls.warn('Filter parameters allow no solution. Returning original signal.')
+        return signal
+    elif _np.any(no_solution):
+        cls.warn('Filter parameters allow no solution for some channels. Returning original channels.')
+        sig_filtered[:, no_solution] = signal.get_values()[:, no_solution]
+    return sig_filtered
+
+
+class FilterDesignCache(object):
+    """
+    Process-wide memory of the designed filter coefficients (see IIRFilter.design and FIRFilter.design), so that
+    filtering many segments or signals with the same parameters designs the filter once.
+    The least recently used coefficients are removed when more than max_entries are kept.
+    """
+
+    _max_entries = 256
+    _store = _OrderedDict()
+    _hits = 0
+    _misses = 0
+    _lock = _threading.Lock()
+
+    @staticmethod
+    def get(key, design):
+        """
+        Returns the coefficients with the given key, calling design() to compute them if missing.
+        The arrays returned are read-only, as they are shared.
+        """
+        with FilterDesignCache._lock:
+            entry = FilterDesignCache._store.get(key)
+            if entry is not None:
+                FilterDesignCache._store.move_to_end(key)
+                FilterDesignCache._hits += 1
+                entry[1] += 1
+                return entry[0]
+            FilterDesignCache._misses += 1
+
+        value = design()
+        for x in value if isinstance(value, tuple) else [value]:
+            if isinstance(x, _np.ndarray):
+                x.setflags(write=False)
+        with FilterDesignCache._lock:
+            FilterDesignCache._store[key] = [value, 0]
+            while len(FilterDesignCache._store) > FilterDesignCache._max_entries:
+                FilterDesignCache._store.popitem(last=False)
+        return value
+
+    @staticmethod
+    def set_max_entries(max_entries):
+        """
+        Sets the maximum number of designs kept, 0 to disable the cache.
+        """
+        assert max_entries >= 0, "The maximum number of entries should be >= 0"
+        with FilterDesignCache._lock:
+            FilterDesignCache._max_entries = max_entries
+            while len(FilterDesignCache._store) > max_entries:
+                FilterDesignCache._store.popitem(last=False)
+
+    @staticmethod
+    def get_stats():
+        """
+        Returns the statistics of the cache.
+        :return: dict with hits, misses, n_entries, max_entries and entries: the list of (key, hits) of the designs
+        """
+        with FilterDesignCache._lock:
+            return {'hits': FilterDesignCache._hits, 'misses': FilterDesignCache._misses,
+                    'n_entries': len(FilterDesignCache._store), 'max_entries': FilterDesignCache._max_entries,
+                    'entries': [(k, v[1]) for k, v in FilterDesignCache._store.items()]}
+
+    @staticmethod
+    def reset():
+        """
+        Removes all the designs and resets the statistics.
+        """
+        with FilterDesignCache._lock:
+            FilterDesignCache._store.clear()
+            FilterDesignCache._hits = 0
+            FilterDesignCache._misses = 0
+
+
+def _freqs_key(f):
+    return tuple(float(x) for x in _np.atleast_1d(f))
+
+
+class FilterStream(object):
+    """
+    Causal filter with persistent state, to filter a stream of blocks of samples as they arrive, without edge
+    artefacts between the blocks. Get one from IIRFilter.stream or FIRFilter.stream.
+
+    The state is initialized to the steady state for the first sample of the first block. Unlike the filters applied
+    to a whole signal, the filter is not zero-phase: the output is delayed (by `delay` samples for FIR filters).
+    """
+
+    def __init__(self, sampling_freq, sos=None, taps=None):
+        assert (sos is None) != (taps is None), "Either sos or taps should be given"
+        self._sampling_freq = sampling_freq
+        # own copies: the designs in FilterDesignCache are read-only
+        self._sos = _np.array(sos) if sos is not None else None
+        self._taps = _np.array(taps) if taps is not None else None
+        self.delay = (len(taps) - 1) / 2 if taps is not None else None
+        self._state = None
+
+    def reset(self):
+        """
+        Resets the state of the filter, to filter a new stream.
+        """
+        self._state = None
+
+    def filter(self, block):
+        """
+        Filters the next block of samples.
+        :param block: EvenlySignal, MultiEvenly or array (N_SAMPLES or N_SAMPLES x N_CH) of the next samples
+        :return: The filtered block, of the same type of block
+        """
+        values = _np.asarray(block, dtype=float)
+        if isinstance(block, _EvenlySignal):
+            assert block.get_sampling_freq() == self._sampling_freq, \
+                "The sampling frequency of the block differs from the one of the filter"
+        if len(values) == 0:
+            return block
+
+        if self._sos is not None:
+            if self._state is None:
+                zi = _sosfilt_zi(self._sos)
+                self._state = zi.reshape(zi.shape + (1,) * (values.ndim - 1)) * values[0]
+            out, self._state = _sosfilt(self._sos, values, axis=0, zi=self._state)
+        else:
+            if self._state is None:
+                self._state = _np.repeat(values[:1], len(self._taps) - 1, axis=0)
+            x = _np.concatenate([self._state, values], axis=0)
+            out = _fast_convolve(x, self._taps, mode='valid')
+            self._state = x[len(x) - len(self._taps) + 1:]
+
+        return block.clone_properties(out) if isinstance(block, _EvenlySignal) else out
+
+
 class IIRFilter(_Filter):
     """
     Filter the input signal using an Infinite Impulse Response filter.
@@ -103,31 +246,44 @@ class IIRFilter(_Filter):
             "Filter type must be in ['butter', 'cheby1', 'cheby2', 'ellip', 'bessel']"
         _Filter.__init__(self, fp=fp, fs=fs, loss=loss, att=att, ftype=ftype)
 
+    _channel_vectorized = True
+
+    @classmethod
+    def design(cls, fsamp, params, output="ba"):
+        """
+        Designs the filter for the sampling frequency.
+        :param output: 'ba' (numerator, denominator) or 'sos' (second-order sections)
+        :return: The coefficients, as returned by scipy.signal.iirdesign
+        """
+        fp, fs, loss, att, ftype = params["fp"], params["fs"], params["loss"], params["att"], params["ftype"]
+        nyq = 0.5 * fsamp
+        wp = _np.array(fp) / nyq
+        ws = _np.array(fs) / nyq
+        key = ('iir', ftype, _freqs_key(fp), _freqs_key(fs), loss, att, fsamp, output)
+        return FilterDesignCache.get(key, lambda: _filter_design.iirdesign(wp, ws, loss, att, ftype=ftype,
+                                                                           output=output))
+
+    def stream(self, sampling_freq):
+        """
+        Returns a FilterStream to filter blocks of samples at the given sampling frequency, using second-order
+        sections for numerical stability.
+        """
+        return FilterStream(sampling_freq, sos=self.design(sampling_freq, self._params, output="sos"))
+
     @classmethod
     def algorithm(cls, signal, params):
         fsamp = signal.get_sampling_freq()
-        fp, fs, loss, att, ftype = params["fp"], params["fs"], params["loss"], params["att"], params["ftype"]
 
         if isinstance(signal, _UnevenlySignal):
             cls.warn('Filtering Unevenly signal is undefined. Returning original signal.')
             return signal
 
-        nyq = 0.5 * fsamp
-        fp = _np.array(fp)
-        fs = _np.array(fs)
-
-        wp = fp / nyq
-        ws = fs / nyq
         # noinspection PyTupleAssignmentBalance
-        b, a = _filter_design.iirdesign(wp, ws, loss, att, ftype=ftype, output="ba")
+        b, a = cls.design(fsamp, params, output="ba")
 
-        sig_filtered = signal.clone_properties(_filtfilt(b, a, signal.get_values()))
+        sig_filtered = signal.clone_properties(_filtfilt(b, a, signal.get_values(), axis=0))
 
-        if _np.isnan(sig_filtered[0]):
-            cls.warn('Filter parameters allow no solution. Returning original signal.')
-            return signal
-        else:
-            return sig_filtered
+        return _check_solution(cls, signal, sig_filtered)
 
     @_abstract
     def plot(self):
@@ -172,53 +328,72 @@ class FIRFilter(_Filter):
             "Window type must be in ['hamming']"
         _Filter.__init__(self, fp=fp, fs=fs, loss=loss, att=att, wtype=wtype)
 
+    _channel_vectorized = True
+
     @classmethod
-    def algorithm(cls, signal, params):
-        fsamp = signal.get_sampling_freq()
+    def design(cls, fsamp, params):
+        """
+        Designs the filter for the sampling frequency.
+        :return: The taps of the filter (odd number), as returned by scipy.signal.firwin
+        """
         fp, fs, loss, att, wtype = params["fp"], params["fs"], params["loss"], params["att"], params["wtype"]
+        key = ('fir', wtype, _freqs_key(fp), _freqs_key(fs), loss, att, fsamp, 'taps')
+        return FilterDesignCache.get(key, lambda: cls._design(fsamp, fp, fs, loss, att, wtype))
 
-        if isinstance(signal, _UnevenlySignal):
-            cls.warn('Filtering Unevenly signal is undefined. Returning original signal.')
-            return signal
+    @classmethod
+    def design_fft(cls, fsamp, params, nfft):
+        """
+        Returns the real FFT (numpy.fft.rfft) on nfft points of the taps of the filter (see design), to convolve in
+        the frequency domain.
+        """
+        fp, fs, loss, att, wtype = params["fp"], params["fs"], params["loss"], params["att"], params["wtype"]
+        key = ('fir', wtype, _freqs_key(fp), _freqs_key(fs), loss, att, fsamp, 'rfft', nfft)
+        return FilterDesignCache.get(key, lambda: _np.fft.rfft(cls.design(fsamp, params), nfft))
 
+    @staticmethod
+    def _design(fsamp, fp, fs, loss, att, wtype):
         fp = _np.array(fp)
         fs = _np.array(fs)
-        
+
         if att>0:
             att = -att
         d1 = 10**(loss/10)
         d2 = 10**(att/10)
         Dsamp = _np.min(abs(fs-fp))/fsamp
-        
 
         # from https://dsp.stackexchange.com/questions/31066/how-many-taps-does-an-fir-filter-need
         N = int(2/3*_np.log10(1/(10*d1*d2))*fsamp/Dsamp)
-                
-        pass_zero=True
-                  
-        if isinstance(fp, Sequence):
-            if fp[0]>fs[0]:
-                pass_zero=False
-        else:    
-            if fp[0]>fs[0]:
-                pass_zero=False
-        
-            
-        
+
+        pass_zero = not _np.atleast_1d(fp)[0] > _np.atleast_1d(fs)[0]
+
         nyq = 0.5 * fsamp
-        fp = _np.array(fp)
         wp = fp / nyq
-        
+
         if N%2 ==0:
             N+=1
-        b = _firwin(N, wp, width=Dsamp, window=wtype, pass_zero=pass_zero)
-        sig_filtered = signal.clone_properties(_convolve(signal.get_values(), b, mode='same'))
+        return _firwin(N, wp, width=Dsamp, window=wtype, pass_zero=pass_zero)
+
+    def stream(self, sampling_freq):
+        """
+        Returns a FilterStream to filter blocks of samples at the given sampling frequency. The output is delayed by
+        (number of taps - 1) / 2 samples.
+        """
+        return FilterStream(sampling_freq, taps=self.design(sampling_freq, self._params))
+
+    @classmethod
+    def algorithm(cls, signal, params):
+        fsamp = signal.get_sampling_freq()
 
-        if _np.isnan(sig_filtered[0]):
-            cls.warn('Filter parameters allow no solution. Returning original signal.')
+        if isinstance(signal, _UnevenlySignal):
+            cls.warn('Filtering Unevenly signal is undefined. Returning original signal.')
             return signal
-        else:
-            return sig_filtered
+
+        b = cls.design(fsamp, params)
+        sig_filtered = signal.clone_properties(_fast_convolve(signal.get_values(), b, mode='same',
+                                                             kernel_fft=lambda nfft: cls.design_fft(fsamp, params,
+                                                                                                    nfft)))
+
+        return _check_solution(cls, signal, sig_filtered)
 
     @_abstract
     def plot(self):
@@ -263,76 +438,116 @@ class KalmanFilter(_Filter):
 
 ############
 class ImputeNAN(_Filter):
-    def __init__(self, win_len=5, allnan='nan'):
+    """
+    Fills the gaps (runs of NaNs) of the signal with the regression line of the valid samples in the windows before
+    and after each gap, plus gaussian noise with the smallest standard deviation of the two windows.
+
+    Optional parameters
+    -------------------
+    win_len : float, >0, default = 5
+        Total length (seconds) of the windows before and after the gaps
+    allnan : str, default = 'nan'
+        Output if all the samples are NaN: 'nan' (the signal is returned) or 'zeros'
+    seed : int, default = None
+        Seed of the random generator of the noise, for a reproducible imputation
+
+    Returns
+    -------
+    signal : EvenlySignal
+        The signal without NaNs
+
+    Notes
+    -----
+    The gaps with 3 or fewer valid samples in the windows are filled with the mean of the signal. The windows and the
+    mean only include the original samples of the signal, not the ones imputed in the nearby gaps.
+    """
+
+    def __init__(self, win_len=5, allnan='nan', seed=None):
         assert win_len>0, "win_len should be >0"
         assert allnan in ['zeros', 'nan']
-        _Filter.__init__(self, win_len = win_len, allnan=allnan)
-        
+        _Filter.__init__(self, win_len = win_len, allnan=allnan, seed=seed)
+
+    @staticmethod
+    def _nanstd(idx, values, min_len=3):
+        # nanstd of each window, NaN for windows shorter than min_len
+        valid = ~_np.isnan(values)
+        n = _np.sum(valid, axis=1)
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            mean = _np.sum(_np.where(valid, values, 0), axis=1) / n
+            std = _np.sqrt(_np.sum(_np.where(valid, (values - mean[:, None]) ** 2, 0), axis=1) / n)
+        std[_np.sum(idx >= 0, axis=1) < min_len] = _np.nan
+        return std
+
     @classmethod
     def algorithm(cls, signal, params):
-        def group_consecutives(vals, step=1):
-            """Return list of consecutive lists of numbers from vals (number list)."""
-            run = []
-            result = [run]
-            expect = None
-            for v in vals:
-                if (v == expect) or (expect is None):
-                    run.append(v)
-                else:
-                    run = [v]
-                    result.append(run)
-                expect = v + step
-            return result
-
-        #%
         win_len = params['win_len']*signal.get_sampling_freq()
         allnan = params['allnan']
-        
+        half = int(win_len / 2)
+
         s = signal.get_values().copy()
-        if _np.isnan(s).all():
+        is_nan = _np.isnan(s)
+        if is_nan.all():
             if allnan == 'nan':
                 return(signal)
             else:
                 s = _np.zeros_like(s)
                 s_out = signal.clone_properties(s)
                 return(s_out)
-        
-        idx_nan = _np.where(_np.isnan(s))[0]
-        segments = group_consecutives(idx_nan)
-
-        #%
-        if len(segments[0])>=1:
-            for i_seg, SEG in enumerate(segments):
-                idx_st = SEG[0]
-                idx_sp = SEG[-1]
-                idx_win_pre = _np.arange(-int(win_len/2), 0, 1)+idx_st
-                idx_win_pre = idx_win_pre[_np.where(idx_win_pre>0)[0]] #not before signal start
-
-                STD = []
-                if len(idx_win_pre)>=3:
-                    STD.append(_np.nanstd(s[idx_win_pre]))
-                
-                idx_win_post = _np.arange(0, int(win_len/2))+idx_sp+1
-                idx_win_post = idx_win_post[_np.where(idx_win_post<len(s))[0]]
-                
-                if len(idx_win_post)>=3:
-                    STD.append(_np.nanstd(s[idx_win_post]))
-                
-                if len(STD)>0 and not (_np.isnan(STD).all()):
-                    STD = _np.nanmin(STD)
-                else:
-                    STD = 0
-                    
-                idx_win = _np.hstack([idx_win_pre, idx_win_post]).astype(int)
-                idx_win = idx_win[_np.where(~_np.isnan(s[idx_win]))[0]] # remove nans
-                
-                if len(idx_win)>3:
-                    R = _stats.linregress(idx_win, s[idx_win])
-                    s_nan = _np.array(SEG)*R[0]+R[1] + _np.random.normal(scale=STD, size = len(SEG))
-                else:
-                    s_nan = _np.nanmean(s)*_np.ones(len(SEG))
-                s[SEG] = s_nan
-        
+
+        # gaps [starts, stops)
+        edges = _np.diff(_np.r_[0, is_nan.astype(_np.int8), 0])
+        starts = _np.flatnonzero(edges == 1)
+        stops = _np.flatnonzero(edges == -1)
+        lens = stops - starts
+        rng = _np.random.default_rng(params['seed'])
+        s_mean = _np.nanmean(s)
+
+        n = len(s)
+        offsets = _np.arange(half)
+        fill = _np.empty(_np.sum(lens))
+        i_fill = 0
+        # gaps in chunks, each with a matrix of the indices of its windows (-1 out of the signal)
+        chunk = max(1, 2 ** 20 // max(1, 2 * half))
+        for i_chunk in range(0, len(starts), chunk):
+            st = starts[i_chunk:i_chunk + chunk]
+            sp = stops[i_chunk:i_chunk + chunk]
+            idx_pre = st[:, None] - half + offsets
+            idx_pre[idx_pre <= 0] = -1  # not before signal start
+            idx_post = sp[:, None] + offsets
+            idx_post[idx_post >= n] = -1
+
+            std = []
+            for idx in [idx_pre, idx_post]:
+                values = _np.where(idx >= 0, s[idx], _np.nan)
+                std.append(cls._nanstd(idx, values))
+            std = _np.fmin(std[0], std[1])
+            std[_np.isnan(std)] = 0
+
+            # regression on the valid samples of both windows, x relative to the start of the gap
+            idx = _np.hstack([idx_pre, idx_post])
+            values = _np.where(idx >= 0, s[idx], _np.nan)
+            valid = ~_np.isnan(values)
+            n_valid = _np.sum(valid, axis=1)
+            x = _np.where(valid, idx - st[:, None], 0)
+            y = _np.where(valid, values, 0)
+            with _np.errstate(invalid='ignore', divide='ignore'):
+                x_mean = _np.sum(x, axis=1) / n_valid
+                y_mean = _np.sum(y, axis=1) / n_valid
+                x_c = _np.where(valid, x - x_mean[:, None], 0)
+                slope = _np.sum(x_c * (y - y_mean[:, None]), axis=1) / _np.sum(x_c ** 2, axis=1)
+            intercept = y_mean - slope * x_mean
+            regress = n_valid > 3
+
+            gap_lens = lens[i_chunk:i_chunk + chunk]
+            i_gap = _np.repeat(_np.arange(len(st)), gap_lens)
+            x_gap = _np.arange(len(i_gap)) - _np.repeat(_np.cumsum(gap_lens) - gap_lens, gap_lens)
+            fill_chunk = _np.where(regress[i_gap],
+                                   x_gap * slope[i_gap] + intercept[i_gap] + rng.normal(scale=std[i_gap]),
+                                   s_mean)
+            fill[i_fill:i_fill + len(fill_chunk)] = fill_chunk
+            i_fill += len(fill_chunk)
+
+        s[is_nan] = fill
         signal_out = signal.clone_properties(s)
         return(signal_out)
 
@@ -474,6 +689,8 @@ class ConvolutionalFilter(_Filter):
         assert irftype == 'custom' or win_len > 0, "Window length value should be positive"
         _Filter.__init__(self, irftype=irftype, win_len=win_len, irf=irf, normalize=normalize)
 
+    _channel_vectorized = True
+
     # TODO (Andrea): TEST normalization and results
     @classmethod
     def algorithm(cls, signal, params):
@@ -522,11 +739,10 @@ class ConvolutionalFilter(_Filter):
         if normalize:
             irf = irf / _np.sum(irf)
             
-        signal_ = _np.r_[_np.ones(n) * signal[0], signal, _np.ones(n) * signal[-1]]  # TESTME
-
-        signal_f = _np.convolve(signal_, irf, mode='same')
+        # the signal is extended by n samples at both ends, repeating the first and last ones
+        signal_f = _fast_convolve(signal.get_values(), irf, mode='same', pad=n)
 
-        signal_out = signal.clone_properties(signal_f[n:-n])
+        signal_out = signal.clone_properties(signal_f)
         return signal_out
 
     @classmethod
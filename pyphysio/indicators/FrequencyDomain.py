@@ -40,9 +40,17 @@ class InBand(_Indicator):
     def __init__(self, freq_min, freq_max, method, **kwargs):
         _Indicator.__init__(self, freq_min=freq_min, freq_max=freq_max, method=method, **kwargs)
 
+    @staticmethod
+    def _psd(params):
+        # the PSD does not depend on the band: same PSD for all the bands
+        return PSD(**{k: v for k, v in params.items() if k not in ['freq_min', 'freq_max', 'name']})
+
+    def get_intermediates(self):
+        return [InBand._psd(self._params)]
+
     @classmethod
     def algorithm(cls, data, params):
-        freq, spec = PSD(**params)(data)
+        freq, spec = InBand._psd(params).run_shared(data)
         # freq is sorted so
         i_min = _np.searchsorted(freq, params["freq_min"])
         i_max = _np.searchsorted(freq, params["freq_max"])
@@ -78,6 +86,9 @@ class PowerInBand(_Indicator):
     def __init__(self, freq_min, freq_max, method, **kwargs):
         _Indicator.__init__(self, freq_min=freq_min, freq_max=freq_max, method=method, **kwargs)
 
+    def get_intermediates(self):
+        return InBand(**self._params).get_intermediates()
+
     @classmethod
     def algorithm(cls, data, params):
         freq, powers = InBand(**params)(data)
@@ -112,9 +123,34 @@ class PeakInBand(_Indicator):
 
     def __init__(self, freq_min, freq_max, method, **kwargs):
         _Indicator.__init__(self, freq_min=freq_min, freq_max=freq_max, method=method, **kwargs)
+
+    def get_intermediates(self):
+        return InBand(**self._params).get_intermediates()
     
     @classmethod
     def algorithm(cls, data, params):
         freq, power = InBand(**params)(data)
         return freq[_np.argmax(power)]
 
+
+def band_powers(freqs, psd, bands):
+    """
+    Estimate the power in the frequency bands of many PSDs at once (as PowerInBand), with one matrix product.
+
+    Parameters
+    ----------
+    freqs : numpy array
+        Frequencies of the PSDs (see PSD.batch)
+    psd : numpy array
+        Power Spectrum Densities (N_SEGMENTS x N_FREQUENCIES)
+    bands : list
+        The (freq_min, freq_max) bounds of each band
+
+    Returns
+    -------
+    powers : numpy array
+        Power in each band of each PSD (N_SEGMENTS x N_BANDS)
+    """
+    freqs = _np.asarray(freqs)
+    masks = _np.array([(freqs >= freq_min) & (freqs < freq_max) for freq_min, freq_max in bands], dtype=float)
+    return _np.dot(psd, masks.T)
@@ -1,15 +1,23 @@
 # coding=utf-8
 from __future__ import division
 
-from ..BaseIndicator import Indicator as _Indicator
+from ..BaseIndicator import Indicator as _Indicator, Accumulator as _Accumulator
 from ..tools.Tools import Diff as _Diff
-from ..indicators.TimeDomain import Mean as _Mean, StDev as _StDev
-from scipy.spatial.distance import cdist as _cd
+from ..indicators.TimeDomain import StDev as _StDev, _DiffAccumulator
+from ..Utility import sliding_windows as _sliding_windows
+from scipy.spatial import cKDTree as _cKDTree
 import numpy as _np
 
 __author__ = 'AleB'
 
 
+class _PoincareSD1Accumulator(_DiffAccumulator):
+    def value(self):
+        if self._moments.n_nan > 0:
+            return _np.nan
+        return _np.sqrt(self._moments.var() / 2)
+
+
 class PoincareSD1(_Indicator):
     """
     Return the SD1 value of the Poincare' plot of input Inter Beat Intervals
@@ -35,6 +43,18 @@ class PoincareSD1(_Indicator):
         sd1 = _np.std((xd - yd) / _np.sqrt(2.0))
         return sd1
 
+    def accumulator(self, signal=None):
+        return _PoincareSD1Accumulator()
+
+
+class _PoincareSD2Accumulator(_PoincareSD1Accumulator):
+    # moments of the sums of consecutive samples
+    def _add_pair(self, x, y):
+        self._moments.add(x + y)
+
+    def _remove_pair(self, x, y):
+        self._moments.remove(x + y)
+
 
 class PoincareSD2(_Indicator):
     """
@@ -61,6 +81,9 @@ class PoincareSD2(_Indicator):
         sd2 = _np.std((xd + yd) / _np.sqrt(2.0))
         return sd2
 
+    def accumulator(self, signal=None):
+        return _PoincareSD2Accumulator()
+
 
 class PoincareSD1SD2(_Indicator):
     """
@@ -109,6 +132,29 @@ class PoinEll(_Indicator):
         return sd1 * sd2 * _np.pi
 
 
+class _NNxAccumulator(_Accumulator):
+    def __init__(self, threshold):
+        self._threshold = threshold
+        _Accumulator.__init__(self)
+
+    def _reset(self):
+        self._count = 0
+
+    def _add_pair(self, x, y):
+        self._count += (y - x) * 1000 > self._threshold
+
+    def _remove_pair(self, x, y):
+        self._count -= (y - x) * 1000 > self._threshold
+
+    def value(self):
+        return float(self._count)
+
+
+class _PNNxAccumulator(_NNxAccumulator):
+    def value(self):
+        return self._count / float(len(self)) if len(self) > 0 else _np.nan
+
+
 class PNNx(_Indicator):
     """
     Computes the relative frequency of pairs of consecutive samples s1, s2 such that s1-s2 >= 'threshold' in
@@ -132,6 +178,9 @@ class PNNx(_Indicator):
     def algorithm(cls, data, params):
         return NNx.algorithm(data, params) / float(len(data))
 
+    def accumulator(self, signal=None):
+        return _PNNxAccumulator(self.get('threshold'))
+
 
 class NNx(_Indicator):
     """
@@ -153,6 +202,9 @@ class NNx(_Indicator):
         diff = _Diff()(signal)
         return sum(1.0 for x in diff * 1000 if x > th)
 
+    def accumulator(self, signal=None):
+        return _NNxAccumulator(self.get('threshold'))
+
 
 class _Embed(_Indicator):
     def __init__(self, dimension, **kwargs):
@@ -169,15 +221,32 @@ class _Embed(_Indicator):
         # t = params['delay']
         num = len(signal) - n + 1
         if num > 0:
-            emb = _np.zeros([num, n])
-            # 2>3 xrange>range
-            for i in range(num):
-                emb[i, :] = signal[i:i + n]
-            return emb
+            return _np.array(_sliding_windows(_np.asarray(signal, dtype=float), n))
         else:
             return []
 
 
+def _count_neighbours(emb, r):
+    """
+    Counts, for each embedded vector, the vectors (itself included) within Chebyshev distance r, using a KD-tree.
+    As with scipy's cdist, the NaN coordinates are ignored by the distance: the few vectors with NaNs are compared
+    with all the others one at a time.
+    """
+    counts = _np.zeros(len(emb), dtype=int)
+    if not r >= 0:
+        return counts
+    valid = ~_np.isnan(emb).any(axis=1)
+    if _np.any(valid):
+        tree = _cKDTree(emb[valid])
+        counts[valid] = tree.query_ball_point(emb[valid], r, p=_np.inf, return_length=True)
+    for i in _np.flatnonzero(~valid):
+        dist = _np.abs(emb - emb[i])
+        close = _np.max(_np.where(_np.isnan(dist), 0, dist), axis=1) <= r
+        counts[i] = _np.sum(close)
+        counts[valid] += close[valid]
+    return counts
+
+
 class ApproxEntropy(_Indicator):
     """
     Calculates Approximate Entropy
@@ -209,20 +278,9 @@ class ApproxEntropy(_Indicator):
             card_elem_m1 = uj_m1.shape[0]
 
             r = r * _np.std(data)
-            d_m = _cd(uj_m, uj_m, 'chebyshev')
-            d_m1 = _cd(uj_m1, uj_m1, 'chebyshev')
 
-            cmr_m_ap_en = _np.zeros(card_elem_m)
-            # 2>3 xrange>range
-            for i in range(card_elem_m):
-                vector = d_m[i]
-                cmr_m_ap_en[i] = float(sum(1 for i in vector if i <= r)) / card_elem_m
-
-            cmr_m1_ap_en = _np.zeros(card_elem_m1)
-            # 2>3 xrange>range
-            for i in range(card_elem_m1):
-                vector = d_m1[i]
-                cmr_m1_ap_en[i] = float(sum(1 for i in vector if i <= r)) / card_elem_m1
+            cmr_m_ap_en = _count_neighbours(uj_m, r) / card_elem_m
+            cmr_m1_ap_en = _count_neighbours(uj_m1, r) / card_elem_m1
 
             phi_m = _np.sum(_np.log(cmr_m_ap_en)) / card_elem_m
             phi_m1 = _np.sum(_np.log(cmr_m1_ap_en)) / card_elem_m1
@@ -263,20 +321,9 @@ class SampleEntropy(_Indicator):
 
             r = r * _StDev()(data)
 
-            d_m = _cd(uj_m, uj_m, 'chebyshev')
-            d_m1 = _cd(uj_m1, uj_m1, 'chebyshev')
-
-            cmr_m_sa_mp_en = _np.zeros(num_elem_m)
-            # 2>3 xrange>range
-            for i in range(num_elem_m):
-                vector = d_m[i]
-                cmr_m_sa_mp_en[i] = (sum(1 for i in vector if i <= r) - 1) / (num_elem_m - 1)
-
-            cmr_m1_sa_mp_en = _np.zeros(num_elem_m1)
-            # 2>3 xrange>range
-            for i in range(num_elem_m1):
-                vector = d_m1[i]
-                cmr_m1_sa_mp_en[i] = (sum(1 for i in vector if i <= r) - 1) / (num_elem_m1 - 1)
+            # matches of each vector, itself excluded
+            cmr_m_sa_mp_en = (_count_neighbours(uj_m, r) - 1) / (num_elem_m - 1)
+            cmr_m1_sa_mp_en = (_count_neighbours(uj_m1, r) - 1) / (num_elem_m1 - 1)
 
             cm = _np.sum(cmr_m_sa_mp_en) / num_elem_m
             cm1 = _np.sum(cmr_m1_sa_mp_en) / num_elem_m1
@@ -284,6 +331,66 @@ class SampleEntropy(_Indicator):
             return _np.log(cm / cm1)
 
 
+def dfa_fluctuation(x, scales):
+    """
+    Computes the fluctuation function of the De-trended Fluctuation Analysis: for each scale n the integrated series
+    is split in boxes of n samples, the linear trend of each box is removed and F(n) is the root mean square of the
+    residuals. The boxes of each scale are stacked in a (n_boxes x n) matrix and all the linear fits are solved at
+    once in closed form.
+    :param x: Series to analyse (e.g. the IBI)
+    :param scales: Lengths of the boxes (samples, >= 2)
+    :return: Array of F(n), one for each scale
+    """
+    x = _np.asarray(x, dtype=float)
+    y = _np.cumsum(x - _np.mean(x))
+    f = _np.zeros(len(scales))  # f(n) of different given box length n
+    for i, n in enumerate(scales):
+        n = int(n)
+        n_boxes = (len(x) - 1) // n  # the boxes end before the last sample
+        boxes = y[:n_boxes * n].reshape(n_boxes, n)
+        t = _np.arange(n) - (n - 1) / 2
+        z = boxes - _np.mean(boxes, axis=1, keepdims=True)
+        # residual of the least squares line of each box
+        residuals = _np.sum(z * z, axis=1) - _np.dot(z, t) ** 2 / _np.dot(t, t)
+        f[i] = _np.sum(residuals) / ((len(x) / n) * n)
+    return _np.sqrt(f)
+
+
+class DFA(_Indicator):
+    """
+    Calculate the scaling exponent alpha of the De-trended Fluctuation Analysis: the slope of log F(n) against log n
+    for the box lengths n in min_box, min_box + step, ..., max_box (see dfa_fluctuation).
+
+    Optional parameters
+    -------------------
+    min_box : int, >=2, default=4
+        Length of the shortest box (samples)
+    max_box : int, >=min_box, default=16
+        Length of the longest box (samples); shorter series return nan
+    step : int, >0, default=4
+        Step between the lengths of the boxes (samples)
+
+    Returns
+    -------
+    alpha : float
+        Scaling exponent of the De-trended Fluctuation Analysis
+    """
+
+    def __init__(self, min_box=4, max_box=16, step=4, **kwargs):
+        assert min_box >= 2, "Parameter min_box should be >= 2"
+        assert max_box >= min_box, "Parameter max_box should be >= min_box"
+        assert step > 0, "Parameter step should be > 0"
+        _Indicator.__init__(self, min_box=min_box, max_box=max_box, step=step, **kwargs)
+
+    @classmethod
+    def algorithm(cls, data, params):
+        if len(data) < params['max_box']:
+            return _np.nan
+        l = _np.arange(params['min_box'], params['max_box'] + 1, params['step'])
+        f = dfa_fluctuation(data, l)
+        return _np.linalg.lstsq(_np.vstack([_np.log(l), _np.ones(len(l))]).T, _np.log(f), rcond=None)[0][0]
+
+
 class DFAShortTerm(_Indicator):
     """
     Calculate the alpha1 (short term) component index of the De-trended Fluctuation Analysis.
@@ -299,29 +406,7 @@ class DFAShortTerm(_Indicator):
 
     @classmethod
     def algorithm(cls, data, params):
-
-        x = data
-        if len(x) < 16:
-            return _np.nan
-        else:
-            ave = float(_Mean()(x))
-            y = _np.cumsum(x).astype(float)
-            y -= ave
-            l = _np.arange(4, 17, 4)
-            f = _np.zeros(len(l))  # f(n) of different given box length n
-            # 2>3 xrange>range
-            for i in range(0, len(l)):
-                n = int(l[i])  # for each box length l[i]
-                # 2>3 xrange>range
-                for j in range(0, len(x), n):  # for each box
-                    if j + n < len(x):
-                        c = range(j, j + n)
-                        c = _np.vstack([c, _np.ones(n)]).T  # coordinates of time in the box
-                        z = y[j:j + n]  # the value of example_data in the box
-                        f[i] += _np.linalg.lstsq(c, z)[1]  # add residue in this box
-                f[i] /= ((len(x) / n) * n)
-            f = _np.sqrt(f)
-            return _np.linalg.lstsq(_np.vstack([_np.log(l), _np.ones(len(l))]).T, _np.log(f))[0][0]
+        return DFA.algorithm(data, {'min_box': 4, 'max_box': 16, 'step': 4})
 
 
 class DFALongTerm(_Indicator):
@@ -339,27 +424,4 @@ class DFALongTerm(_Indicator):
 
     @classmethod
     def algorithm(cls, data, params):
-        x = data
-        if len(x) < 64:
-            return _np.nan
-        else:
-            ave = float(_Mean()(x))
-            y = _np.cumsum(x).astype(float)
-            y -= ave
-            l_max = _np.min([64, len(x)])
-            l = _np.arange(16, l_max + 1, 4)
-            f = _np.zeros(len(l))  # f(n) of different given box length n
-            # 2>3 xrange>range
-            for i in range(0, len(l)):
-                n = int(l[i])  # for each box length l[i]
-                # 2>3 xrange>range
-                for j in range(0, len(x), n):  # for each box
-                    if j + n < len(x):
-                        c = range(j, j + n)
-                        c = _np.vstack([c, _np.ones(n)]).T  # coordinates of time in the box
-                        z = y[j:j + n]  # the value of example_data in the box
-                        f[i] += _np.linalg.lstsq(c, z)[1]  # add residue in this box
-                f[i] /= ((len(x) / n) * n)
-            f = _np.sqrt(f)
-
-            return _np.linalg.lstsq(_np.vstack([_np.log(l), _np.ones(len(l))]).T, _np.log(f))[0][0]
+        return DFA.algorithm(data, {'min_box': 16, 'max_box': 64, 'step': 4})
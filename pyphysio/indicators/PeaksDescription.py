@@ -21,6 +21,9 @@ class _Peaks(_Indicator):
         assert delta > 0, 'Parameter delta, i.e. amplitude of the minimum peak, has to be > 0'
         _Indicator.__init__(self, delta=delta, **kwargs)
 
+    def get_intermediates(self):
+        return [_PeakDetection(delta=self._params['delta'])]
+
     @classmethod
     @_abstract
     def algorithm(cls, data, params):
@@ -49,7 +52,7 @@ class PeaksMax(_Peaks):
     def algorithm(cls, signal, params):
         delta = params['delta']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
 
         if len(idx_maxs) == 0:
             cls.warn("No peak found")
@@ -80,7 +83,7 @@ class PeaksMin(_Peaks):
     def algorithm(cls, data, params):
         delta = params['delta']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(data)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(data)
 
         if len(idx_maxs) == 0:
             cls.warn("No peak found, returning numpy.nan")
@@ -111,7 +114,7 @@ class PeaksMean(_Peaks):
     def algorithm(cls, data, params):
         delta = params['delta']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(data)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(data)
 
         if len(idx_maxs) == 0:
             cls.warn("No peak found")
@@ -142,7 +145,7 @@ class PeaksNum(_Peaks):
     def algorithm(cls, signal, params):
         delta = params['delta']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
 
         if len(idx_maxs) == 0:
             cls.warn("No peak found")
@@ -196,12 +199,12 @@ class DurationMin(_PeaksInterval):
         win_pre = params['win_pre']
         win_post = params['win_post']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
         if len(idx_maxs) == 0:
             cls.warn("No peaks found")
             return _np.nan
 
-        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post)(signal)
+        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post).run_shared(signal)
 
         if len(idxs_start) == 0:
             cls.warn("Unable to detect the start of the peaks")
@@ -240,12 +243,12 @@ class DurationMax(_PeaksInterval):
         win_pre = params['win_pre']
         win_post = params['win_post']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
         if len(idx_maxs) == 0:
             cls.warn("No peaks found")
             return _np.nan
 
-        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post)(signal)
+        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post).run_shared(signal)
 
         if len(idxs_start) == 0:
             cls.warn("Unable to detect the start of the peaks")
@@ -283,12 +286,12 @@ class DurationMean(_PeaksInterval):
         win_pre = params['win_pre']
         win_post = params['win_post']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
         if len(idx_maxs) == 0:
             cls.warn("No peaks found")
             return _np.nan
 
-        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post)(signal)
+        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post).run_shared(signal)
 
         if len(idxs_start) == 0:
             cls.warn("Unable to detect the start of the peaks")
@@ -326,12 +329,12 @@ class SlopeMin(_PeaksInterval):
         win_pre = params['win_pre']
         win_post = params['win_post']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
         if len(idx_maxs) == 0:
             cls.warn("No peaks found")
             return _np.nan
 
-        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post)(signal)
+        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post).run_shared(signal)
         
         if len(idxs_start) == 0:
             cls.warn("Unable to detect the start of the peaks")
@@ -369,12 +372,12 @@ class SlopeMax(_PeaksInterval):
         win_pre = params['win_pre']
         win_post = params['win_post']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
         if len(idx_maxs) == 0:
             cls.warn("No peaks found")
             return _np.nan
 
-        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post)(signal)
+        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post).run_shared(signal)
         
         if len(idxs_start) == 0:
             cls.warn("Unable to detect the start of the peaks")
@@ -412,12 +415,12 @@ class SlopeMean(_PeaksInterval):
         win_pre = params['win_pre']
         win_post = params['win_post']
 
-        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta)(signal)
+        idx_maxs, idx_mins, val_maxs, val_mins = _PeakDetection(delta=delta).run_shared(signal)
         if len(idx_maxs) == 0:
             cls.warn("No peaks found")
             return _np.nan
 
-        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post)(signal)
+        idxs_start, idxs_stop = _PeakSelection(indices=idx_maxs, win_pre=win_pre, win_post=win_post).run_shared(signal)
         if len(idxs_start) == 0:
             cls.warn("Unable to detect the start of the peaks")
             return _np.nan
@@ -3,7 +3,10 @@ from __future__ import division
 
 import numpy as _np
 
-from ..BaseIndicator import Indicator as _Indicator
+from ..BaseIndicator import Indicator as _Indicator, Accumulator as _Accumulator
+from ..Utility import RunningMoments as _RunningMoments, windows_nanmoments as _windows_nanmoments, \
+    windows_nanmax as _windows_nanmax, windows_nanmin as _windows_nanmin
+from collections import deque as _deque
 from ..tools.Tools import Diff as _Diff
 from ..Signal import EvenlySignal as _EvenlySignal, Signal as _Signal
 
@@ -11,6 +14,24 @@ from ..Signal import EvenlySignal as _EvenlySignal, Signal as _Signal
 __author__ = 'AleB'
 
 
+class _MeanAccumulator(_Accumulator):
+    def _reset(self):
+        self._moments = _RunningMoments()
+
+    def _add(self, x):
+        self._moments.add(x)
+
+    def _remove(self, x):
+        self._moments.remove(x)
+
+    def value(self):
+        return self._moments.mean()
+
+    def windows(self, values, starts, stops):
+        count, mean, var = _windows_nanmoments(values, starts, stops)
+        return mean
+
+
 class Mean(_Indicator):
     """
     Compute the arithmetic mean of the signal, ignoring any NaNs.
@@ -18,9 +39,68 @@ class Mean(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
-        return _np.nanmean(data.get_values())
+        return _np.nanmean(data.get_values(), axis=0)
+
+    def accumulator(self, signal=None):
+        return _MeanAccumulator()
+
+
+class _ExtremesAccumulator(_Accumulator):
+    # monotonic deques of (position, value) of the candidate maxima and minima, NaNs are skipped
+    def _reset(self):
+        self._maxima = _deque()
+        self._minima = _deque()
+        self._n_in = self._n_out = 0
+
+    def _add(self, x):
+        if not _np.isnan(x):
+            while len(self._maxima) > 0 and self._maxima[-1][1] <= x:
+                self._maxima.pop()
+            self._maxima.append((self._n_in, x))
+            while len(self._minima) > 0 and self._minima[-1][1] >= x:
+                self._minima.pop()
+            self._minima.append((self._n_in, x))
+        self._n_in += 1
+
+    def _remove(self, x):
+        for extremes in self._maxima, self._minima:
+            if len(extremes) > 0 and extremes[0][0] == self._n_out:
+                extremes.popleft()
+        self._n_out += 1
+
+    def _max(self):
+        return self._maxima[0][1] if len(self._maxima) > 0 else _np.nan
+
+    def _min(self):
+        return self._minima[0][1] if len(self._minima) > 0 else _np.nan
+
+
+class _MinAccumulator(_ExtremesAccumulator):
+    def value(self):
+        return self._min()
+
+    def windows(self, values, starts, stops):
+        return _windows_nanmin(values, starts, stops)
+
+
+class _MaxAccumulator(_ExtremesAccumulator):
+    def value(self):
+        return self._max()
+
+    def windows(self, values, starts, stops):
+        return _windows_nanmax(values, starts, stops)
+
+
+class _RangeAccumulator(_ExtremesAccumulator):
+    def value(self):
+        return self._max() - self._min()
+
+    def windows(self, values, starts, stops):
+        return _windows_nanmax(values, starts, stops) - _windows_nanmin(values, starts, stops)
 
 
 class Min(_Indicator):
@@ -30,9 +110,14 @@ class Min(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
-        return _np.nanmin(data.get_values())
+        return _np.nanmin(data.get_values(), axis=0)
+
+    def accumulator(self, signal=None):
+        return _MinAccumulator()
 
 
 class Max(_Indicator):
@@ -42,9 +127,14 @@ class Max(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
-        return _np.nanmax(data.get_values())
+        return _np.nanmax(data.get_values(), axis=0)
+
+    def accumulator(self, signal=None):
+        return _MaxAccumulator()
 
 
 class Range(_Indicator):
@@ -54,10 +144,15 @@ class Range(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
         return Max()(data) - Min()(data)
 
+    def accumulator(self, signal=None):
+        return _RangeAccumulator()
+
 
 class Median(_Indicator):
     """
@@ -66,9 +161,20 @@ class Median(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
-        return _np.median(data.get_values())
+        return _np.median(data.get_values(), axis=0)
+
+
+class _StDevAccumulator(_MeanAccumulator):
+    def value(self):
+        return _np.sqrt(self._moments.var())
+
+    def windows(self, values, starts, stops):
+        count, mean, var = _windows_nanmoments(values, starts, stops)
+        return _np.sqrt(var)
 
 
 class StDev(_Indicator):
@@ -78,9 +184,35 @@ class StDev(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
-        return _np.nanstd(data.get_values())
+        return _np.nanstd(data.get_values(), axis=0)
+
+    def accumulator(self, signal=None):
+        return _StDevAccumulator()
+
+
+class _SumAccumulator(_MeanAccumulator):
+    def value(self):
+        return self._moments.mean() * self._moments.n if self._moments.n > 0 else 0.
+
+    def windows(self, values, starts, stops):
+        count, mean, var = _windows_nanmoments(values, starts, stops)
+        return _np.where(count > 0, mean * count, 0.)
+
+
+class _AUCAccumulator(_SumAccumulator):
+    def __init__(self, sampling_freq):
+        self._sampling_freq = sampling_freq
+        _SumAccumulator.__init__(self)
+
+    def value(self):
+        return (1. / self._sampling_freq) * _SumAccumulator.value(self)
+
+    def windows(self, values, starts, stops):
+        return (1. / self._sampling_freq) * _SumAccumulator.windows(self, values, starts, stops)
 
 
 class Sum(_Indicator):
@@ -90,9 +222,14 @@ class Sum(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, data, params):
-        return _np.nansum(data.get_values())
+        return _np.nansum(data.get_values(), axis=0)
+
+    def accumulator(self, signal=None):
+        return _SumAccumulator()
 
 
 class AUC(_Indicator):
@@ -102,12 +239,20 @@ class AUC(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, signal, params):
         if isinstance(signal, _Signal) and not isinstance(signal, _EvenlySignal):
             cls.warn('Calculating Area Under the Curve of an Unevenly signal!')
         fsamp = signal.get_sampling_freq()
         return (1. / fsamp) * Sum()(signal)
+
+    def accumulator(self, signal=None):
+        assert signal is not None, "The signal is needed to get the sampling frequency"
+        if isinstance(signal, _Signal) and not isinstance(signal, _EvenlySignal):
+            self.warn('Calculating Area Under the Curve of an Unevenly signal!')
+        return _AUCAccumulator(signal.get_sampling_freq())
     
 class DetrendedAUC(_Indicator):
     """
@@ -116,6 +261,8 @@ class DetrendedAUC(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, signal, params):
         if isinstance(signal, _Signal) and not isinstance(signal, _EvenlySignal):
@@ -124,6 +271,8 @@ class DetrendedAUC(_Indicator):
         
         #detrend
         t_signal = signal.get_times()
+        if signal.ndim > 1:
+            t_signal = t_signal[:, None]
         intercept = signal[0]
         coeff = (signal[-1] - signal[0]) / signal.get_duration()
         baseline = coeff*(t_signal - t_signal[0]) + intercept
@@ -132,6 +281,26 @@ class DetrendedAUC(_Indicator):
         return (1. / fsamp) * Sum()(signal_)
 
 
+class _DiffAccumulator(_Accumulator):
+    # moments of the 1st order discrete differences
+    def _reset(self):
+        self._moments = _RunningMoments()
+
+    def _add_pair(self, x, y):
+        self._moments.add(y - x)
+
+    def _remove_pair(self, x, y):
+        self._moments.remove(y - x)
+
+
+class _RMSSDAccumulator(_DiffAccumulator):
+    def value(self):
+        # mean of the squares = variance + squared mean, NaNs propagate
+        if self._moments.n_nan > 0:
+            return _np.nan
+        return _np.sqrt(self._moments.var() + self._moments.mean() ** 2)
+
+
 class RMSSD(_Indicator):
     """
     Compute the square root of the mean of the squared 1st order discrete differences.
@@ -139,10 +308,20 @@ class RMSSD(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, signal, params):
         diff = _Diff()(signal)
-        return _np.sqrt(_np.mean(_np.power(diff.get_values(), 2)))
+        return _np.sqrt(_np.mean(_np.power(diff.get_values(), 2), axis=0))
+
+    def accumulator(self, signal=None):
+        return _RMSSDAccumulator()
+
+
+class _SDSDAccumulator(_DiffAccumulator):
+    def value(self):
+        return _np.sqrt(self._moments.var())
 
 
 class SDSD(_Indicator):
@@ -152,11 +331,16 @@ class SDSD(_Indicator):
     def __init__(self, **kwargs):
         _Indicator.__init__(self, **kwargs)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, signal, params):
         diff = _Diff()(signal)
         return StDev()(diff)
 
+    def accumulator(self, signal=None):
+        return _SDSDAccumulator()
+
 # TODO: FIX Histogram missing
 class Triang(_Indicator):
     """
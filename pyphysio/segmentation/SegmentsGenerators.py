@@ -231,6 +231,38 @@ class FixedSegments(_SegmentsWithLabelSignal):
             raise StopIteration()
         return b, e
 
+    def get_segments_times(self):
+        """
+        Returns the begin and end times of all the segments at once, as arrays, without creating the segments.
+        Not available with the labels.
+        """
+        assert self._signal is not None, "No signal specified for " + self.__class__.__name__
+        assert self._params['labels'] is None, "Not available with the labels"
+        step = self._params['step']
+        width = self._params['width'] if self._params['width'] is not None else step
+        t_first = self._params['start'] if self._params['start'] is not None else self._signal.get_start_time()
+        t_start = self._signal.get_start_time()
+        t_end = self._signal.get_end_time()
+
+        # the same sums of next_times
+        n = max(int(_np.ceil((t_end - t_first) / step)), 0) + 2
+        begins = _np.cumsum(_np.r_[t_first, _np.repeat(step, n)])
+        while begins[-1] < t_end:
+            n *= 2
+            begins = _np.cumsum(_np.r_[t_first, _np.repeat(step, n)])
+        begins = begins[:_np.argmax(begins >= t_end)]
+        ends = begins + width
+
+        # check_drop_and_range
+        keep = ends >= t_start
+        if self._params['drop_mixed'] or self._params['drop_cut']:
+            keep &= begins >= t_start
+        if self._params['drop_cut']:
+            keep &= ends <= t_end
+        begins = _np.maximum(begins[keep], t_start)
+        ends = _np.minimum(ends[keep], t_end)
+        return begins, ends
+
 class CustomSegments(_SegmentsWithLabelSignal):
     """
     Custom segments iterator, specifying an array of begin times and an array of end times.
@@ -0,0 +1,48 @@
+# coding=utf-8
+from __future__ import division
+from __future__ import print_function
+
+from time import perf_counter as _clock
+from . import ph, np
+
+__author__ = 'aleb'
+
+# Benchmark of the PeakDetection engines.
+# Run with: python -m pyphysio.tests.bench_peak_detection
+
+FSAMP = 1000
+SIZES = [10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8]
+# the 'loop' engine takes minutes above this size
+MAX_SIZE_LOOP = 10 ** 7
+
+
+def make_signal(n_samples):
+    np.random.seed(1234)
+    t = np.arange(n_samples) / FSAMP
+    values = np.sin(2 * np.pi * 1.2 * t) + 0.1 * np.random.randn(n_samples)
+    return ph.EvenlySignal(values, sampling_freq=FSAMP, signal_type='ECG')
+
+
+def bench(sizes=SIZES, max_size_loop=MAX_SIZE_LOOP):
+    print("%12s %12s %12s %8s" % ('samples', 'loop [s]', 'vector [s]', 'peaks'))
+    for n in sizes:
+        signal = make_signal(n)
+        delta = 0.5
+        t0 = _clock()
+        maxp, minp, maxv, minv = ph.PeakDetection(delta=delta, refractory=0.3)(signal)
+        t_vec = _clock() - t0
+
+        if n <= max_size_loop:
+            t0 = _clock()
+            maxp_l, minp_l, maxv_l, minv_l = ph.PeakDetection(delta=delta, refractory=0.3, engine='loop')(signal)
+            t_loop = _clock() - t0
+            assert np.array_equal(maxp, maxp_l) and np.array_equal(minp, minp_l)
+            t_loop = "%12.3f" % t_loop
+        else:
+            t_loop = "%12s" % '-'
+
+        print("%12d %s %12.3f %8d" % (n, t_loop, t_vec, len(maxp)))
+
+
+if __name__ == '__main__':
+    bench()
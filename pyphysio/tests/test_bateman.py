@@ -0,0 +1,65 @@
+# coding=utf-8
+from __future__ import division
+
+import scipy.optimize as opt
+from . import ph, np
+from ..tools.Tools import OptimizeBateman
+from ..estimators.Estimators import DriverEstim
+
+
+def _eda():
+    # impulses of the driver convolved with a Bateman function
+    np.random.seed(1234)
+    FSAMP = 8
+    driver = np.zeros(120 * FSAMP)
+    driver[np.random.choice(len(driver) - 30 * FSAMP, 8, replace=False)] = np.random.uniform(1, 3, 8)
+    t = np.arange(20 * FSAMP) / FSAMP
+    bateman = np.exp(-t / 3) - np.exp(-t / 0.6)
+    eda = 2 + np.convolve(driver, bateman)[:len(driver)] + 0.01 * np.random.randn(len(driver))
+    return ph.EvenlySignal(eda, sampling_freq=FSAMP, signal_type='EDA')
+
+
+def test_optimize_bateman_grid():
+    eda = _eda()
+    kwargs = dict(delta=0.02, loss_func='ben', opt_method='grid', n_step_1=3, n_step_2=3)
+
+    x0, loss, exit_code = ph.OptimizeBateman(**kwargs)(eda)
+    ranges = (slice(0.1, 0.99 + 0.89 / 3, 0.89 / 3), slice(1.5, 10 + 8.5 / 3, 8.5 / 3))
+    x0_brute, loss_brute = opt.brute(OptimizeBateman._loss_benedek, ranges, args=(eda, 0.02), full_output=True,
+                                     finish=None)[:2]
+    assert np.array_equal(x0, x0_brute) and loss == loss_brute
+
+    # the drivers of the grid estimated in batch: the loss is the one of DriverEstim at the best point
+    x0_batch, loss_batch, exit_code = ph.OptimizeBateman(batch_drivers=True, **kwargs)(eda)
+    assert np.array_equal(x0_batch, x0_brute) and loss_batch == loss_brute
+    x0_par, loss_par, exit_code = ph.OptimizeBateman(batch_drivers=True, n_jobs=2, **kwargs)(eda)
+    assert np.array_equal(x0_batch, x0_par) and loss_batch == loss_par
+
+    x0_par, loss_par, exit_code = ph.OptimizeBateman(n_jobs=2, **kwargs)(eda)
+    assert np.array_equal(x0, x0_par) and loss == loss_par
+
+    x0_fine, loss_fine, exit_code = ph.OptimizeBateman(n_refine=2, **kwargs)(eda)
+    assert loss_fine <= loss
+    assert np.all(np.abs(x0_fine - x0) <= [0.89 / 3, 8.5 / 3])
+
+    # a single basin in the ranges: the refinement finds the minimum of the exhaustive grid of its resolution
+    kwargs = dict(delta=0.02, loss_func='ben', opt_method='grid', n_step_1=4, n_step_2=4, par_ranges=[0.2, 0.4, 2, 4])
+    x0, loss, exit_code = ph.OptimizeBateman(**kwargs)(eda)
+    x0_fine, loss_fine, exit_code = ph.OptimizeBateman(n_refine=1, **kwargs)(eda)
+    ranges = (slice(0.2, 0.4 + 0.025 / 2, 0.025), slice(2, 4 + 0.25 / 2, 0.25))
+    x0_brute, loss_brute = opt.brute(OptimizeBateman._loss_benedek, ranges, args=(eda, 0.02), full_output=True,
+                                     finish=None)[:2]
+    assert loss_fine < loss
+    assert np.allclose(x0_fine, x0_brute) and np.isclose(loss_fine, loss_brute)
+
+
+def test_driver_batch():
+    eda = _eda()
+    pars = [[0.1, 1.5], [0.6, 3], [0.75, 2], [0.99, 10]]
+    drivers = DriverEstim.batch(eda, pars)
+    assert isinstance(drivers, ph.MultiEvenly)
+    for i, (t1, t2) in enumerate(pars):
+        driver = DriverEstim(t1=t1, t2=t2)(eda)
+        assert np.allclose(drivers.get_values()[:, i], driver, atol=1e-6 * np.max(driver))
+        # the driver of a pair does not depend on the others
+        assert np.array_equal(DriverEstim.batch(eda, [[t1, t2]]).get_values()[:, 0], drivers.get_values()[:, i])
@@ -0,0 +1,123 @@
+# coding=utf-8
+from __future__ import division
+
+from . import ph, np
+from ..BaseAlgorithm import Cache
+
+
+def test_cache_keys():
+    # arrays are hashed by content: no false hits when the repr is truncated
+    irf_a = np.zeros(5000)
+    irf_b = np.zeros(5000)
+    irf_b[2500] = 1
+    assert str(irf_a) == str(irf_b)
+    assert ph.DeConvolutionalFilter.cache_key({'irf': irf_a}) != ph.DeConvolutionalFilter.cache_key({'irf': irf_b})
+    assert ph.DeConvolutionalFilter.cache_key({'irf': irf_a}) == \
+        ph.DeConvolutionalFilter.cache_key({'irf': irf_a.copy()})
+
+    # the order of the parameters does not matter, the class does
+    assert ph.PSD.cache_key({'method': 'ar', 'nfft': 1024}) == ph.PSD.cache_key({'nfft': 1024, 'method': 'ar'})
+    assert ph.Mean.cache_key({}) != ph.Median.cache_key({})
+
+
+def test_cache_lru():
+    np.random.seed(1234)
+    Cache.reset()
+    s = ph.EvenlySignal(np.random.randn(10000), sampling_freq=100)
+    f = ph.IIRFilter(fp=5, fs=10)
+
+    out = f.run(s, f.get(), use_cache=True)
+    assert np.array_equal(out, f(s))
+    assert f.run(s, f.get(), use_cache=True) is out
+    # same content and metadata, same results
+    s_copy = ph.EvenlySignal(s.get_values().copy(), sampling_freq=100)
+    assert f.run(s_copy, f.get(), use_cache=True) is out
+    stats = Cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['n_entries']) == (2, 1, 1)
+    assert stats['size'] == out.nbytes
+
+    # different metadata, different results
+    s_copy.set_start_time(10)
+    assert f.run(s_copy, f.get(), use_cache=True) is not out
+    assert Cache.get_stats()['misses'] == 2
+
+    # the least recently used results are evicted
+    old_max_size = Cache.get_stats()['max_size']
+    try:
+        Cache.set_max_size(out.nbytes)
+        assert Cache.get_stats()['n_entries'] == 1
+        f.run(s, f.get(), use_cache=True)
+        assert Cache.get_stats()['misses'] == 3
+    finally:
+        Cache.set_max_size(old_max_size)
+    Cache.reset()
+
+
+def test_cache_disk():
+    import os
+    from tempfile import mkdtemp
+    from shutil import rmtree
+
+    np.random.seed(1234)
+    folder = mkdtemp()
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(3000)), sampling_freq=4, start_time=10)
+    algorithms = [ph.PSD(method='ar'), ph.IIRFilter(fp=0.5, fs=1), ph.Mean(), ph.PeakDetection(delta=1)]
+    try:
+        Cache.reset()
+        Cache.set_disk_cache(folder)
+        results = [alg.run(s, alg.get(), use_cache=True) for alg in algorithms]
+        assert len([f for f in os.listdir(folder) if f.endswith('.npz')]) == len(algorithms)
+
+        # a new session: the results are loaded from the disk
+        Cache.reset()
+        for alg, result in zip(algorithms, results):
+            loaded = alg.run(s, alg.get(), use_cache=True)
+            assert type(loaded) == type(result)
+            if isinstance(result, tuple):
+                for a, b in zip(loaded, result):
+                    assert np.array_equal(a, b)
+            else:
+                assert np.array_equal(loaded, result)
+        assert isinstance(loaded, tuple)
+        filtered = algorithms[1].run(s, algorithms[1].get(), use_cache=True)
+        assert isinstance(filtered, ph.EvenlySignal)
+        assert filtered.get_sampling_freq() == 4 and filtered.get_start_time() == 10
+        stats = Cache.get_stats()
+        assert (stats['hits'], stats['disk_hits'], stats['misses']) == (1, len(algorithms), 0)
+
+        # the files of other versions of the library are not used
+        version = ph.__version__
+        try:
+            Cache.reset()
+            ph.__version__ = version + '.dev'
+            algorithms[2].run(s, algorithms[2].get(), use_cache=True)
+            assert Cache.get_stats()['disk_hits'] == 0
+        finally:
+            ph.__version__ = version
+
+        # the folder is scanned only when over its budget
+        def folder_size():
+            return sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+
+        assert Cache._disk_size == folder_size()
+        listdir = os.listdir
+        n_scans = []
+        os.listdir = lambda path: n_scans.append(path) or listdir(path)
+        try:
+            for i in range(5):
+                ph.Mean().run(s + i, {}, use_cache=True)
+            assert len(n_scans) == 0
+            Cache._disk_max_size = Cache._disk_size
+            ph.Mean().run(s + 5, {}, use_cache=True)
+            assert len(n_scans) == 1
+        finally:
+            os.listdir = listdir
+        assert Cache._disk_size == folder_size() <= Cache._disk_max_size
+
+        # the size of the folder is bounded
+        Cache.set_disk_cache(folder, max_size=0)
+        assert len(os.listdir(folder)) == 0
+    finally:
+        Cache.set_disk_cache(None)
+        Cache.reset()
+        rmtree(folder)
@@ -0,0 +1,47 @@
+# coding=utf-8
+from __future__ import division
+
+from scipy.signal import convolve as sp_convolve
+from . import ph, np
+from ..Utility import convolve, convolution_method
+
+
+def test_convolution_methods():
+    np.random.seed(1234)
+    for n, m in [(1000, 31), (5000, 300), (1000, 1000), (100, 301)]:
+        for x in [np.random.randn(n), np.random.randn(n, 3)]:
+            k = np.random.randn(m)
+            k_2d = k.reshape((-1,) + (1,) * (x.ndim - 1))
+            for mode in ['full', 'same', 'valid'] if n >= m else ['full', 'same']:
+                expected = sp_convolve(x, k_2d, mode=mode, method='direct')
+                for method in ['auto', 'direct', 'fft', 'oa']:
+                    assert np.allclose(convolve(x, k, mode, method), expected)
+
+            # extension of the signal at the edges
+            x_pad = np.concatenate([np.repeat(x[:1], 50, axis=0), x, np.repeat(x[-1:], 50, axis=0)])
+            expected = sp_convolve(x_pad, k_2d, mode='same', method='direct')[50:-50]
+            for method in ['auto', 'direct', 'fft', 'oa']:
+                assert np.allclose(convolve(x, k, 'same', method, pad=50), expected)
+
+    assert convolution_method(10 ** 6, 5) == 'direct'
+    assert convolution_method(10 ** 6, 2000) == 'oa'
+    assert convolution_method(10 ** 4, 10 ** 4) == 'fft'
+    assert convolution_method(10 ** 6, 2000, has_nan=True) == 'direct'
+    assert convolution_method(10 ** 4, 10 ** 4, is_memmap=True) != 'fft'
+
+
+def test_convolution_filters_mmap():
+    import os
+    from tempfile import mkdtemp
+    from shutil import rmtree
+
+    np.random.seed(1234)
+    folder = mkdtemp()
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(20000)), sampling_freq=1000)
+    try:
+        s.to_mmap(os.path.join(folder, 's'))
+        s_mmap = ph.from_mmap(os.path.join(folder, 's'))
+        for f in [ph.ConvolutionalFilter(irftype='gauss', win_len=1.6), ph.FIRFilter(fp=[40], fs=[50])]:
+            assert np.allclose(f(s_mmap), f(s))
+    finally:
+        rmtree(folder)
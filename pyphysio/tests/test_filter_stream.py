@@ -0,0 +1,77 @@
+# coding=utf-8
+from __future__ import division
+
+from scipy.signal import sosfilt, sosfilt_zi, lfilter
+from . import ph, np
+
+
+def test_stream_iir():
+    np.random.seed(1234)
+    FSAMP = 100
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(5000)), sampling_freq=FSAMP, start_time=3)
+    f = ph.IIRFilter(fp=0.5, fs=1)
+
+    sos = np.array(f.design(FSAMP, f.get(), output='sos'))
+    expected = sosfilt(sos, s.get_values(), zi=sosfilt_zi(sos) * s[0])[0]
+
+    stream = f.stream(FSAMP)
+    blocks = [stream.filter(s.segment_iidx(i, i + 333)) for i in range(0, len(s), 333)]
+    assert all(isinstance(b, ph.EvenlySignal) for b in blocks)
+    assert blocks[1].get_start_time() == s.get_time(333)
+    assert np.allclose(np.concatenate(blocks), expected)
+
+    # multichannel arrays
+    multi = np.c_[s.get_values(), -s.get_values()]
+    stream.reset()
+    out = np.concatenate([stream.filter(multi[i:i + 100]) for i in range(0, len(multi), 100)])
+    assert np.allclose(out, np.c_[expected, -expected])
+
+
+def test_stream_fir():
+    np.random.seed(1234)
+    FSAMP = 100
+    values = np.cumsum(np.random.randn(3000))
+    f = ph.FIRFilter(fp=5, fs=10)
+
+    taps = f.design(FSAMP, f.get())
+    stream = f.stream(FSAMP)
+    assert stream.delay == (len(taps) - 1) / 2
+    out = np.concatenate([stream.filter(values[i:i + 250]) for i in range(0, len(values), 250)])
+    x = np.r_[np.repeat(values[0], len(taps) - 1), values]
+    assert np.allclose(out, lfilter(taps, 1, x)[len(taps) - 1:])
+
+    # the filter on the whole signal is the stream, without the delay
+    d = int(stream.delay)
+    assert np.allclose(f(ph.EvenlySignal(values, FSAMP))[:-d][d:], out[d:][d:])
+
+
+def test_design_cache():
+    from ..filters.Filters import FilterDesignCache
+    np.random.seed(1234)
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(2000)), sampling_freq=100)
+
+    FilterDesignCache.reset()
+    f = ph.IIRFilter(fp=[5], fs=[10])
+    out = f(s)
+    assert np.array_equal(ph.IIRFilter(fp=5, fs=10)(s), out)
+    stats = FilterDesignCache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['n_entries']) == (1, 1, 1)
+    assert stats['entries'][0][1] == 1
+
+    # different sampling frequency, different design; the coefficients are read-only
+    b, a = f.design(200, f.get())
+    assert not b.flags.writeable
+    assert FilterDesignCache.get_stats()['misses'] == 2
+
+    g = ph.FIRFilter(fp=5, fs=10)
+    taps = g.design(100, g.get())
+    assert np.allclose(g.design_fft(100, g.get(), 1024), np.fft.rfft(taps, 1024))
+    assert g.design_fft(100, g.get(), 1024) is g.design_fft(100, g.get(), 1024)
+
+    old = FilterDesignCache.get_stats()['max_entries']
+    try:
+        FilterDesignCache.set_max_entries(2)
+        assert FilterDesignCache.get_stats()['n_entries'] == 2
+    finally:
+        FilterDesignCache.set_max_entries(old)
+    FilterDesignCache.reset()
@@ -0,0 +1,137 @@
+# coding=utf-8
+from __future__ import division
+
+from concurrent.futures import ThreadPoolExecutor, Executor, Future
+from . import ph, np
+
+
+def _signal_and_algorithms():
+    np.random.seed(1234)
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(3000)), sampling_freq=50, start_time=10)
+    algorithms = [ph.Mean(), ph.StDev(), ph.Range(), ph.PNNx(threshold=50), ph.PeaksNum(delta=1),
+                  ph.PowerInBand(freq_min=0.5, freq_max=2, method='welch')]
+    return s, algorithms
+
+
+def test_fmap_parallel():
+    s, algorithms = _signal_and_algorithms()
+    segmenter = ph.FixedSegments(step=2, width=5)
+
+    values, columns = ph.fmap(segmenter(s), algorithms, s)
+    assert values.shape == (len([x for x in segmenter(s)]), len(algorithms) + 3)
+
+    values_p, columns_p = ph.fmap(segmenter(s), algorithms, s, n_jobs=2)
+    assert np.array_equal(values, values_p)
+    assert np.array_equal(columns, columns_p)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        values_t, columns_t = ph.fmap(segmenter(s), algorithms, s, executor=executor)
+    assert np.array_equal(values, values_t)
+
+
+class _SerialExecutor(Executor):
+    # executor without a pool of workers, counting the tasks
+    def __init__(self):
+        self.n_tasks = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.n_tasks += 1
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def test_map_segments_batches():
+    from ..execution import map_segments, SEGMENTS_PER_BATCH
+    s, algorithms = _signal_and_algorithms()
+    algorithms = algorithms[:3]
+    segments_times = [(seg.get_begin_time(), seg.get_end_time(), seg.get_label())
+                      for seg in ph.FixedSegments(step=0.5, width=5)(s)]
+    values, columns = ph.fmap(list(ph.FixedSegments(step=0.5, width=5)(s)), algorithms)
+
+    executor = _SerialExecutor()
+    values_e = map_segments(s, segments_times, algorithms, executor=executor)
+    assert executor.n_tasks == int(np.ceil(len(segments_times) / SEGMENTS_PER_BATCH))
+    assert np.array_equal(np.array(values_e)[:, :, 0], values)
+
+    executor = _SerialExecutor()
+    values_e = map_segments(s, segments_times, algorithms, executor=executor, n_batches=3)
+    assert executor.n_tasks == 3
+    assert np.array_equal(np.array(values_e)[:, :, 0], values)
+
+
+def test_fmap_segments_signal():
+    s, algorithms = _signal_and_algorithms()
+    segments = [x for x in ph.FixedSegments(step=2, width=5)(s)]
+
+    values, columns = ph.fmap(segments, algorithms)
+    values_p, columns_p = ph.fmap(segments, algorithms, n_jobs=2)
+    assert np.array_equal(values, values_p)
+
+
+def test_fmap_shared_intermediates():
+    from ..execution import plan_intermediates
+    from ..BaseAlgorithm import Cache
+
+    s, algorithms = _signal_and_algorithms()
+    bands = [ph.PowerInBand(freq_min=f_min, freq_max=f_max, method='ar') for f_min, f_max in [(0, 1), (1, 3), (3, 8)]]
+    peaks = [ph.PeaksMax(delta=1), ph.PeaksMin(delta=1), ph.PeaksMean(delta=1), ph.DurationMean(delta=1),
+             ph.PeaksNum(delta=2)]
+    algorithms = algorithms + bands + [ph.PeakInBand(freq_min=1, freq_max=3, method='ar')] + peaks
+
+    shared = dict((x.__class__.__name__, x) for x in plan_intermediates(algorithms))
+    assert sorted(shared) == ['PSD', 'PeakDetection']
+    assert shared['PSD'].get('method') == 'ar'
+    assert shared['PeakDetection'].get('delta') == 1
+
+    segments = [x for x in ph.FixedSegments(step=10, width=20)(s)]
+    values, columns = ph.fmap(segments, algorithms)
+    for i_seg, seg in enumerate(segments):
+        assert np.allclose(values[i_seg, 3:].astype(float), [alg(seg(s)) for alg in algorithms], equal_nan=True)
+
+    # each shared intermediate is computed once per segment
+    calls = []
+    psd_algorithm = ph.PSD.algorithm
+
+    def counted(signal, params):
+        calls.append(params['method'])
+        return psd_algorithm(signal, params)
+
+    ph.PSD.algorithm = staticmethod(counted)
+    Cache.reset()
+    try:
+        ph.fmap(segments, algorithms)
+    finally:
+        ph.PSD.algorithm = psd_algorithm
+    assert calls.count('ar') == len(segments)
+
+
+def test_fmap_overlapping_windows():
+    np.random.seed(1234)
+    s = ph.EvenlySignal(1000 + np.cumsum(np.random.randn(5000)), sampling_freq=50, start_time=10)
+    s[[100, 2000, 2001]] = np.nan
+    s[3000:3300] = np.nan
+    algorithms = [ph.Mean(), ph.StDev(), ph.Sum(), ph.AUC(), ph.Min(), ph.Max(), ph.Range()]
+
+    for params in [dict(step=0.1, width=5), dict(step=0.7, width=3, start=1.5, drop_cut=False, drop_mixed=False)]:
+        segments = ph.FixedSegments(**params)(s)
+        times = [(seg.get_begin_time(), seg.get_end_time()) for seg in segments]
+        assert np.array_equal(np.c_[segments.get_segments_times()], times)
+
+    segmenter = ph.FixedSegments(step=0.1, width=5)
+    values, columns = ph.fmap(segmenter(s), algorithms)
+    values_ref = np.array([[seg.get_begin_time(), seg.get_end_time(), seg.get_label()] +
+                           [alg(seg(s)) for alg in algorithms] for seg in segmenter(s)])
+    assert values.shape == values_ref.shape
+    assert np.array_equal(values[:, :2], values_ref[:, :2])
+    assert np.allclose(values[:, 3:].astype(float), values_ref[:, 3:].astype(float), equal_nan=True)
+
+    # live: sliding window of 250 samples
+    for alg in algorithms:
+        acc = alg.accumulator(s)
+        for i, x in enumerate(s.get_values()[:3500]):
+            acc.push(x)
+            if len(acc) > 250:
+                acc.pop()
+            if i % 97 == 0:
+                assert np.isclose(acc.value(), alg(s.segment_idx(max(0, i - 249), i + 1)), equal_nan=True), (alg, i)
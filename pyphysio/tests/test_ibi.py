@@ -0,0 +1,136 @@
+# coding=utf-8
+from __future__ import division
+
+from . import ph, np
+
+
+def _beat_outliers_reference(ibi, ibi_expected, cache, sensitivity):
+    id_bad_ibi = []
+    ibi_cache = np.repeat(ibi_expected, cache)
+    counter_bad = 0
+    for i in range(1, len(ibi)):
+        curr_median = np.median(ibi_cache)
+        if ibi[i] > curr_median * (1 + sensitivity) or ibi[i] < curr_median * (1 - sensitivity):
+            id_bad_ibi.append(i)
+            counter_bad += 1
+        else:
+            ibi_cache = np.r_[ibi_cache[1:], ibi[i]]
+            counter_bad = 0
+        if counter_bad == cache:
+            ibi_cache = np.repeat(ibi_expected, cache)
+            counter_bad = 0
+    return id_bad_ibi
+
+
+def _ibi_with_outliers(n):
+    np.random.seed(1234)
+    values = np.round(0.8 + 0.05 * np.random.randn(n), 2)
+    bad = np.random.rand(n) < 0.15
+    values[bad] *= np.random.choice([0.5, 1.6, 2], bad.sum())
+    values[[n // 3, n // 2]] = np.nan
+    return ph.UnevenlySignal(values, sampling_freq=1, x_values=np.arange(n), x_type='indices', signal_type='IBI')
+
+
+def test_beat_outliers():
+    ibi = _ibi_with_outliers(1000)
+    values = ibi.get_values()
+
+    for cache in [1, 2, 3, 6]:
+        for ibi_median in [0, 0.8, 0.4]:
+            ibi_expected = ibi_median if ibi_median > 0 else np.median(ibi)
+            id_bad = ph.BeatOutliers(ibi_median=ibi_median, cache=cache)(ibi)
+            assert id_bad == _beat_outliers_reference(values, ibi_expected, cache, 0.25)
+
+            # streaming the same IBI in blocks
+            stream = ph.BeatOutliers(ibi_median=ibi_median, cache=cache).stream(ibi_expected)
+            bad = np.concatenate([stream.check(values[i:i + 37]) for i in range(1, len(values), 37)])
+            assert (np.flatnonzero(bad) + 1).tolist() == id_bad
+
+
+def test_beat_optimizer():
+    from itertools import product
+    from ..tools.Tools import BeatOptimizer
+    np.random.seed(1234)
+
+    # the dynamic programming finds the best combination of forward/backward beats
+    for n in range(1, 9):
+        beats = np.cumsum(np.random.randint(40, 60, n))
+        pairs = np.column_stack([beats, beats + np.random.randint(-8, 9, n) * (np.random.rand(n) < 0.5)])
+        combinations = [pairs[np.arange(n), comb] for comb in product([0, 1], repeat=n)]
+        errors = [np.sum(np.abs(np.diff(c, 2))) for c in combinations if np.all(np.diff(c) > 0)]
+        assert np.sum(np.abs(np.diff(BeatOptimizer._optimize(pairs), 2))) == min(errors)
+
+    # false detections between the true beats are removed
+    FSAMP = 64
+    true_beats = np.cumsum(np.round(FSAMP * (0.8 + 0.03 * np.random.randn(2000)))).astype(int)
+    i_extra = np.random.choice(len(true_beats) - 1, 50, replace=False)
+    beats = np.union1d(true_beats, (true_beats[i_extra] + true_beats[i_extra + 1]) // 2)
+    ibi = ph.UnevenlySignal(np.r_[0.8, np.diff(beats) / FSAMP], sampling_freq=FSAMP, x_values=beats,
+                            x_type='indices', signal_type='IBI')
+    ibi_opt = ph.BeatOptimizer()(ibi)
+    assert np.array_equal(ibi_opt.get_indices(), true_beats)
+    assert np.allclose(ibi_opt.get_values()[1:], np.diff(true_beats) / FSAMP)
+
+
+
+def test_beat_from_bp():
+    from ..estimators.Estimators import BeatFromBP
+    np.random.seed(1234)
+    FSAMP = 100
+    t = np.arange(0, 60, 1 / FSAMP)
+    bvp = ph.EvenlySignal(np.sin(2 * np.pi * 1.1 * t) ** 9 + 0.3 * np.random.randn(len(t)), sampling_freq=FSAMP,
+                          signal_type='BVP')
+    dxdt = ph.Diff()(bvp)
+    candidates = np.sort(np.random.choice(len(bvp), 300, replace=False))
+
+    for win_pre, win_post in [(0.25, 0.05), (0.05, 0.02), (1, 1)]:
+        peaks = BeatFromBP._refine_peaks(np.asarray(dxdt), candidates, win_pre * FSAMP, win_post * FSAMP,
+                                         int(0.1 * FSAMP), int(0.025 * FSAMP), chunk=64)
+
+        # reference: the first minimum of the absolute derivative after its maximum, searched beat by beat
+        for idx_beat, peak in zip(candidates, peaks):
+            start = max(int(idx_beat - win_pre * FSAMP), 0)
+            stop = int(idx_beat + win_post * FSAMP)
+            stop = -1 if stop > len(dxdt) else stop
+            peak_obs = np.argmax(dxdt[start:stop])
+            idx_mins, mins = ph.Minima(win_len=0.1, win_step=0.025, method='windowing')(
+                abs(dxdt[start + peak_obs:stop]))
+            assert peak == (start + peak_obs + idx_mins[0] + 1 if len(idx_mins) > 0 else -1)
+
+    ibi = ph.BeatFromBP()(bvp)
+    assert np.allclose(ibi.get_values()[1:], np.diff(ibi.get_indices()) / FSAMP)
+    assert 50 < len(ibi) <= 66
+
+
+def test_hrv_accumulators():
+    np.random.seed(1234)
+    FSAMP = 1024
+    ibi = 0.8 + 0.05 * np.random.randn(600)
+    idx = np.cumsum(np.round(ibi * FSAMP)).astype(int)
+    ibi_signal = ph.UnevenlySignal(ibi, sampling_freq=FSAMP, signal_type='IBI', x_values=idx, x_type='indices')
+
+    indicators = [ph.Mean(), ph.StDev(), ph.RMSSD(), ph.SDSD(), ph.PNNx(threshold=50), ph.NNx(threshold=50),
+                  ph.PoincareSD1(), ph.PoincareSD2()]
+
+    # live: sliding window of 60 IBI
+    values = ibi.copy()
+    values[[100, 101, 350]] = np.nan
+    for ind in indicators:
+        acc = ind.accumulator()
+        for i, x in enumerate(values):
+            acc.push(x)
+            if len(acc) > 60:
+                acc.pop()
+            if i % 37 == 0:
+                window = ph.UnevenlySignal(values[max(0, i - 59):i + 1], sampling_freq=FSAMP, x_type='indices',
+                                           x_values=idx[max(0, i - 59):i + 1])
+                assert np.isclose(acc.value(), ind(window), equal_nan=True), (ind, i)
+
+    # overlapping segments
+    segments = ph.FixedSegments(step=5, width=60)(ibi_signal)
+    values, col_names = ph.fmap(segments, indicators)
+    values_ref = np.array([[seg.get_begin_time(), seg.get_end_time(), seg.get_label()] +
+                           [ind(seg(ibi_signal)) for ind in indicators] for seg in segments])
+    assert len(values) == len(values_ref)
+    assert np.allclose(values[:, 3:].astype(float), values_ref[:, 3:].astype(float))
+    assert np.array_equal(values[:, :2], values_ref[:, :2])
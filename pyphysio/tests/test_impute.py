@@ -0,0 +1,34 @@
+# coding=utf-8
+from __future__ import division
+
+from scipy.stats import linregress
+from . import ph, np
+
+
+def test_impute_nan():
+    np.random.seed(1234)
+    FSAMP = 10
+    values = np.cumsum(np.random.randn(5000)) + 100
+    for start in [0, 300, 1000, 1000 + 13]:
+        values[start:start + np.random.randint(1, 10)] = np.nan
+    values[2000:2100:3] = np.nan
+    values[-6:] = np.nan
+    s = ph.EvenlySignal(values, sampling_freq=FSAMP)
+
+    filled = ph.ImputeNAN(win_len=5, seed=7)(s)
+    assert not np.isnan(filled).any()
+    assert np.array_equal(filled[~np.isnan(values)], values[~np.isnan(values)])
+    assert np.array_equal(filled, ph.ImputeNAN(win_len=5, seed=7)(s))
+    assert not np.array_equal(filled, ph.ImputeNAN(win_len=5, seed=8)(s))
+
+    # isolated gap: regression line of the windows plus noise with the smallest std of the windows
+    start, stop = 300, np.flatnonzero(~np.isnan(values[300:]))[0] + 300
+    pre, post = values[start - 25:start], values[stop:stop + 25]
+    line = linregress(np.r_[start - 25:start, stop:stop + 25], np.r_[pre, post])
+    expected = np.arange(start, stop) * line.slope + line.intercept
+    assert np.all(np.abs(filled[start:stop] - expected) < 5 * min(np.std(pre), np.std(post)))
+
+    # windows with too few valid samples: mean of the signal
+    assert np.allclose(ph.ImputeNAN(win_len=0.6)(s)[-6:], np.nanmean(values))
+
+    assert np.array_equal(ph.ImputeNAN(allnan='zeros')(s * np.nan), np.zeros(len(s)))
@@ -0,0 +1,67 @@
+# coding=utf-8
+from __future__ import division
+
+from . import ph, np
+
+
+def _multi_and_channels():
+    np.random.seed(1234)
+    FSAMP = 100
+    values = np.cumsum(np.random.randn(2000, 4), axis=0)
+    multi = ph.MultiEvenly(values, sampling_freq=FSAMP)
+    channels = [ph.EvenlySignal(values[:, i], sampling_freq=FSAMP) for i in range(values.shape[1])]
+    return multi, channels
+
+
+def test_channel_vectorized_filters():
+    multi, channels = _multi_and_channels()
+
+    filters = [ph.Normalize('standard'), ph.Normalize('maxmin'),
+               ph.IIRFilter(fp=5, fs=10), ph.FIRFilter(fp=[5], fs=[10]),
+               ph.ConvolutionalFilter(irftype='gauss', win_len=0.5)]
+
+    for f in filters:
+        out = f(multi)
+        assert isinstance(out, ph.MultiEvenly)
+        assert out.shape == multi.shape
+        for i_ch, channel in enumerate(channels):
+            assert np.allclose(out.get_values()[:, i_ch], f(channel))
+
+
+def test_channel_vectorized_diff():
+    multi, channels = _multi_and_channels()
+
+    for degree in [1, 3]:
+        out = ph.Diff(degree=degree)(multi)
+        assert isinstance(out, ph.MultiEvenly)
+        assert out.shape == (len(multi) - degree, multi.get_nchannels())
+        for i_ch in range(multi.get_nchannels()):
+            diff = ph.Diff(degree=degree)(multi.get_channel(i_ch))
+            assert np.array_equal(out.get_channel(i_ch), diff)
+            assert out.get_channel(i_ch).get_start_time() == diff.get_start_time()
+
+
+def test_channel_vectorized_indicators():
+    multi, channels = _multi_and_channels()
+
+    indicators = [ph.Mean(), ph.Min(), ph.Max(), ph.Range(), ph.Median(), ph.StDev(), ph.Sum(), ph.AUC(),
+                  ph.DetrendedAUC(), ph.RMSSD(), ph.SDSD()]
+
+    for ind in indicators:
+        out = ind(multi)
+        assert np.allclose(out, [ind(channel) for channel in channels])
+
+
+def test_channels_threads():
+    multi, channels = _multi_and_channels()
+    ind = ph.PoincareSD1()
+
+    out_serial = ind(multi)
+    ph.PoincareSD1.set_n_threads(4)
+    try:
+        out_threads = ind(multi)
+    finally:
+        ph.PoincareSD1.set_n_threads(1)
+
+    assert np.array_equal(out_serial, out_threads)
+    assert np.allclose(out_serial, [ind(channel) for channel in channels])
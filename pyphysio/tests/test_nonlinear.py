@@ -0,0 +1,52 @@
+# coding=utf-8
+from __future__ import division
+
+from scipy.spatial.distance import cdist
+from . import ph, np
+
+
+def _entropies_reference(x, radius):
+    # counts of the neighbours on the full chebyshev distance matrices
+    def embed(dim):
+        return np.array([x[i:i + dim] for i in range(len(x) - dim + 1)])
+
+    counts = {dim: np.sum(cdist(embed(dim), embed(dim), 'chebyshev') <= radius * np.nanstd(x), axis=1)
+              for dim in [2, 3]}
+    phi = {dim: np.mean(np.log(c / len(c))) for dim, c in counts.items()}
+    cm = {dim: np.mean((c - 1) / (len(c) - 1)) for dim, c in counts.items()}
+    return phi[2] - phi[3], np.log(cm[2] / cm[3])
+
+
+def test_entropies():
+    np.random.seed(1234)
+    for n, decimals in [(5, 8), (60, 1), (300, 8), (300, 1)]:
+        x = np.round(np.random.randn(n), decimals)
+        s = ph.UnevenlySignal(x, sampling_freq=1, x_values=np.arange(n), x_type='indices')
+        for radius in [0.2, 0.5, 1]:
+            apen, sampen = _entropies_reference(x, radius)
+            assert np.isclose(ph.ApproxEntropy(radius=radius)(s), apen, equal_nan=True)
+            assert np.isclose(ph.SampleEntropy(radius=radius)(s), sampen, equal_nan=True)
+
+
+def test_dfa():
+    np.random.seed(1234)
+    x = 0.8 + 0.01 * np.cumsum(np.random.randn(500)) + 0.02 * np.random.randn(500)
+    s = ph.UnevenlySignal(x, sampling_freq=1, x_values=np.arange(len(x)), x_type='indices')
+
+    # reference: one least squares fit per box
+    y = np.cumsum(x)
+    scales = [3, 4, 10, 33, 100]
+    f = []
+    for n in scales:
+        res = 0
+        for j in range(0, len(x) - n, n):
+            t = np.arange(j, j + n)
+            res += np.sum((y[j:j + n] - np.polyval(np.polyfit(t, y[j:j + n], 1), t)) ** 2)
+        f.append(np.sqrt(res / len(x)))
+    assert np.allclose(ph.dfa_fluctuation(x, scales), f)
+
+    assert ph.DFAShortTerm()(s) == ph.DFA(min_box=4, max_box=16, step=4)(s)
+    assert ph.DFALongTerm()(s) == ph.DFA(min_box=16, max_box=64, step=4)(s)
+    assert np.isclose(ph.DFA(min_box=3, max_box=100, step=1)(s),
+                      np.polyfit(np.log(np.arange(3, 101)), np.log(ph.dfa_fluctuation(x, np.arange(3, 101))), 1)[0])
+    assert np.isnan(ph.DFA(min_box=4, max_box=16)(s[:15]))
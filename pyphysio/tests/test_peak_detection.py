@@ -0,0 +1,88 @@
+# coding=utf-8
+from __future__ import division
+
+from . import ph, np
+
+
+def _compare_engines(signal, **params):
+    out_loop = ph.PeakDetection(engine='loop', **params)(signal)
+    out_vect = ph.PeakDetection(engine='vectorized', **params)(signal)
+    for x_loop, x_vect in zip(out_loop, out_vect):
+        assert x_loop.dtype == x_vect.dtype
+        assert np.array_equal(x_loop, x_vect)
+
+
+def test_peak_detection_engines():
+    np.random.seed(1234)
+    FSAMP = 100
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(5000)), sampling_freq=FSAMP)
+
+    _compare_engines(s, delta=1)
+    _compare_engines(s, delta=1, start_max=False)
+    _compare_engines(s, delta=2, refractory=0.5)
+    _compare_engines(s, delta=np.random.uniform(0.5, 2, len(s)), refractory=0.1)
+
+    # ties and NaNs
+    s_round = ph.EvenlySignal(np.round(s.get_values()), sampling_freq=FSAMP)
+    _compare_engines(s_round, delta=1)
+    s_round[np.arange(10, 5000, 97)] = np.nan
+    _compare_engines(s_round, delta=1, refractory=0.05)
+
+
+def test_peak_detection_short():
+    s = ph.EvenlySignal([0, 2, 0, 2, 0], sampling_freq=1)
+    maxp, minp, maxv, minv = ph.PeakDetection(delta=1)(s)
+    assert list(maxp) == [1, 3]
+    assert list(minp) == [2]
+    assert list(maxv) == [2, 2]
+
+    maxp, minp, maxv, minv = ph.PeakDetection(delta=1)(ph.EvenlySignal([1], sampling_freq=1))
+    assert len(maxp) == 0 and len(minp) == 0
+
+
+def _peak_selection_loop(dt, i_peaks, i_pre_max, i_post_max, zero=0.01):
+    i_start = []
+    i_stop = []
+    for i_pk in i_peaks:
+        if i_pk < i_pre_max:
+            i_st, i_sp = 0, i_pk + i_post_max
+        elif i_pk >= len(dt) - i_post_max:
+            i_st, i_sp = i_pk - i_pre_max, len(dt) - 1
+        else:
+            i_st, i_sp = i_pk - i_pre_max, i_pk + i_post_max
+        pre = dt[i_st:i_pk]
+        i_pre = len(pre) - 1
+        while i_pre > 0 and (pre[i_pre] > 0 or abs(pre[i_pre]) <= zero):
+            i_pre -= 1
+        i_start.append(i_st + i_pre + 1)
+        post = dt[i_pk:i_sp]
+        i_post = 1
+        while i_post < len(post) - 1 and (post[i_post] < 0 or abs(post[i_post]) <= zero):
+            i_post += 1
+        i_stop.append(i_pk + i_post)
+    return i_start, i_stop
+
+
+def test_peak_selection():
+    np.random.seed(1234)
+    FSAMP = 16
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(5000)) * 0.05, sampling_freq=FSAMP)
+    dt = np.diff(s.get_values())
+    i_peaks = ph.PeakDetection(delta=0.1, refractory=1)(s)[0]
+    i_peaks = np.r_[0, 1, i_peaks, len(s) - 2, len(s) - 1]
+
+    for win_pre, win_post in [(2, 2), (0.5, 4), (6, 0.25)]:
+        i_start, i_stop = ph.PeakSelection(indices=i_peaks, win_pre=win_pre, win_post=win_post)(s)
+        i_start_loop, i_stop_loop = _peak_selection_loop(dt, i_peaks, int(win_pre * FSAMP), int(win_post * FSAMP))
+        assert np.array_equal(i_start, i_start_loop)
+        assert np.array_equal(i_stop, i_stop_loop)
+
+    # the portions overlap: the last peak prevails
+    driver_no_peak = ph.PhasicEstim(delta=0.1, win_pre=6, win_post=6)(s)[2]
+    i_peaks = ph.PeakDetection(delta=0.1, refractory=1, start_max=True)(s)[0]
+    i_start, i_stop = _peak_selection_loop(dt, i_peaks, 6 * FSAMP, 6 * FSAMP)
+    driver_loop = s.get_values().copy()
+    for i_st, i_sp in zip(i_start, i_stop):
+        driver_loop[i_st:i_sp] = np.arange(i_sp - i_st) * ((s[i_sp] - s[i_st]) / (i_sp - i_st)) + s[i_st]
+    assert np.any(np.array(i_stop[:-1]) > np.array(i_start[1:]))
+    assert np.array_equal(driver_no_peak, driver_loop)
@@ -0,0 +1,60 @@
+# coding=utf-8
+from __future__ import division
+
+from scipy.signal import freqz
+from . import ph, np
+
+
+def _psd_ar_reference(x, fsamp, min_order, max_order, nfft):
+    # AIC order search by one Yule-Walker system per order, solved by inversion
+    x = x - np.mean(x)
+    n = len(x)
+    r = np.correlate(x, x, 'full')[n - 1:] / n
+
+    def yule_walker(order):
+        coeffs = np.linalg.inv(np.array([[r[abs(i - j)] for j in range(order)] for i in range(order)])).dot(
+            r[1:order + 1])
+        return coeffs, r[0] - np.dot(coeffs, r[1:order + 1])
+
+    orders = np.arange(min_order, max_order + 1)
+    aics = [n * np.log(yule_walker(o)[1]) + 2 * (o + 1) for o in orders]
+    coeffs = yule_walker(orders[np.argmin(aics)])[0]
+    w, h = freqz(1, np.r_[1, -coeffs], worN=nfft)
+    return 2 * np.abs(h) / fsamp
+
+
+def test_psd_ar():
+    np.random.seed(1234)
+    for n in [50, 300, 2000]:
+        s = ph.EvenlySignal(np.sin(np.arange(n) * 0.3) + np.random.randn(n), sampling_freq=4)
+        freqs, psd = ph.PSD(method='ar', min_order=5, max_order=20, nfft=512)(s)
+        assert len(freqs) == len(psd) == 512
+        assert np.allclose(psd, _psd_ar_reference(s.get_values(), 4, 5, 20, 512))
+
+    # too short
+    freqs, psd = ph.PSD(method='ar', max_order=30)(ph.EvenlySignal(np.random.randn(30), sampling_freq=4))
+    assert len(psd) == 0
+
+
+def test_psd_batch():
+    from ..Utility import stack_windows
+    np.random.seed(1234)
+    FSAMP = 4
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(3000)), sampling_freq=FSAMP)
+    starts = np.arange(0, 3000 - 240, 60)
+    stack = stack_windows(s.get_values(), starts, 240)
+    bands = [(0, 0.04), (0.04, 0.15), (0.15, 0.4)]
+
+    for method in ['fft', 'welch', 'ar']:
+        psd = ph.PSD(method=method, nfft=512, normalize=True)
+        freqs, psds = psd.batch(stack, FSAMP)
+        assert psds.shape == (len(starts), len(freqs))
+
+        powers = ph.band_powers(freqs, psds, bands)
+        for i, start in enumerate(starts):
+            segment = s.segment_iidx(start, start + 240)
+            freqs_i, psd_i = psd(segment)
+            assert np.allclose(freqs, freqs_i)
+            assert np.allclose(psds[i], psd_i)
+            assert np.allclose(powers[i], [ph.PowerInBand(freq_min=f_min, freq_max=f_max, method=method, nfft=512,
+                                                          normalize=True)(segment) for f_min, f_max in bands])
@@ -0,0 +1,109 @@
+# coding=utf-8
+from __future__ import division
+
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+import pytest
+from . import ph, np
+
+
+def _is_memmap(x):
+    while x is not None:
+        if isinstance(x, np.memmap):
+            return True
+        x = x.base
+    return False
+
+
+def test_mmap_signals():
+    np.random.seed(1234)
+    folder = mkdtemp()
+    evenly = ph.EvenlySignal(np.random.randn(1000), sampling_freq=100, start_time=10, signal_type='EDA')
+    unevenly = ph.UnevenlySignal(np.random.randn(100), sampling_freq=100, start_time=10, signal_type='IBI',
+                                 x_values=np.cumsum(np.random.randint(1, 20, 100)), x_type='indices', duration=30)
+    multi = ph.MultiEvenly(np.random.randn(1000, 3).astype(np.float32), sampling_freq=32, start_time=5)
+    try:
+        for s in [evenly, unevenly, multi]:
+            path = os.path.join(folder, s.__class__.__name__)
+            s.to_mmap(path)
+            s2 = ph.from_mmap(path)
+
+            assert type(s2) == type(s)
+            assert _is_memmap(s2)
+            assert s2.dtype == s.dtype
+            assert np.array_equal(s2.get_values(), s.get_values())
+            assert s2.get_sampling_freq() == s.get_sampling_freq()
+            assert s2.get_start_time() == s.get_start_time()
+            assert s2.get_signal_type() == s.get_signal_type()
+            assert np.array_equal(s2.get_times(), s.get_times())
+            assert s2.get_duration() == s.get_duration()
+
+        # the segments of a memory-mapped signal are views of the file
+        multi2 = ph.from_mmap(os.path.join(folder, 'MultiEvenly'))
+        segments = [x for x in ph.FixedSegments(step=5, width=10)(multi2)]
+        assert len(segments) == len([x for x in ph.FixedSegments(step=5, width=10)(multi)])
+        seg = segments[1](multi2)
+        assert isinstance(seg, ph.MultiEvenly) and _is_memmap(seg)
+        assert seg.get_start_time() == 10
+        assert np.array_equal(seg.get_values(), multi.segment_time(10, 20).get_values())
+    finally:
+        rmtree(folder)
+
+
+def test_csv():
+    np.random.seed(1234)
+    folder = mkdtemp()
+    evenly = ph.EvenlySignal(np.random.randn(1000), sampling_freq=100, start_time=10, signal_type='EDA')
+    unevenly = ph.UnevenlySignal(np.random.randn(100), sampling_freq=100, start_time=10, signal_type='IBI',
+                                 x_values=np.cumsum(np.random.randint(1, 20, 100)), x_type='indices')
+    multi = ph.MultiEvenly(np.random.randn(1000, 3), sampling_freq=32, start_time=5)
+    try:
+        for s in [evenly, unevenly, multi]:
+            path = os.path.join(folder, s.__class__.__name__ + '.csv')
+            s.to_csv(path, comment='test')
+
+            for s2 in [ph.from_csv(path, chunk_size=64), ph.from_csv(path, path + '.mmap', chunk_size=64)]:
+                assert type(s2) == type(s)
+                assert np.array_equal(s2.get_values(), s.get_values())
+                assert s2.get_sampling_freq() == s.get_sampling_freq()
+                assert s2.get_start_time() == s.get_start_time()
+                assert s2.get_signal_type() == s.get_signal_type()
+                assert np.allclose(s2.get_times(), s.get_times())
+            assert _is_memmap(s2)
+
+            chunks = list(ph.iter_csv(path, chunk_size=300))
+            assert len(chunks) == int(np.ceil(len(s) / 300))
+            assert np.array_equal(np.concatenate([c.get_values() for c in chunks]), s.get_values())
+            if not isinstance(s, ph.UnevenlySignal):
+                for i, c in enumerate(chunks):
+                    assert np.isclose(c.get_start_time(), s.get_time(i * 300))
+
+        # channels selection and type
+        s2 = ph.from_csv(os.path.join(folder, 'MultiEvenly.csv'), usecols=[0, 2], dtype=np.float32)
+        assert s2.dtype == np.float32
+        assert np.array_equal(s2.get_values(), multi.get_values()[:, [0, 2]].astype(np.float32))
+
+        # plain files
+        path = os.path.join(folder, 'plain.txt')
+        np.savetxt(path, multi.get_values(), delimiter='\t', header='a\tb\tc', comments='')
+        s2 = ph.from_csv(path, sampling_freq=32, skip_header=1, usecols=1, delimiter='\t')
+        assert isinstance(s2, ph.EvenlySignal) and s2.get_start_time() == 0
+        assert np.array_equal(s2.get_values(), multi.get_values()[:, 1])
+
+        # blank lines are skipped, the malformed lines are reported
+        path = os.path.join(folder, 'blank.csv')
+        evenly.to_csv(path)
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.writelines(lines[:4] + ['\n'] + lines[4:500] + ['\n', '  \n'] + lines[500:] + ['\n', '\n'])
+        for s2 in [ph.from_csv(path, chunk_size=64), ph.from_csv(path, path + '.mmap', chunk_size=64)]:
+            assert np.array_equal(s2.get_values(), evenly.get_values())
+            assert s2.get_start_time() == evenly.get_start_time()
+        with open(path, 'a') as f:
+            f.write('1.0,abc\n')
+        with pytest.raises(ValueError, match='Line 1010'):
+            ph.from_csv(path, chunk_size=64)
+    finally:
+        rmtree(folder)
@@ -0,0 +1,56 @@
+# coding=utf-8
+from __future__ import division
+
+from . import ph, np
+from ..Utility import running_max, running_min, running_mean, windows_nanmean, windows_nanmoments, \
+    windows_nanmax, windows_nanmin
+
+
+def test_running_functions():
+    np.random.seed(1234)
+    x = np.random.randn(500)
+    x[[17, 250]] = np.nan
+
+    for win_len in [1, 7, 64, 500]:
+        starts = np.arange(len(x) - win_len + 1)
+        assert np.array_equal(running_max(x, win_len), [np.max(x[i:i + win_len]) for i in starts], equal_nan=True)
+        assert np.array_equal(running_min(x, win_len), [np.min(x[i:i + win_len]) for i in starts], equal_nan=True)
+        assert np.allclose(windows_nanmean(x, starts, starts + win_len),
+                           [np.nanmean(x[i:i + win_len]) for i in starts], equal_nan=True)
+
+    # windows of any length
+    starts = np.random.randint(0, 500, 200)
+    stops = np.minimum(starts + np.random.randint(1, 40, 200), 500)
+    count, mean, var = windows_nanmoments(x, starts, stops)
+    assert np.array_equal(count, [np.sum(~np.isnan(x[a:b])) for a, b in zip(starts, stops)])
+    assert np.allclose(var, [np.nanvar(x[a:b]) for a, b in zip(starts, stops)], equal_nan=True)
+    assert np.array_equal(windows_nanmax(x, starts, stops), [np.nanmax(x[a:b]) for a, b in zip(starts, stops)])
+    assert np.array_equal(windows_nanmin(x, starts, stops), [np.nanmin(x[a:b]) for a, b in zip(starts, stops)])
+
+    y = np.random.randn(500)
+    for win_len in [1, 10, 31]:
+        assert np.allclose(running_mean(y, win_len), np.convolve(y, np.ones(win_len) / win_len, mode='same'))
+
+
+def test_windowing_tools():
+    np.random.seed(1234)
+    FSAMP = 100
+    s = ph.EvenlySignal(np.cumsum(np.random.randn(3000)), sampling_freq=FSAMP)
+
+    # SignalRange: each sample has the range of the last window containing it
+    deltas = ph.SignalRange(win_len=1, win_step=0.5, smooth=False)(s)
+    assert deltas[0] == np.max(s[:100]) - np.min(s[:100])
+    assert deltas[-1] == np.max(s[2900:]) - np.min(s[2900:])
+    assert deltas[120] == np.max(s[100:200]) - np.min(s[100:200])
+
+    # windows not overlapping and with gaps
+    deltas = ph.SignalRange(win_len=0.5, win_step=1, smooth=False)(s)
+    assert deltas[70] == 0
+    assert deltas[110] == np.max(s[100:150]) - np.min(s[100:150])
+
+    # Maxima: one maximum per window, not at the window boundaries, no duplicates
+    idx_mx, mx = ph.Maxima(method='windowing', win_len=1, win_step=0.25)(s)
+    assert len(idx_mx) == len(np.unique(idx_mx))
+    assert np.array_equal(s[idx_mx], mx)
+    for i in idx_mx:
+        assert s[i] >= s[i - 1] and s[i] >= s[i + 1]
@@ -1,14 +1,17 @@
 # coding=utf-8
 from __future__ import division
 import numpy as _np
+import os as _os
 from scipy.signal import welch as _welch, periodogram as _periodogram, freqz as _freqz
 import scipy.optimize as _opt
 import pycwt.wavelet as wave
 from scipy import linalg as _linalg
 
-import itertools as _itertools
+from bisect import insort as _insort, bisect_left as _bisect_left
 from ..BaseTool import Tool as _Tool
-from ..Signal import UnevenlySignal as _UnevenlySignal, EvenlySignal as _EvenlySignal
+from ..Utility import sliding_windows as _sliding_windows, running_max as _running_max, running_min as _running_min, \
+    running_mean as _running_mean
+from ..Signal import UnevenlySignal as _UnevenlySignal, EvenlySignal as _EvenlySignal, MultiEvenly as _MultiEvenly
 
 
 class Diff(_Tool):
@@ -31,6 +34,8 @@ class Diff(_Tool):
         assert degree > 0, "The degree value should be positive"
         _Tool.__init__(self, degree=degree)
 
+    _channel_vectorized = True
+
     @classmethod
     def algorithm(cls, signal, params):
         """
@@ -41,10 +46,12 @@ class Diff(_Tool):
         sig_1 = signal[:-degree]
         sig_2 = signal[degree:]
 
-        out = _EvenlySignal(values=sig_2 - sig_1,
-                            sampling_freq=signal.get_sampling_freq(),
-                            signal_type=signal.get_signal_type(),
-                            start_time=signal.get_start_time() + degree / signal.get_sampling_freq())
+        # the channels of a MultiEvenly are computed at once
+        cls_out = _MultiEvenly if isinstance(signal, _MultiEvenly) else _EvenlySignal
+        out = cls_out(values=sig_2 - sig_1,
+                      sampling_freq=signal.get_sampling_freq(),
+                      signal_type=signal.get_signal_type(),
+                      start_time=signal.get_start_time() + degree / signal.get_sampling_freq())
 
         return out
 class PeakDetection(_Tool):
@@ -62,6 +69,9 @@ class PeakDetection(_Tool):
         Seconds to skip after a detected paek to look for new peaks.
     start_max : boolean, default = True
         Whether to start looking for a maximum or (False) for a minimum.
+    engine : str, default = 'vectorized'
+        Implementation used for the detection: 'vectorized' searches each peak on blocks of samples with numpy,
+        'loop' scans the signal one sample at a time. Both return the same results.
 
     Returns
     -------
@@ -75,12 +85,16 @@ class PeakDetection(_Tool):
         Array containing values of the minima
     """
 
-    def __init__(self, delta, refractory=0, start_max=True):
+    def __init__(self, delta, refractory=0, start_max=True, engine='vectorized'):
         delta = _np.array(delta)
         assert delta.ndim <= 1, "Delta value should be 1 or 0-dimensional"
         assert delta.all() > 0, "Delta value/s should be positive"
         assert refractory >= 0, "Refractory value should be non negative"
-        _Tool.__init__(self, delta=delta, refractory=refractory, start_max=start_max)
+        assert engine in ['vectorized', 'loop'], "Parameter engine should be in ['vectorized', 'loop']"
+        _Tool.__init__(self, delta=delta, refractory=refractory, start_max=start_max, engine=engine)
+
+    # Initial number of samples scanned at once by the vectorized engine
+    _CHUNK = 256
 
     @classmethod
     def algorithm(cls, signal, params):
@@ -90,8 +104,26 @@ class PeakDetection(_Tool):
         else:  # else transform the refractory from seconds to samples
             refractory = refractory * signal.get_sampling_freq()
         look_for_max = params['start_max']
-        delta = params['delta']
+        delta = _np.asarray(params['delta'])
+        engine = params['engine'] if 'engine' in params else 'vectorized'
 
+        if len(signal) < 1:
+            cls.warn("Empty signal (len < 1), returning empty.")
+            return _np.array([]), _np.array([]), _np.array([]), _np.array([])
+        elif delta.ndim != 0 and len(delta) != len(signal):
+            cls.error("delta vector's length differs from signal's one, returning empty.")
+            return _np.array([]), _np.array([]), _np.array([]), _np.array([])
+
+        if engine == 'loop':
+            return cls._detect_loop(signal, delta, refractory, look_for_max)
+        else:
+            return cls._detect_vectorized(_np.asarray(signal), delta, refractory, look_for_max)
+
+    @classmethod
+    def _detect_loop(cls, signal, delta, refractory, look_for_max):
+        """
+        Reference implementation: scans the signal one sample at a time.
+        """
         minp = []
         maxp = []
 
@@ -102,51 +134,120 @@ class PeakDetection(_Tool):
         if scalar:
             d = delta
 
-        if len(signal) < 1:
-            cls.warn("Empty signal (len < 1), returning empty.")
-        elif not scalar and len(delta) != len(signal):
-            cls.error("delta vector's length differs from signal's one, returning empty.")
-        else:
-            mn_pos_candidate = mx_pos_candidate = 0
-            mn_candidate = mx_candidate = signal[0]
+        mn_pos_candidate = mx_pos_candidate = 0
+        mn_candidate = mx_candidate = signal[0]
 
-            i_activation_min = 0
-            i_activation_max = 0
+        i_activation_min = 0
+        i_activation_max = 0
 
-            for i in range(1, len(signal)):
-                sample = signal[i]
-                if not scalar:
-                    d = delta[i]
+        for i in range(1, len(signal)):
+            sample = signal[i]
+            if not scalar:
+                d = delta[i]
+
+            if sample > mx_candidate:
+                mx_candidate = sample
+                mx_pos_candidate = i
+            if sample < mn_candidate:
+                mn_candidate = sample
+                mn_pos_candidate = i
+
+            if look_for_max:
+                if i >= i_activation_max and sample < mx_candidate - d:  # new max
+                    maxp.append(mx_pos_candidate)
+                    maxv.append(mx_candidate)
+                    i_activation_max = i + refractory
 
-                if sample > mx_candidate:
-                    mx_candidate = sample
-                    mx_pos_candidate = i
-                if sample < mn_candidate:
                     mn_candidate = sample
                     mn_pos_candidate = i
 
-                if look_for_max:
-                    if i >= i_activation_max and sample < mx_candidate - d:  # new max
-                        maxp.append(mx_pos_candidate)
-                        maxv.append(mx_candidate)
-                        i_activation_max = i + refractory
+                    look_for_max = False
+            else:
+                if i >= i_activation_min and sample > mn_candidate + d:  # new min
+                    minp.append(mn_pos_candidate)
+                    minv.append(mn_candidate)
+                    i_activation_min = i + refractory
+
+                    mx_candidate = sample
+                    mx_pos_candidate = i
+
+                    look_for_max = True
+
+        return _np.array(maxp), _np.array(minp), _np.array(maxv), _np.array(minv)
+
+    @classmethod
+    def _detect_vectorized(cls, values, delta, refractory, look_for_max):
+        """
+        Same detection as _detect_loop, but each search for the next max (min) is done on blocks of samples
+        using the running max (min) of the block, so that the Python loop runs once per peak instead of once
+        per sample.
+        """
+        n = len(values)
+        scalar = delta.ndim == 0
+
+        minp = []
+        maxp = []
 
-                        mn_candidate = sample
-                        mn_pos_candidate = i
+        i_activation_min = 0
+        i_activation_max = 0
 
-                        look_for_max = False
+        # index where the current candidate was (re)initialized
+        start = 0
+        len_block = cls._CHUNK
+
+        while start < n - 1:
+            if _np.isnan(values[start]):
+                # a NaN candidate is never replaced nor exceeded: no more peaks can be found
+                break
+
+            i_activation = i_activation_max if look_for_max else i_activation_min
+            i_first = max(start + 1, int(_np.ceil(i_activation)))
+            if i_first >= n:
+                break
+
+            len_block = max(len_block, 2 * (i_first - start))
+            while True:
+                stop = min(start + len_block, n)
+                portion = values[start:stop]
+                d = delta if scalar else delta[start:stop]
+
+                if look_for_max:
+                    envelope = _np.fmax.accumulate(portion)
+                    found = portion < envelope - d
                 else:
-                    if i >= i_activation_min and sample > mn_candidate + d:  # new min
-                        minp.append(mn_pos_candidate)
-                        minv.append(mn_candidate)
-                        i_activation_min = i + refractory
+                    envelope = _np.fmin.accumulate(portion)
+                    found = portion > envelope + d
+                found[:i_first - start] = False
 
-                        mx_candidate = sample
-                        mx_pos_candidate = i
+                if found.any() or stop == n:
+                    break
+                len_block *= 2
 
-                        look_for_max = True
+            if not found.any():
+                break
 
-        return _np.array(maxp), _np.array(minp), _np.array(maxv), _np.array(minv)
+            k = int(_np.argmax(found))
+            # the candidate is the first sample reaching the running max (min)
+            pos = start + int(_np.argmax(portion[:k + 1] == envelope[k]))
+            i = start + k
+
+            if look_for_max:
+                maxp.append(pos)
+                i_activation_max = i + refractory
+            else:
+                minp.append(pos)
+                i_activation_min = i + refractory
+
+            # next block: twice the length of the last search, to limit the number of extensions
+            len_block = max(cls._CHUNK, 2 * k)
+            start = i
+            look_for_max = not look_for_max
+
+        maxp = _np.array(maxp)
+        minp = _np.array(minp)
+        maxv = values[maxp] if len(maxp) > 0 else _np.array([])
+        minv = values[minp] if len(minp) > 0 else _np.array([])
+        return maxp, minp, maxv, minv
 
 
 class PeakSelection(_Tool):
@@ -186,44 +287,25 @@ class PeakSelection(_Tool):
 
         ZERO = 0.01
 
-        i_start = _np.empty(len(i_peaks), int)
-        i_stop = _np.empty(len(i_peaks), int)
-
-        signal_dt = Diff()(signal)
-        for i in range(len(i_peaks)):
-            i_pk = int(i_peaks[i])
-
-            if i_pk < i_pre_max:
-                i_st = 0
-                i_sp = i_pk + i_post_max
-            elif i_pk >= len(signal_dt) - i_post_max:
-                i_st = i_pk - i_pre_max
-                i_sp = len(signal_dt) - 1
-            else:
-                i_st = i_pk - i_pre_max
-                i_sp = i_pk + i_post_max
-
-            # find START
-            signal_dt_pre = signal_dt[i_st:i_pk]
-            i_pre = len(signal_dt_pre) - 1
-
-            # OR below is to allow small fluctuations (?)
-
-            while i_pre > 0 and (signal_dt_pre[i_pre] > 0 or abs(signal_dt_pre[i_pre]) <= ZERO):
-                i_pre -= 1
+        i_peaks = _np.asarray(i_peaks).astype(int).reshape(-1)
+        signal_dt = _np.asarray(Diff()(signal))
+        n_dt = len(signal_dt)
 
-            i_start[i] = i_st + i_pre + 1
+        # portion [i_st, i_sp) of the derivative around each peak
+        i_st = _np.where(i_peaks < i_pre_max, 0, i_peaks - i_pre_max)
+        i_sp = _np.where((i_peaks >= i_pre_max) & (i_peaks >= n_dt - i_post_max), n_dt - 1, i_peaks + i_post_max)
 
-            # find STOP
-            signal_dt_post = signal_dt[i_pk: i_sp]
-            i_post = 1
+        # (the ORs below allow small fluctuations)
+        # the START follows the last sample before the peak where the derivative is not positive or ~0
+        i_breaks = _np.r_[-1, _np.flatnonzero(~((signal_dt > 0) | (_np.abs(signal_dt) <= ZERO)))]
+        i_break = i_breaks[_np.searchsorted(i_breaks, i_peaks - 1, side='right') - 1]
+        i_start = _np.where(i_peaks - i_st <= 1, i_peaks, _np.maximum(i_break, i_st) + 1)
 
-            # OR below is to allow small fluctuations (?)
-            while i_post < len(signal_dt_post) - 1 and (
-                            signal_dt_post[i_post] < 0 or abs(signal_dt_post[i_post]) <= ZERO):
-                i_post += 1
-
-            i_stop[i] = i_pk + i_post
+        # the STOP is the first sample after the peak where the derivative is not negative or ~0
+        i_breaks = _np.r_[_np.flatnonzero(~((signal_dt < 0) | (_np.abs(signal_dt) <= ZERO))), n_dt]
+        i_break = i_breaks[_np.minimum(_np.searchsorted(i_breaks, i_peaks + 1), len(i_breaks) - 1)]
+        len_post = _np.minimum(i_sp, n_dt) - i_peaks
+        i_stop = i_peaks + _np.where(len_post <= 1, 1, _np.minimum(i_break - i_peaks, len_post - 1))
 
         return i_start, i_stop
 
@@ -269,24 +351,76 @@ class SignalRange(_Tool):
             cls.warn("Input signal is shorter than the window length.")
             return _np.max(signal) - _np.min(signal)
         else:
-            windows = _np.arange(0, len(signal) - idx_len + 1, idx_step)
-            deltas = _np.zeros(len(signal))
-
-            curr_delta = 0
-            for start in windows:
-                portion_curr = signal[start: start + idx_len]
-                curr_delta = _np.max(portion_curr) - _np.min(portion_curr)
-                deltas[start:start + idx_len] = curr_delta
+            values = _np.asarray(signal)
+            n_windows = (len(values) - idx_len) // idx_step + 1
+            ranges = _running_max(values, idx_len)[::idx_step] - _running_min(values, idx_len)[::idx_step]
 
-            deltas[windows[-1] + idx_len:] = curr_delta
+            # each sample takes the range of the last window that contains it
+            idx = _np.arange(len(values))
+            i_win = _np.minimum(idx // idx_step, n_windows - 1)
+            covered = (idx - i_win * idx_step < idx_len) | (i_win == n_windows - 1)
+            deltas = _np.where(covered, ranges[i_win], 0)
 
             if smooth:
                 win_len = int(win_len*2*fsamp)
-                deltas = _np.convolve(deltas, _np.ones(win_len)/win_len, mode='same')
+                deltas = _running_mean(deltas, win_len)
 
             return deltas
 
 
+def _autocovariance(x, n_lags):
+    """
+    Returns the sums x[i] * x[i + lag] for lag in 0...n_lags - 1 (as numpy.correlate(x, x, 'full')[len(x) - 1:]),
+    computed with the FFT.
+    """
+    nfft = 2 ** int(_np.ceil(_np.log2(2 * len(x) - 1)))
+    f = _np.fft.rfft(x, nfft)
+    return _np.fft.irfft(f * _np.conj(f), nfft)[:n_lags]
+
+
+def _levinson_errors(r, max_order):
+    """
+    Levinson-Durbin recursion on the autocorrelation r: returns the prediction error of the autoregressive models of
+    orders 1...max_order.
+    """
+    a = _np.zeros(max_order)
+    p = r[0]
+    errors = _np.zeros(max_order)
+    for k in range(max_order):
+        temp = -(r[k + 1] + _np.dot(a[:k], r[k:0:-1])) / p
+        p = p * (1. - temp ** 2)
+        a[:k] = a[:k] + temp * a[:k][::-1]
+        a[k] = temp
+        errors[k] = p
+    return errors
+
+
+def _psd_ar(x, fsamp, min_order, max_order, nfft, mean_removed):
+    """
+    PSD of the autoregressive model of x, with order in [min_order, max_order] selected by AIC.
+    """
+    x = _np.asarray(x, dtype=float)
+    N = len(x)
+
+    # AIC of the Yule-Walker models of all the orders from the prediction errors of one Levinson-Durbin pass
+    # (as in library spectrum: https://github.com/cokelaer/spectrum)
+    acov = _autocovariance(x, max_order + 1)
+    errors = _levinson_errors(acov / N, max_order)
+    orders = _np.arange(min_order, max_order + 1)
+    aics = N * _np.log(errors[orders - 1]) + 2 * (orders + 1)
+    best_order = orders[_np.argmin(aics)]
+
+    # Yule-Walker coefficients, methods derived from: https://github.com/mpastell/pyageng
+    if not mean_removed:
+        acov = _autocovariance(x - _np.mean(x), max_order + 1)
+    acor = acov / acov[0]
+    ar_params = _linalg.solve_toeplitz(acor[:best_order], acor[1:best_order + 1])
+    a = _np.concatenate([_np.ones(1), -ar_params])
+    w, P = _freqz(1, a, whole = False, worN = nfft)
+
+    return 2*_np.abs(P)/fsamp
+
+
 class PSD(_Tool):
     """
     Estimate the power spectral density (PSD) of the signal.
@@ -344,106 +478,73 @@ class PSD(_Tool):
 
     @classmethod
     def algorithm(cls, signal, params):
+        assert isinstance(signal, _EvenlySignal), "The PSD can be computed on EvenlySignals only. Consider interpolating the signal: signal.resample(fsamp)"
+
+        return cls._estimate(signal.get_values(), signal.get_sampling_freq(), params)
+
+    def batch(self, segments, sampling_freq):
+        """
+        Estimates the PSD of many segments of the same length at once, with one vectorized FFT (one AR model per
+        segment with method 'ar').
+
+        Parameters
+        ----------
+        segments : numpy.array
+            Segments (N_SEGMENTS x N_SAMPLES), e.g. from pyphysio.Utility.stack_windows
+        sampling_freq : float, >0
+            Sampling frequency of the segments
+
+        Returns
+        -------
+        freq : numpy.array
+            Frequencies
+        psd : numpy.array
+            Power Spectrum Density of each segment (N_SEGMENTS x N_FREQUENCIES)
+        """
+        segments = _np.asarray(segments)
+        assert segments.ndim == 2, "The segments should be a 2-D array (N_SEGMENTS x N_SAMPLES)"
+        return self._estimate(segments, sampling_freq, self._params)
+
+    @classmethod
+    def _estimate(cls, values, fsamp, params):
+        # PSD of the values, along the last axis
         method = params['method']
         nfft = params['nfft'] if "nfft" in params else None
         window = params['window']
         normalize = params['normalize']
         remove_mean = params['remove_mean']
 
-        assert isinstance(signal, _EvenlySignal), "The PSD can be computed on EvenlySignals only. Consider interpolating the signal: signal.resample(fsamp)"
-
-        fsamp = signal.get_sampling_freq()
-
         if remove_mean:
-            signal = signal - _np.mean(signal)
+            values = values - _np.mean(values, axis=-1, keepdims=True)
 
         if method == 'fft':
-            freqs, psd = _periodogram(signal, fs=fsamp, window = window, nfft=nfft, return_onesided=True)
+            freqs, psd = _periodogram(values, fs=fsamp, window = window, nfft=nfft, return_onesided=True, axis=-1)
 
         elif method == 'welch':
-            freqs, psd = _welch(signal, fsamp, window=window, return_onesided=True, nfft=nfft)
+            freqs, psd = _welch(values, fsamp, window=window, return_onesided=True, nfft=nfft, axis=-1)
 
         elif method == 'ar':
             cls.warn("Using AR method: results might not be comparable with other methods")
-            #methods derived from: https://github.com/mpastell/pyageng
-            def autocorr(x, lag=30):
-                c = _np.correlate(x, x, 'full')
-                mid = len(c)//2
-                acov = c[mid:mid+lag]
-                acor = acov/acov[0]
-                return(acor)
-                
-            def aryw(x, order=30):
-                x = x - _np.mean(x)
-                ac = autocorr(x, order+1)
-                R = _linalg.toeplitz(ac[:order])
-                r = ac[1:order+1]
-                params = _np.linalg.inv(R).dot(r)
-                return(params)
-                
-            def AIC_yule(signal, order):
-                #this is from library spectrum: https://github.com/cokelaer/spectrum
-                N = len(signal)
-                assert N>=order, "The number of samples in the signal should be >= to the model order"
-                
-                C = _np.correlate(signal, signal, mode='full')/N
-                r = C[N-1:]
-                
-                T0  = r[0]
-                T = r[1:]
-                
-                A = _np.zeros(order, dtype=float)
-                P = T0
-                
-                for k in range(0, order):
-                    save = T[k]
-                    if k == 0:
-                        temp = -save / P
-                    else:
-                        for j in range(0, k):
-                            save = save + A[j] * T[k-j-1]
-                        temp = -save / P
-                    
-                    P = P * (1. - temp**2.)
-                    A[k] = temp
-                
-                    khalf = (k+1)//2
-                    for j in range(0, khalf):
-                        kj = k-j-1
-                        save = A[j]
-                        A[j] = save + temp * A[kj]
-                        if j != kj:
-                            A[kj] += temp*save
-                
-                res = N * _np.log(P) + 2*(order + 1)
-                return(res)
-            
             min_order = params['min_order']
             max_order = params['max_order']
 
-            if len(signal) <= max_order:
+            if values.shape[-1] <= max_order:
                 cls.warn("Input signal too short: try another 'method', a lower 'max_order', or a longer signal")
                 return [], []
 
-            orders = _np.arange(min_order, max_order + 1)
-            aics = [AIC_yule(signal, x) for x in orders]
-            best_order = orders[_np.argmin(aics)]
+            psd = _np.array([_psd_ar(x, fsamp, min_order, max_order, nfft, remove_mean)
+                             for x in _np.reshape(values, (-1, values.shape[-1]))])
+            psd = psd.reshape(values.shape[:-1] + psd.shape[-1:])
 
-            params = aryw(signal, best_order)
-            a = _np.concatenate([_np.ones(1), -params])
-            w, P = _freqz(1, a, whole = False, worN = nfft)
-            
-            psd = 2*_np.abs(P)/fsamp
-            
         else:
             cls.warn('Method not understood, using welch.')
-            bands_w, psd = _welch(signal, fsamp, nfft=nfft, scaling = 'spectrum')
+            bands_w, psd = _welch(values, fsamp, nfft=nfft, scaling = 'spectrum', axis=-1)
 
-        freqs = _np.linspace(start=0, stop=fsamp / 2, num=len(psd))
+        freqs = _np.linspace(start=0, stop=fsamp / 2, num=psd.shape[-1])
 
         # NORMALIZE
         if normalize:
-            psd /= _np.sum(psd)
+            psd /= _np.sum(psd, axis=-1, keepdims=True)
         return freqs, psd
 
 
@@ -549,29 +650,18 @@ class Maxima(_Tool):
             # TODO (Andrea): check that winlen > 2
             # TODO (Andrea): check that winstep >= 1
 
-            idx_maxs = [_np.nan]
-            maxs = [_np.nan]
-
-            if winlen < len(signal):
-                idx_start = _np.arange(0, len(signal) - winlen + 1, winstep)
-            else:
-                idx_start = [0]
+            values = _np.asarray(signal)
+            if winlen >= len(values):
+                winlen = len(values)
 
-            for idx_st in idx_start:
-                idx_sp = idx_st + winlen
-                if idx_sp > len(signal):
-                    idx_sp = len(signal)
-                curr_win = signal[idx_st: idx_sp]
-                curr_idx_max = _np.argmax(curr_win) + idx_st
-                curr_max = _np.max(curr_win)
+            idx_start = _np.arange(0, len(values) - winlen + 1, winstep)
+            idx_maxs = idx_start + _np.argmax(_sliding_windows(values, winlen, winstep), axis=1)
 
-                # peak not already detected & peak not at the beginnig/end of the window:
-                if curr_idx_max != idx_maxs[-1] and curr_idx_max != idx_st and curr_idx_max != idx_sp - 1:
-                    idx_maxs.append(curr_idx_max)
-                    maxs.append(curr_max)
-            idx_maxs = idx_maxs[1:]
-            maxs = maxs[1:]
-            return _np.array(idx_maxs), _np.array(maxs)
+            # peak not at the beginnig/end of the window
+            idx_maxs = idx_maxs[(idx_maxs != idx_start) & (idx_maxs != idx_start + winlen - 1)]
+            # peak not already detected (the position of the maximum is non decreasing along the windows)
+            idx_maxs = idx_maxs[_np.r_[True, _np.diff(idx_maxs) != 0]] if len(idx_maxs) > 0 else idx_maxs
+            return idx_maxs, values[idx_maxs]
 
 
 class Minima(_Tool):
@@ -811,6 +901,84 @@ class Slopes(_Tool):
         return slopes
 
 
+class OutliersStream(object):
+    """
+    Detector of the outlier IBI with persistent state, to check a stream of IBI as they arrive, with the same
+    semantics of BeatOutliers. Get one from BeatOutliers.stream.
+
+    The accepted IBI are kept in a ring buffer of `cache` values, together with their sorted copy (NaNs are counted
+    apart) so that the median is updated in O(cache) instead of being recomputed.
+    """
+
+    def __init__(self, ibi_expected, cache, sensitivity):
+        self._ibi_expected = float(ibi_expected)
+        self._cache = int(cache)
+        self._sensitivity = sensitivity
+        self.reset()
+
+    def reset(self):
+        """
+        Reinitializes the cache with the expected IBI.
+        """
+        self._ring = [self._ibi_expected] * self._cache
+        self._pos = 0
+        self._sorted = list(self._ring) if self._ibi_expected == self._ibi_expected else []
+        self._n_nan = self._cache - len(self._sorted)
+        self._counter_bad = 0
+
+    def _median(self):
+        if self._n_nan > 0:
+            return _np.nan
+        half = self._cache // 2
+        if self._cache % 2 == 1:
+            return self._sorted[half]
+        return (self._sorted[half - 1] + self._sorted[half]) / 2
+
+    def _accept(self, ibi):
+        old = self._ring[self._pos]
+        if old != old:
+            self._n_nan -= 1
+        else:
+            del self._sorted[_bisect_left(self._sorted, old)]
+        if ibi != ibi:
+            self._n_nan += 1
+        else:
+            _insort(self._sorted, ibi)
+        self._ring[self._pos] = ibi
+        self._pos = (self._pos + 1) % self._cache
+
+    def push(self, ibi):
+        """
+        Checks the next IBI.
+        :param ibi: The IBI value
+        :return: 1 if the IBI is too long, -1 if it is too short, 0 if it is accepted
+        """
+        curr_median = self._median()
+        if ibi > curr_median * (1 + self._sensitivity):
+            result = 1
+        elif ibi < curr_median * (1 - self._sensitivity):
+            result = -1
+        else:
+            result = 0
+        if result != 0:
+            self._counter_bad += 1
+        else:
+            self._accept(ibi)
+            self._counter_bad = 0
+        if self._counter_bad == self._cache:  # ibi cache probably corrupted, reinitialize
+            self.reset()
+        return result
+
+    def check(self, ibis):
+        """
+        Checks the next IBI.
+        :param ibis: Array of the next IBI values
+        :return: Boolean array, True for the outliers
+        """
+        ibis = _np.asarray(ibis, dtype=float)
+        return _np.array([self.push(curr_ibi) != 0 for curr_ibi in ibis.tolist()], dtype=bool)
+
+
 class BeatOutliers(_Tool):
     """
     Detects outliers in the IBI signal. 
@@ -832,7 +1000,8 @@ class BeatOutliers(_Tool):
     
     Notes
     -----
-    It only detects outliers. You should manually remove outliers using FixIBI
+    It only detects outliers. You should manually remove outliers using FixIBI.
+    Use BeatOutliers.stream to check the IBI of a live recording as they arrive.
     
     """
 
@@ -847,6 +1016,16 @@ class BeatOutliers(_Tool):
     def get_signal_type(cls):
         return ['IBI']
 
+    def stream(self, ibi_expected=None):
+        """
+        Returns an OutliersStream to check the IBI as they arrive.
+        :param ibi_expected: IBI value used to initialize the cache, required if the parameter ibi_median is 0
+        """
+        if self._params["ibi_median"] != 0:
+            ibi_expected = self._params["ibi_median"]
+        assert ibi_expected is not None, "ibi_expected is required when ibi_median is 0"
+        return OutliersStream(ibi_expected, self._params["cache"], self._params["sensitivity"])
+
     @classmethod
     def algorithm(cls, signal, params):
         cache, sensitivity, ibi_median = params["cache"], params["sensitivity"], params["ibi_median"]
@@ -856,34 +1035,9 @@ class BeatOutliers(_Tool):
         else:
             ibi_expected = float(ibi_median)
 
-        id_bad_ibi = []
-        ibi_cache = _np.repeat(ibi_expected, cache)
-        counter_bad = 0
-
-        # missings = []
-        idx_ibi = signal.get_indices()
-        ibi = signal.get_values()
-        for i in range(1, len(idx_ibi)):
-            curr_median = _np.median(ibi_cache)
-
-            curr_ibi = ibi[i]
-
-            if curr_ibi > curr_median * (1 + sensitivity):  # abnormal peak:
-                id_bad_ibi.append(i)  # append ibi id to the list of bad ibi
-                counter_bad += 1
-            # missings.append([idx_ibi[i-1],idx_ibi[i]])
-
-            elif curr_ibi < curr_median * (1 - sensitivity):  # abnormal peak:
-                id_bad_ibi.append(i)  # append ibi id to the list of bad ibi
-                counter_bad += 1
-            else:
-                ibi_cache = _np.r_[ibi_cache[1:], curr_ibi]
-                counter_bad = 0
-            if counter_bad == cache:  # ibi cache probably corrupted, reinitialize
-                ibi_cache = _np.repeat(ibi_expected, cache)
-                counter_bad = 0
-
-        return id_bad_ibi
+        # the first IBI is not checked
+        bad = OutliersStream(ibi_expected, cache, sensitivity).check(signal.get_values()[1:])
+        return (_np.flatnonzero(bad) + 1).tolist()
 
 
 class FixIBI(_Tool):
@@ -953,6 +1107,10 @@ class BeatOptimizer(_Tool):
 
     Notes
     -----
+        The IBI are checked forward and backward as in BeatOutliers, removing the beats giving a too short IBI.
+        The beats of the two passes are paired and the combination with the most regular IBI is found by dynamic
+        programming, in a time linear in the number of beats.
+
         Bizzego et al., *DBD-RCO: Derivative Based Detection and Reverse Combinatorial Optimization 
         to improve heart beat detection for wearable devices for info about the algorithm*
     """
@@ -969,145 +1127,97 @@ class BeatOptimizer(_Tool):
     def get_signal_type(cls):
         return ['IBI']
 
+    @staticmethod
+    def _derivative_pass(idx, ibi_expected, cache, sensitivity):
+        # keeps the beats giving an accepted or too long IBI (a missed beat), removes the ones giving a too short IBI
+        # (a false detection): the following IBI is computed from the last kept beat
+        stream = OutliersStream(ibi_expected, cache, sensitivity)
+        kept = [idx[0]]
+        for curr_idx in idx[1:]:
+            if stream.push(curr_idx - kept[-1]) >= 0:
+                kept.append(curr_idx)
+        return _np.array(kept)
+
+    @staticmethod
+    def _pair(idx_1, idx_2, b):
+        # the beats of the backward pass not within b of a beat of the forward pass are added
+        pos = _np.clip(_np.searchsorted(idx_1, idx_2), 1, len(idx_1) - 1)
+        dist = _np.minimum(_np.abs(idx_2 - idx_1[pos - 1]), _np.abs(idx_2 - idx_1[pos]))
+        idx_1 = _np.union1d(idx_1, idx_2[dist > b])
+
+        # each beat is paired to itself if in both passes, else to the first beat of the backward pass within b
+        pairs = _np.column_stack([idx_1, idx_1])
+        first = _np.searchsorted(idx_2, idx_1 - b)
+        found = (first < len(idx_2)) & ~_np.isin(idx_1, idx_2)
+        found[found] = idx_2[first[found]] <= idx_1[found] + b
+        found[0] = False
+        pairs[found, 1] = idx_2[first[found]]
+        return pairs
+
+    @staticmethod
+    def _optimize(pairs):
+        # choose one beat of each pair, minimizing the sum of the absolute second differences of the beat indices
+        # (i.e. of the variations of the IBI) with increasing indices. Dynamic programming on the choices of the last
+        # two beats: O(n) instead of the 2^n combinations. Ties prefer the forward beat.
+        cand = pairs.tolist()
+        n = len(cand)
+        if n < 3:
+            return pairs[:, 0]
+        inf = float('inf')
+        # cost[a][b]: best cost up to beat i with choices a for beat i - 1 and b for beat i
+        cost = [[0. if cand[1][j] > cand[0][k] else inf for j in (0, 1)] for k in (0, 1)]
+        back = []
+        for i in range(2, n):
+            c0, c1, c2 = cand[i - 2], cand[i - 1], cand[i]
+            new_cost = [[inf, inf], [inf, inf]]
+            new_back = [[0, 0], [0, 0]]
+            for a in (0, 1):
+                for j in (0, 1):
+                    if c2[j] <= c1[a]:
+                        continue
+                    for z in (0, 1):
+                        c = cost[z][a] + abs(c2[j] - 2 * c1[a] + c0[z])
+                        if c < new_cost[a][j]:
+                            new_cost[a][j] = c
+                            new_back[a][j] = z
+            cost = new_cost
+            back.append(new_back)
+
+        a, j = min(((a, j) for a in (0, 1) for j in (0, 1)), key=lambda aj: cost[aj[0]][aj[1]])
+        choice = [j, a]
+        for new_back in back[::-1]:
+            a, j = new_back[a][j], a
+            choice.append(a)
+        return pairs[_np.arange(n), choice[::-1]]
+
     @classmethod
     def algorithm(cls, signal, params):
-        cls.error('Not implemented')
-        return signal
-
         b, cache, sensitivity, ibi_median = params["B"], params["cache"], params["sensitivity"], params["ibi_median"]
 
         fsamp = signal.get_sampling_freq()
+        idx_ibi = _np.asarray(signal.get_indices())
+
+        # the IBI in samples
+        if ibi_median == 0:
+            ibi_expected = float(_np.median(_np.diff(idx_ibi)))
+        else:
+            ibi_expected = ibi_median * fsamp
+
+        idx_st = idx_ibi[0]
+        idx_ibi = idx_ibi - idx_st
 
         # FORWARD
-        id_bad_ibi_F = BeatOutliers(ibi_median=ibi_median, cache=cache, sensitivity=sensitivity)(signal)
-
-        # BACKWARD
-        # reverse the signal
-        idx_reverse = signal.get_indices()
-
-        idx_reverse = -1 * (idx_reverse - idx_reverse[-1])[::-1]
-        ibi_reverse = _np.diff(idx_reverse)
-        ibi_reverse = _np.r_[ibi_reverse[0], ibi_reverse]
-
-        ibi_reverse = _UnevenlySignal(ibi_reverse / fsamp, x_values=idx_reverse, x_type='indices',
-                                      duration=signal.get_duration())
-
-        id_bad_ibi_b = BeatOutliers(ibi_median=ibi_median, cache=cache, sensitivity=sensitivity)(ibi_reverse)
-
-        id_bad_ibi_B = -1 * (_np.array(id_bad_ibi_b) - len(ibi_reverse))[::-1]
-
-        # idx_1
-        ###
-        # add indexes of idx_ibi_2 which are not in idx_ibi_1 but close enough
-        b = b * fsamp
-        for i_2 in range(1, len(idx_2)):
-            curr_idx_2 = idx_2[i_2]
-            if not (curr_idx_2 in idx_1):
-                i_1 = _np.where((idx_1 >= curr_idx_2 - b) & (idx_1 <= curr_idx_2 + b))[0]
-                if not len(i_1) > 0:
-                    idx_1 = _np.r_[idx_1, curr_idx_2]
-        idx_1 = _np.sort(idx_1)
-
-        ###
-        # create pairs for each beat
-        pairs = [[0, 0]]
-        for i_1 in range(1, len(idx_1)):
-            curr_idx_1 = idx_1[i_1]
-            if curr_idx_1 in idx_2:
-                pairs.append([curr_idx_1, curr_idx_1])
-            else:
-                i_2 = _np.where((idx_2 >= curr_idx_1 - b) & (idx_2 <= curr_idx_1 + b))[0]
-                if len(i_2) > 0:
-                    i_2 = i_2[0]
-                    pairs.append([curr_idx_1, idx_2[i_2]])
-                else:
-                    pairs.append([curr_idx_1, curr_idx_1])
-        pairs = _np.array(pairs)
-
-        ########################################
-        # define zones where there are different values
-        diff_idxs = pairs[:, 0] - pairs[:, 1]
-        diff_idxs[diff_idxs != 0] = 1
-        diff_idxs = _np.diff(diff_idxs)
-
-        starts = _np.where(diff_idxs > 0)[0]
-        stops = _np.where(diff_idxs < 0)[0]
-
-        if len(starts) == 0:  # no differences
-            # keep the 'outliers removed' version
-            idx_1 = idx_1 + idx_st
-            return _UnevenlySignal(ibi_1 / fsamp, sampling_freq=fsamp, signal_type="IBI",
-                                   start_time=signal.get_start_time(), x_values=idx_1, x_type='indices',
-                                   duration=signal.get_duration())
-
-        if len(stops) == 0:
-            stops = _np.array([starts[-1] + 1])
-
-        if starts[0] >= stops[0]:
-            stops = stops[1:]
-
-        stops += 1
-
-        if len(starts) > len(stops):
-            stops = _np.r_[stops, starts[-1] + 1]
-
-        # split long sequences
-        new_starts = _np.copy(starts)
-        new_stops = _np.copy(stops)
-
-        add_index = 0
-        lens = stops - starts
-        for i in range(len(starts)):
-            l = lens[i]
-            if l > 10:
-                curr_st = starts[i]
-                curr_sp = stops[i]
-                new_st = _np.arange(curr_st, curr_sp, 4)
-                new_sp = new_st + 4
-                new_sp[-1] = curr_sp
-                new_starts = _np.delete(new_starts, i + add_index)
-                new_stops = _np.delete(new_stops, i + add_index)
-                new_starts = _np.insert(new_starts, i + add_index, new_st)
-                new_stops = _np.insert(new_stops, i + add_index, new_sp)
-                add_index = add_index + len(new_st) - 1
-
-        starts = new_starts
-        stops = new_stops
-
-        ########################################
-        # find best combination
-        idx_out = _np.copy(pairs[:, 0])
-        for i in range(len(starts)):
-            i_st = starts[i]
-            i_sp = stops[i]
-
-            if i_sp > len(idx_out) - 1:
-                i_sp = len(idx_out) - 1
-
-            curr_portion = _np.copy(pairs[i_st - 1: i_sp + 1, :])
-
-            best_portion = None
-            best_error = _np.Inf
-
-            combinations = list(_itertools.product([0, 1], repeat=i_sp - i_st - 1))
-            for comb in combinations:
-                cand_portion = _np.copy(curr_portion[:, 0])
-                for k in range(len(comb)):
-                    bit = comb[k]
-                    cand_portion[k + 2] = curr_portion[k + 2, bit]
-                cand_error = sum(abs(_np.diff(_np.diff(cand_portion))))
-                if cand_error < best_error:
-                    best_portion = cand_portion
-                    best_error = cand_error
-            idx_out[i_st - 1: i_sp + 1] = best_portion
-
-        ###
-        # finalize arrays
-        idx_out = _np.array(idx_out) + idx_st
-        ibi_out = _np.diff(idx_out)
-        ibi_out = _np.r_[signal.get_values()[0], ibi_out / fsamp]
-
-        return _UnevenlySignal(ibi_out, sampling_freq=signal.get_sampling_freq(), signal_type="IBI",
+        idx_1 = cls._derivative_pass(idx_ibi, ibi_expected, cache, sensitivity)
+
+        # BACKWARD, on the reversed beats
+        idx_2 = cls._derivative_pass(idx_ibi[-1] - idx_ibi[::-1], ibi_expected, cache, sensitivity)
+        idx_2 = idx_ibi[-1] - idx_2[::-1]
+
+        pairs = cls._pair(idx_1, idx_2, b * fsamp)
+        idx_out = cls._optimize(pairs) + idx_st
+        ibi_out = _np.r_[signal.get_values()[0], _np.diff(idx_out) / fsamp]
+
+        return _UnevenlySignal(ibi_out, sampling_freq=fsamp, signal_type="IBI",
                                start_time=signal.get_start_time(), x_values=idx_out, x_type='indices',
                                duration=signal.get_duration())
 
@@ -1140,6 +1250,18 @@ class OptimizeBateman(_Tool):
         Number of steps in the grid search (paramter t1)
     n_step_2 : int
         Number of steps in the grid search (parameter t2)
+    n_refine : int, >=0, default = 0
+        Number of local refinements of the grid search: each one evaluates a grid of the same size in the cells
+        around the best point only (one step of the previous grid on each side), and stops early if the loss does
+        not improve. It is a local search: the cells are not pruned by a lower bound of the loss (no such bound is
+        available for the Bateman loss), so a better minimum in a region that the coarse grid undersampled can be
+        missed
+    n_jobs : int, default = 1
+        Number of processes evaluating the grid points (-1 for one per CPU). The signal is shared with the processes
+    batch_drivers : boolean, default = False
+        Whether to estimate the drivers of the grid points in batches reusing the FFT of the signal (see
+        DriverEstim.batch): faster, but the drivers differ slightly from DriverEstim, so the best point can differ
+        when the losses of two points are close. The loss returned is the one of DriverEstim at the best point
     weight : str
         How the errors should be weighted before computing the loss function. ['exp', 'lin', 'none']
     min_pars : dict
@@ -1154,7 +1276,7 @@ class OptimizeBateman(_Tool):
 
     # TODO (Feature): add **kwargs parameters for internal minimization
     def __init__(self, delta, loss_func='all', opt_method='bsh', complete=False, par_ranges=None,
-                 maxiter=99999, n_step_1=10, n_step_2=10, **kwargs):
+                 maxiter=99999, n_step_1=10, n_step_2=10, n_refine=0, n_jobs=1, batch_drivers=False, **kwargs):
         if par_ranges is None:
             par_ranges = [0.1, 0.99, 1.5, 10]
         assert delta > 0
@@ -1166,10 +1288,12 @@ class OptimizeBateman(_Tool):
         if opt_method == "grid":
             assert n_step_1 > 0
             assert n_step_2 > 0
+            assert n_refine >= 0
+            assert n_jobs == -1 or n_jobs > 0
 
         _Tool.__init__(self, delta=delta, loss_func=loss_func, opt_method=opt_method, complete=complete,
                        par_ranges=par_ranges, maxiter=maxiter, n_step_1=n_step_1, n_step_2=n_step_2,
-                       **kwargs)
+                       n_refine=n_refine, n_jobs=n_jobs, batch_drivers=batch_drivers, **kwargs)
 
     @classmethod
     def algorithm(cls, signal, params):
@@ -1197,11 +1321,21 @@ class OptimizeBateman(_Tool):
             step_T1 = (max_T1 - min_T1) / n_step_1
             step_T2 = (max_T2 - min_T2) / n_step_2
             rranges = (slice(min_T1, max_T1 + step_T1, step_T1), slice(min_T2, max_T2 + step_T2, step_T2))
-            x0, loss, grid, loss_grid = _opt.brute(loss_function, rranges,
-                                                   args=(signal, delta),
-                                                   full_output=True, finish=None)
+            x0, loss = cls._grid(rranges, signal, delta, params)
             exit_code = -1
 
+            for i_refine in range(params['n_refine']):
+                # finer grid in the cells around the best point
+                min_T1, max_T1 = max(x0[0] - step_T1, par_ranges[0]), min(x0[0] + step_T1, par_ranges[1])
+                min_T2, max_T2 = max(x0[1] - step_T2, par_ranges[2]), min(x0[1] + step_T2, par_ranges[3])
+                step_T1 = (max_T1 - min_T1) / n_step_1
+                step_T2 = (max_T2 - min_T2) / n_step_2
+                rranges = (slice(min_T1, max_T1 + step_T1 / 2, step_T1), slice(min_T2, max_T2 + step_T2 / 2, step_T2))
+                x0_fine, loss_fine = cls._grid(rranges, signal, delta, params)
+                if not loss_fine < loss:
+                    break
+                x0, loss = x0_fine, loss_fine
+
         elif opt_method == 'bsh':
             x_opt = _opt.basinhopping(loss_function, [0.75, 2.],
                                       niter=maxiter,
@@ -1230,8 +1364,52 @@ class OptimizeBateman(_Tool):
             return x0, loss, exit_code
 
 
+    @classmethod
+    def _grid(cls, rranges, signal, delta, params):
+        # evaluates the loss on the grid as scipy.optimize.brute, on a process pool if n_jobs != 1
+        from ..execution import map_batches as _map_batches
+
+        grid = _np.mgrid[rranges]
+        points = grid.reshape(len(rranges), -1).T
+        n_jobs = params['n_jobs']
+        batch_drivers = params['batch_drivers']
+        if n_jobs == 1:
+            losses = cls._grid_losses(signal, points, params['loss_func'], delta, batch_drivers)
+        else:
+            n_batches = min(len(points), 4 * (_os.cpu_count() if n_jobs == -1 else n_jobs))
+            batches = _np.array_split(points, n_batches)
+            losses = _np.concatenate(_map_batches(cls._grid_losses, signal, batches,
+                                                  (params['loss_func'], delta, batch_drivers), n_jobs))
+        i_best = _np.argmin(losses)
+        if batch_drivers:
+            # the loss of the driver of DriverEstim, as the other methods
+            return points[i_best], cls._grid_losses(signal, points[i_best:i_best + 1], params['loss_func'], delta)[0]
+        return points[i_best], losses[i_best]
+
+    @staticmethod
+    def _grid_losses(signal, points, loss_func, delta, batch_drivers=False):
+        from ..execution import open_signal as _open_signal
+        from ..estimators.Estimators import DriverEstim as _DriverEstim
+
+        signal = _open_signal(signal)
+        if loss_func == 'ben':
+            loss_function = OptimizeBateman._loss_benedek
+        else:
+            loss_function = OptimizeBateman._loss_function_all
+
+        if not batch_drivers:
+            return _np.array([loss_function(point, signal, delta) for point in points], dtype=float)
+
+        losses = []
+        for i_batch in range(0, len(points), 16):
+            # the drivers of a batch of points, reusing the FFT of the signal
+            batch = points[i_batch:i_batch + 16]
+            drivers = _DriverEstim.batch(signal, batch)
+            losses.extend(loss_function(point, signal, delta, drivers.get_channel(i)) for i, point in enumerate(batch))
+        return _np.array(losses, dtype=float)
+
     @staticmethod
-    def _loss_function_all(par_bat, signal, delta):
+    def _loss_function_all(par_bat, signal, delta, driver=None):
         """
         Computes the loss for optimization of Bateman parameters.
 
@@ -1243,6 +1421,8 @@ class OptimizeBateman(_Tool):
             The EDA signal
         delta : float
             Minimum amplitude of the peaks in the driver
+        driver : EvenlySignal
+            The driver of the signal for par_bat, if already estimated (see DriverEstim.batch)
        
         Returns
         -------
@@ -1262,7 +1442,8 @@ class OptimizeBateman(_Tool):
 
         fsamp = signal.get_sampling_freq()
 
-        driver = _DriverEstim(t1=par_bat[0], t2=par_bat[1])(signal)
+        if driver is None:
+            driver = _DriverEstim(t1=par_bat[0], t2=par_bat[1])(signal)
         maxp, minp, ignored, ignored = PeakDetection(delta=delta, start_max=True)(driver.segment_time(driver.get_start_time(), driver.get_end_time() - REC_TIME ))
         
         if len(maxp) == 0:
@@ -1312,7 +1493,7 @@ class OptimizeBateman(_Tool):
             return energy
 
     @staticmethod
-    def _loss_benedek(par_bat, signal, delta):
+    def _loss_benedek(par_bat, signal, delta, driver=None):
         """
         Computes the loss for optimization of Bateman parameters according to Benedek2010 (REF).
         #TODO: insert reference
@@ -1325,6 +1506,8 @@ class OptimizeBateman(_Tool):
             The EDA signal
         delta : float
             Minimum amplitude of the peaks in the driver
+        driver : EvenlySignal
+            The driver of the signal for par_bat, if already estimated (see DriverEstim.batch)
        
         Returns
         -------
@@ -1404,7 +1587,7 @@ class OptimizeBateman(_Tool):
             if idx_grid[-1] != len(driver) - 1:
                 idx_grid = _np.r_[idx_grid, len(driver) - 1]
 
-            driver_grid = _UnevenlySignal(driver[idx_grid], fsamp, "dEDA", driver.get_start_time(), x_values=idx_grid,
+            driver_grid = _UnevenlySignal(driver[idx_grid], fsamp, driver.get_start_time(), "dEDA", x_values=idx_grid,
                                           x_type='indices', duration=signal.get_duration())
             if len(idx_grid) >= 4:
                 tonic = driver_grid.to_evenly(kind='cubic')
@@ -1414,7 +1597,8 @@ class OptimizeBateman(_Tool):
             return phasic
 
         ALPHA = 6
-        driver = _DriverEstim(t1=par_bat[0], t2=par_bat[1])(signal)
+        if driver is None:
+            driver = _DriverEstim(t1=par_bat[0], t2=par_bat[1])(signal)
 
         phasic = phasic_estim_benedek(driver, delta)
 